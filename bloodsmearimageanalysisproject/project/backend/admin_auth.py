@@ -0,0 +1,25 @@
+"""
+Shared guard for admin-only endpoints.
+
+Admin routes are disabled unless ADMIN_TOKEN is set; callers must send the
+same value in the X-Admin-Token header.
+"""
+import hmac
+import os
+from functools import wraps
+
+from flask import jsonify, request
+
+
+def require_admin(view):
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        token = os.getenv('ADMIN_TOKEN')
+        if not token:
+            return jsonify({'error': 'Admin endpoints are disabled (ADMIN_TOKEN not set)'}), 403
+        # Bytes: compare_digest raises TypeError on str with non-ASCII characters
+        sent = request.headers.get('X-Admin-Token', '').encode('utf-8', 'surrogateescape')
+        if not hmac.compare_digest(sent, token.encode('utf-8', 'surrogateescape')):
+            return jsonify({'error': 'Invalid admin token'}), 401
+        return view(*args, **kwargs)
+    return wrapper
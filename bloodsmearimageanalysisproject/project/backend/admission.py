@@ -0,0 +1,203 @@
+"""
+Admission control for /api/analyze.
+
+Requests wait in a priority queue for one of a fixed number of inference
+slots. Interactive uploads are served before live auto-capture frames, each
+user may only have a few requests queued or running at once, and live frames
+are dropped when they wait past their deadline or a newer frame from the
+same user arrives. Background async jobs carry no deadline and are never
+dropped that way. Rejections raise AdmissionRejected, which the handler
+turns into a 429 with Retry-After.
+
+Environment:
+    INFERENCE_SLOTS          concurrent inferences, default 1
+    MAX_REQUESTS_PER_USER    queued + running requests per user, default 2
+    MAX_QUEUED_REQUESTS      total waiting requests, default 32
+    LIVE_FRAME_DEADLINE      seconds a live frame may wait, default 3
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+from instrumentation import REGISTRY
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: 'interactive', BACKGROUND: 'background'}
+
+# analysis_type values sent by the frontend
+BACKGROUND_TYPES = {'live_auto', 'auto_capture', 'background'}
+
+QUEUE_WAIT_SECONDS = REGISTRY.histogram(
+    'bloodsmear_admission_queue_wait_seconds', 'Time spent waiting for an inference slot', ('priority',))
+QUEUE_DEPTH = REGISTRY.gauge(
+    'bloodsmear_admission_queue_depth', 'Requests waiting for an inference slot', ('priority',))
+ACTIVE = REGISTRY.gauge(
+    'bloodsmear_admission_active', 'Requests holding an inference slot')
+REJECTED = REGISTRY.counter(
+    'bloodsmear_admission_rejected_total', 'Requests refused or dropped by admission control', ('reason',))
+
+
+class AdmissionRejected(Exception):
+    def __init__(self, reason, message, retry_after=1):
+        super().__init__(message)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    def to_dict(self):
+        return {'error': str(self), 'reason': self.reason, 'retry_after': self.retry_after}
+
+
+class _Ticket:
+    __slots__ = ('user_id', 'priority', 'deadline', 'enqueued', 'started', 'cancelled')
+
+    def __init__(self, user_id, priority, deadline):
+        self.user_id = user_id
+        self.priority = priority
+        self.deadline = deadline
+        self.enqueued = time.monotonic()
+        self.started = None
+        self.cancelled = None
+
+
+def classify(data):
+    """(priority, deadline seconds or None) from an analyze request body"""
+    priority = data.get('priority')
+    analysis_type = data.get('analysis_type', 'upload')
+    if priority == 'background' or (priority is None and analysis_type in BACKGROUND_TYPES):
+        return BACKGROUND, float(os.getenv('LIVE_FRAME_DEADLINE', '3'))
+    return INTERACTIVE, None
+
+
+class AdmissionController:
+    def __init__(self, slots=None, per_user_limit=None, max_queue=None):
+        self.slots = slots or int(os.getenv('INFERENCE_SLOTS', '1'))
+        self.per_user_limit = per_user_limit or int(os.getenv('MAX_REQUESTS_PER_USER', '2'))
+        self.max_queue = max_queue or int(os.getenv('MAX_QUEUED_REQUESTS', '32'))
+        self._cond = threading.Condition()
+        self._heap = []
+        self._seq = itertools.count()
+        self._active = 0
+        self._per_user = {}
+        self._avg_service = 1.0
+
+        for priority, name in PRIORITY_NAMES.items():
+            QUEUE_DEPTH.set_function(lambda p=priority: self._queued(p), priority=name)
+        ACTIVE.set_function(lambda: self._active)
+
+    def _queued(self, priority):
+        with self._cond:
+            return sum(1 for _, _, t in self._heap if t.priority == priority and not t.cancelled)
+
+    def _retry_after(self):
+        waiting = sum(1 for _, _, t in self._heap if not t.cancelled) + self._active
+        return max(1, int(self._avg_service * waiting / self.slots + 0.999))
+
+    def _reject(self, reason, message):
+        REJECTED.inc(reason=reason)
+        raise AdmissionRejected(reason, message, self._retry_after())
+
+    def _head(self):
+        while self._heap and self._heap[0][2].cancelled:
+            heapq.heappop(self._heap)
+        return self._heap[0][2] if self._heap else None
+
+    def _enqueue(self, user_id, priority, deadline):
+        superseded = []
+        if priority == BACKGROUND and deadline is not None:
+            # A newer live frame makes any still-queued frame from the same user stale.
+            # Only live frames (they carry a deadline): a queued background job must still run.
+            superseded = [queued for _, _, queued in self._heap
+                          if queued.user_id == user_id and queued.priority == BACKGROUND
+                          and queued.deadline is not None and not queued.cancelled]
+
+        # Limits count the frames about to be superseded as gone, but nothing is cancelled
+        # until the new frame is certain to be queued, so a rejection never loses both
+        if self._per_user.get(user_id, 0) - len(superseded) >= self.per_user_limit:
+            self._reject('user_limit', 'Too many analyses in progress for this user')
+        if sum(1 for _, _, t in self._heap if not t.cancelled) - len(superseded) >= self.max_queue:
+            self._reject('queue_full', 'Analysis queue is full, retry shortly')
+
+        for queued in superseded:
+            queued.cancelled = 'superseded'
+            self._release_user(user_id)
+        if superseded:
+            self._cond.notify_all()
+
+        ticket = _Ticket(user_id, priority, deadline)
+        heapq.heappush(self._heap, (priority, next(self._seq), ticket))
+        self._per_user[user_id] = self._per_user.get(user_id, 0) + 1
+        return ticket
+
+    def _release_user(self, user_id):
+        remaining = self._per_user.get(user_id, 1) - 1
+        if remaining:
+            self._per_user[user_id] = remaining
+        else:
+            self._per_user.pop(user_id, None)
+
+    def _wait_for_slot(self, ticket):
+        while True:
+            if ticket.cancelled:
+                # The superseding request already released this ticket's per-user slot
+                self._reject(ticket.cancelled, 'Live frame dropped: a newer frame is queued')
+
+            if self._active < self.slots and self._head() is ticket:
+                heapq.heappop(self._heap)
+                self._active += 1
+                if self._active < self.slots and self._head() is not None:
+                    # The next waiter may have checked while this ticket was still the head
+                    self._cond.notify_all()
+                return
+
+            timeout = None
+            if ticket.deadline is not None:
+                timeout = ticket.enqueued + ticket.deadline - time.monotonic()
+                if timeout <= 0:
+                    ticket.cancelled = 'stale'
+                    self._release_user(ticket.user_id)
+                    # Lets a waiter behind this ticket become the head and pop it
+                    self._cond.notify_all()
+                    self._reject('stale', 'Live frame dropped: waited past its deadline')
+            self._cond.wait(timeout)
+
+    def acquire(self, user_id, priority=INTERACTIVE, deadline=None):
+        """Block until an inference slot is free for this request, or raise AdmissionRejected"""
+        with self._cond:
+            ticket = self._enqueue(user_id or 'anonymous', priority, deadline)
+            self._wait_for_slot(ticket)
+        ticket.started = time.monotonic()
+        QUEUE_WAIT_SECONDS.observe(ticket.started - ticket.enqueued, priority=PRIORITY_NAMES[priority])
+        return ticket
+
+    def release(self, ticket):
+        with self._cond:
+            self._active -= 1
+            self._release_user(ticket.user_id)
+            self._avg_service = 0.9 * self._avg_service + 0.1 * (time.monotonic() - ticket.started)
+            self._cond.notify_all()
+
+    @contextmanager
+    def admit(self, user_id, priority=INTERACTIVE, deadline=None):
+        ticket = self.acquire(user_id, priority, deadline)
+        try:
+            yield
+        finally:
+            self.release(ticket)
+
+    def busy(self):
+        """True while any request is waiting for a slot"""
+        with self._cond:
+            return any(not t.cancelled for _, _, t in self._heap)
+
+    def snapshot(self):
+        with self._cond:
+            waiting = [t for _, _, t in self._heap if not t.cancelled]
+            return {
+                'slots': self.slots,
+                'active': self._active,
+                'queued': {name: sum(1 for t in waiting if t.priority == p) for p, name in PRIORITY_NAMES.items()}
+            }
@@ -0,0 +1,117 @@
+import torch
+from PIL import Image
+import base64
+import io
+import os
+import torchvision.transforms as transforms
+
+import inference_config
+from model_builder import IMAGENET_MEAN, IMAGENET_STD, IMAGE_SIZE, checkpoint_architecture, is_serving_artifact, load_model
+from model_optimization import optimize_for_inference
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def ensure_model_file(model_path):
+    """Return the absolute model path, downloading from MODEL_URL if the file is missing"""
+    full_model_path = model_path if os.path.isabs(model_path) else os.path.join(BASE_DIR, model_path)
+
+    if not os.path.exists(full_model_path):
+        print(f"Model not found at {full_model_path}")
+        # Try to download from Google Drive
+        model_url = os.getenv('MODEL_URL')
+        if model_url:
+            print(f"Downloading model from {model_url}")
+            os.makedirs(os.path.dirname(full_model_path), exist_ok=True)
+            import urllib.request
+            urllib.request.urlretrieve(model_url, full_model_path)
+            print("Model downloaded successfully")
+        else:
+            raise FileNotFoundError("Model file not found and MODEL_URL not set")
+    return full_model_path
+
+
+class BloodSmearAnalyzer:
+    def __init__(self, model_path='models/best_model.pth'):
+        self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+        # Thread counts from inference_config.json (autotune_threads.py), set before the first forward pass
+        inference_config.apply_torch_settings()
+
+        # Get absolute path to model file
+        if not os.path.isabs(model_path):
+            model_path = os.path.join(BASE_DIR, model_path)
+
+        # Training checkpoint (.pth) or serving artifact (.safetensors, see export_model.py)
+        self.model, checkpoint = load_model(model_path, self.device)
+        self.class_names = checkpoint['class_names']
+        self.architecture = checkpoint_architecture(checkpoint)
+
+        image_size = checkpoint.get('image_size', IMAGE_SIZE)
+
+        # Runtime pass (BN folding, dropout removal, channels_last) for .pth checkpoints.
+        # Serving artifacts are folded at export, and the pass would copy every weight of a
+        # memory-mapped artifact, losing its page-cache sharing across workers, so they skip it.
+        # MODEL_OPTIMIZE=on/off overrides either default.
+        self.optimization = None
+        self.memory_format = torch.contiguous_format
+        optimize = os.getenv('MODEL_OPTIMIZE', 'auto').lower()
+        if optimize == 'auto':
+            optimize = 'off' if is_serving_artifact(model_path) else 'on'
+        if optimize in ('1', 'on', 'true'):
+            self.model, self.optimization = optimize_for_inference(
+                self.model, compile_mode=os.getenv('MODEL_COMPILE', 'off'), image_size=image_size
+            )
+            self.memory_format = torch.channels_last
+
+        self.transform = transforms.Compose([
+            transforms.Resize((image_size, image_size)),
+            transforms.ToTensor(),
+            transforms.Normalize(mean=checkpoint.get('mean', IMAGENET_MEAN), std=checkpoint.get('std', IMAGENET_STD))
+        ])
+
+        print(f"Model loaded ({self.architecture}): {checkpoint['val_acc']:.2f}% accuracy")
+
+    def decode_base64(self, image_data):
+        """base64 string or data URL -> encoded image bytes"""
+        if ',' in image_data:
+            image_data = image_data.split(',')[1]
+        return base64.b64decode(image_data)
+
+    def open_image(self, image_bytes):
+        """Encoded image bytes -> RGB PIL image"""
+        return Image.open(io.BytesIO(image_bytes)).convert('RGB')
+
+    def preprocess(self, image):
+        return self.transform(image)
+
+    def infer(self, inputs):
+        """Batch of preprocessed tensors -> class probabilities on CPU"""
+        with torch.no_grad():
+            outputs = self.model(inputs.to(self.device, memory_format=self.memory_format))
+            return torch.nn.functional.softmax(outputs, dim=1).cpu()
+
+    def format_result(self, probabilities):
+        confidence, predicted_idx = torch.max(probabilities, 0)
+        all_probs = probabilities.numpy()
+        predictions = [
+            {'disease': self.class_names[i], 'confidence': float(all_probs[i])}
+            for i in range(len(self.class_names))
+        ]
+        predictions.sort(key=lambda x: x['confidence'], reverse=True)
+
+        return {
+            'predicted_class': self.class_names[predicted_idx.item()],
+            'confidence': confidence.item(),
+            'all_predictions': predictions,
+            'status': 'success'
+        }
+
+    def predict(self, image_data):
+        try:
+            image = self.open_image(self.decode_base64(image_data))
+            inputs = self.preprocess(image).unsqueeze(0)
+            probabilities = self.infer(inputs)
+            return self.format_result(probabilities[0])
+
+        except Exception as e:
+            return {'error': str(e), 'status': 'error'}
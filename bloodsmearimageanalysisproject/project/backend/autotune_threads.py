@@ -0,0 +1,182 @@
+"""
+Autotune CPU thread counts, worker processes and batch size for inference.
+
+Sweeps (workers x intra-op threads x inter-op threads x batch size) on this
+machine with the served model. Each configuration starts that many worker
+processes, like gunicorn workers, and pins their torch thread counts. Every
+worker runs back-to-back forward passes for --duration seconds, all starting
+together, so workers compete for cores as they would in production. One
+inference at a time per worker matches the server (INFERENCE_SLOTS=1).
+
+The server scores one image per request, so only batch-size-1 runs are
+eligible. The one with the highest throughput whose p95 latency stays under
+--max-latency-ms is written to inference_config.json. gunicorn.conf.py and the
+analyzer read it at startup, and /api/health reports it. Larger --batch-sizes
+are measured and printed for offline tools (batch_analyze.py) only.
+
+Usage:
+    python autotune_threads.py                                 # models/best_model.pth
+    python autotune_threads.py --max-latency-ms 300 --duration 10
+    python autotune_threads.py --random-weights --workers 1 2 --dry-run
+    python autotune_threads.py --batch-sizes 1 8 32                  # also measure offline batch sizes
+"""
+import argparse
+import itertools
+import json
+import multiprocessing as mp
+import os
+import platform
+import time
+
+import numpy as np
+
+from inference_config import CONFIG_PATH
+
+
+def available_cores():
+    # Respects container CPU affinity, unlike os.cpu_count()
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _worker(model_path, intra, interop, batch_size, duration, barrier, results):
+    # Environment overrides win over any existing inference_config.json
+    os.environ['TORCH_NUM_THREADS'] = str(intra)
+    os.environ['TORCH_INTEROP_THREADS'] = str(interop)
+    import torch
+    from analyzer import BloodSmearAnalyzer
+
+    analyzer = BloodSmearAnalyzer(model_path)
+    size = analyzer.transform.transforms[0].size[0]
+    inputs = torch.randn(batch_size, 3, size, size)
+    for _ in range(3):
+        analyzer.infer(inputs)
+
+    barrier.wait()
+    latencies = []
+    start = time.perf_counter()
+    while time.perf_counter() - start < duration:
+        batch_start = time.perf_counter()
+        analyzer.infer(inputs)
+        latencies.append(time.perf_counter() - batch_start)
+    results.put(latencies)
+
+
+def measure(model_path, workers, intra, interop, batch_size, duration):
+    context = mp.get_context('spawn')
+    barrier = context.Barrier(workers)
+    results = context.Queue()
+    processes = [
+        context.Process(target=_worker, args=(model_path, intra, interop, batch_size, duration, barrier, results))
+        for _ in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    latencies = [results.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    batches = sum(len(worker) for worker in latencies)
+    all_ms = np.asarray([s for worker in latencies for s in worker]) * 1000
+    return {
+        'workers': workers,
+        'intra_op_threads': intra,
+        'interop_threads': interop,
+        'batch_size': batch_size,
+        'images_per_second': batches * batch_size / duration,
+        'latency_p50_ms': float(np.percentile(all_ms, 50)),
+        'latency_p95_ms': float(np.percentile(all_ms, 95)),
+    }
+
+
+def sweep_grid(args, cores):
+    grid = []
+    for workers, intra, interop, batch_size in itertools.product(
+            args.workers, args.intra_op_threads, args.interop_threads, args.batch_sizes):
+        # More busy threads than cores only measures contention
+        if workers * intra > cores and not args.allow_oversubscription:
+            continue
+        grid.append((workers, intra, interop, batch_size))
+    return grid
+
+
+def run(args):
+    cores = available_cores()
+    if args.random_weights:
+        from benchmark_inference import random_weight_checkpoint
+        model_path = random_weight_checkpoint()
+    else:
+        model_path = args.model
+
+    args.workers = args.workers or [w for w in (1, 2, 4, 8) if w <= cores]
+    args.intra_op_threads = args.intra_op_threads or sorted({t for t in (1, 2, 4, cores) if t <= cores})
+    grid = sweep_grid(args, cores)
+    print(f"{cores} cores available; {len(grid)} configurations, {args.duration:.0f}s each")
+
+    rows = []
+    print(f"{'Workers':>7} {'Intra':>5} {'Inter':>5} {'Batch':>5} {'img/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for config in grid:
+        row = measure(model_path, *config, args.duration)
+        rows.append(row)
+        print(f"{row['workers']:>7} {row['intra_op_threads']:>5} {row['interop_threads']:>5} "
+              f"{row['batch_size']:>5} {row['images_per_second']:8.1f} "
+              f"{row['latency_p50_ms']:8.1f} {row['latency_p95_ms']:8.1f}")
+
+    for batch_size in sorted({row['batch_size'] for row in rows} - {1}):
+        fastest = max((row for row in rows if row['batch_size'] == batch_size), key=lambda row: row['images_per_second'])
+        print(f"Offline batch {batch_size}: best {fastest['workers']} workers x {fastest['intra_op_threads']} threads, "
+              f"{fastest['images_per_second']:.1f} img/s (not used by the server)")
+
+    eligible = [row for row in rows if row['batch_size'] == 1 and row['latency_p95_ms'] <= args.max_latency_ms]
+    if not eligible:
+        raise SystemExit(f"No batch-size-1 configuration kept p95 latency under {args.max_latency_ms}ms")
+    best = max(eligible, key=lambda row: row['images_per_second'])
+    print(f"\nBest under {args.max_latency_ms}ms p95: {best['workers']} workers x "
+          f"{best['intra_op_threads']} threads (inter-op {best['interop_threads']}): "
+          f"{best['images_per_second']:.1f} img/s, p95 {best['latency_p95_ms']:.1f}ms")
+
+    import torch
+    config = {
+        'intra_op_threads': best['intra_op_threads'],
+        'interop_threads': best['interop_threads'],
+        'workers': best['workers'],
+        'threads': args.gunicorn_threads,
+        'measured': best,
+        'max_latency_ms': args.max_latency_ms,
+        'machine': {
+            'cores': cores,
+            'processor': platform.processor() or platform.machine(),
+            'torch': torch.__version__,
+        },
+        'model': 'random' if args.random_weights else args.model,
+        'created_at': time.time(),
+        'sweep': rows,
+    }
+    if args.dry_run:
+        return config
+    with open(args.output, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"Saved {args.output}; restart the server to apply it")
+    return config
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sweep inference thread/worker/batch settings on this machine')
+    parser.add_argument('--model', default='models/best_model.pth')
+    parser.add_argument('--random-weights', action='store_true', help='Use an untrained model')
+    parser.add_argument('--workers', type=int, nargs='+', help='Worker counts (default: 1 2 4 8 up to the core count)')
+    parser.add_argument('--intra-op-threads', type=int, nargs='+', help='Default: 1 2 4 and the core count')
+    parser.add_argument('--interop-threads', type=int, nargs='+', default=[1, 2])
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1],
+                        help='Batch sizes to measure; only 1 is eligible for the server config')
+    parser.add_argument('--duration', type=float, default=5.0, help='Seconds measured per configuration')
+    parser.add_argument('--max-latency-ms', type=float, default=500.0, help='p95 latency bound per batch')
+    parser.add_argument('--gunicorn-threads', type=int, default=4,
+                        help='Request threads per worker written to the config (not swept)')
+    parser.add_argument('--allow-oversubscription', action='store_true',
+                        help='Also try workers x threads above the core count')
+    parser.add_argument('-o', '--output', default=CONFIG_PATH)
+    parser.add_argument('--dry-run', action='store_true', help='Print the result without writing the config')
+    run(parser.parse_args())
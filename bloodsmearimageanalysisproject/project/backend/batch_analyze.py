@@ -0,0 +1,310 @@
+"""
+Offline batch analysis of image folders.
+
+Walks a directory tree (or reads a manifest listing one image path per line),
+decodes and preprocesses images in a pool of worker processes, and runs the
+model on batches of tensors in this process. Results stream to CSV, NDJSON or
+Parquet as each batch finishes:
+
+    path, sha1, predicted_class, confidence, p_<class> per class, model, analyzed_at, error, duplicate_of
+
+Runs are resumable. Paths that already have a successful row in the output
+are skipped, so an interrupted overnight run picks up where it stopped.
+Renamed or copied files, within a run or across runs, are scored once: every
+further path with the same SHA-1 (taken before decoding) gets a row whose
+`duplicate_of` names the path that holds the prediction. Parquet output is a
+directory with one part file per run and needs pyarrow (requirements-tools.txt).
+
+Usage:
+    python batch_analyze.py /data/slides -o results.csv
+    python batch_analyze.py /data/slides -o results_parquet --format parquet --batch-size 64
+    python batch_analyze.py --manifest archive.txt -o results.ndjson --decode-workers 8
+"""
+import argparse
+import collections
+import csv
+import hashlib
+import importlib.util
+import io
+import json
+import multiprocessing as mp
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import numpy as np
+from PIL import Image
+from tqdm import tqdm
+
+FORMATS = ('csv', 'ndjson', 'parquet')
+BASE_COLUMNS = ['path', 'sha1', 'predicted_class', 'confidence']
+TAIL_COLUMNS = ['model', 'analyzed_at', 'error', 'duplicate_of']
+# As dataset_manifest.IMG_EXTENSIONS; importing that module would load torchvision datasets in every worker
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+
+# Set in each decode worker by _init_worker
+_transform = None
+_done = frozenset()
+
+
+def find_images(root):
+    for dirpath, _, fnames in sorted(os.walk(root, followlinks=True)):
+        for fname in sorted(fnames):
+            if fname.lower().endswith(IMG_EXTENSIONS):
+                yield os.path.join(dirpath, fname)
+
+
+def read_manifest(path):
+    """One image path per line (relative paths are relative to the manifest); '#' starts a comment"""
+    base = os.path.dirname(os.path.abspath(path))
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if line and not line.startswith('#'):
+                yield line if os.path.isabs(line) else os.path.join(base, line)
+
+
+def _init_worker(transform, done):
+    global _transform, _done
+    _transform, _done = transform, done
+
+
+def _load(path):
+    """(path, sha1, preprocessed array or None, error or 'skip')"""
+    try:
+        with open(path, 'rb') as f:
+            data = f.read()
+    except OSError as e:
+        return path, None, None, f'read failed: {e}'
+    sha1 = hashlib.sha1(data).hexdigest()
+    if sha1 in _done:
+        return path, sha1, None, 'skip'
+    try:
+        image = Image.open(io.BytesIO(data)).convert('RGB')
+        return path, sha1, _transform(image).numpy(), None
+    except Exception as e:
+        return path, sha1, None, f'decode failed: {e}'
+
+
+class ResultWriter:
+    def __init__(self, path, fmt, columns):
+        self.path = path
+        self.format = fmt
+        self.columns = columns
+        self._file = None
+        self._writer = None
+
+    def _existing_rows(self):
+        if self.format == 'parquet':
+            if os.path.isdir(self.path):
+                import pyarrow.parquet as pq
+                for name in sorted(os.listdir(self.path)):
+                    if name.endswith('.parquet'):
+                        part = os.path.join(self.path, name)
+                        # Parts written before duplicate_of existed lack that column
+                        names = pq.ParquetFile(part).schema_arrow.names
+                        columns = [c for c in ('path', 'sha1', 'error', 'duplicate_of') if c in names]
+                        table = pq.read_table(part, columns=columns).to_pylist()
+                        yield from table
+        elif os.path.exists(self.path):
+            with open(self.path, newline='') as f:
+                rows = csv.DictReader(f) if self.format == 'csv' else (json.loads(line) for line in f if line.strip())
+                yield from rows
+
+    def done(self):
+        """({sha1: path holding its prediction}, paths with a successful row) from existing output"""
+        hashes, paths = {}, set()
+        for row in self._existing_rows():
+            if not row.get('sha1') or row.get('error'):
+                continue
+            paths.add(row['path'])
+            if not row.get('duplicate_of'):
+                hashes.setdefault(row['sha1'], row['path'])
+        return hashes, paths
+
+    def write(self, rows):
+        if not rows:
+            return
+        if self.format == 'parquet':
+            self._write_parquet(rows)
+            return
+        if self._file is None:
+            new_file = not os.path.exists(self.path) or os.path.getsize(self.path) == 0
+            self._file = open(self.path, 'a', newline='')
+            if self.format == 'csv':
+                fieldnames = self.columns
+                if not new_file:
+                    # Appending keeps the file's own header, also when it predates a column
+                    with open(self.path, newline='') as f:
+                        fieldnames = next(csv.reader(f))
+                self._writer = csv.DictWriter(self._file, fieldnames=fieldnames, extrasaction='ignore')
+                if new_file:
+                    self._writer.writeheader()
+        if self.format == 'csv':
+            self._writer.writerows(rows)
+        else:
+            self._file.writelines(json.dumps(row) + '\n' for row in rows)
+        self._file.flush()
+
+    def _write_parquet(self, rows):
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.Table.from_pylist(rows, schema=self._schema(pa))
+        if self._writer is None:
+            os.makedirs(self.path, exist_ok=True)
+            part = os.path.join(self.path, f"part-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.parquet")
+            self._writer = pq.ParquetWriter(part, table.schema)
+        self._writer.write_table(table)
+
+    def _schema(self, pa):
+        types = {'confidence': pa.float64()}
+        return pa.schema([
+            (name, types.get(name, pa.float64() if name.startswith('p_') else pa.string()))
+            for name in self.columns
+        ])
+
+    def close(self):
+        if self.format == 'parquet' and self._writer is not None:
+            self._writer.close()
+        if self._file is not None:
+            self._file.close()
+
+
+def output_path(path, root):
+    return os.path.relpath(path, root) if root else path
+
+
+def result_rows(analyzer, batch, probabilities, model_name, root):
+    rows = []
+    analyzed_at = datetime.utcnow().isoformat()
+    for (path, sha1), probs in zip(batch, probabilities.tolist()):
+        best = max(range(len(probs)), key=probs.__getitem__)
+        row = {
+            'path': output_path(path, root),
+            'sha1': sha1,
+            'predicted_class': analyzer.class_names[best],
+            'confidence': probs[best],
+        }
+        row.update({f'p_{name}': p for name, p in zip(analyzer.class_names, probs)})
+        row.update({'model': model_name, 'analyzed_at': analyzed_at, 'error': '', 'duplicate_of': ''})
+        rows.append(row)
+    return rows
+
+
+def error_row(path, sha1, error, columns, model_name, root):
+    row = dict.fromkeys(columns)
+    row.update({'path': output_path(path, root), 'sha1': sha1, 'model': model_name,
+                'analyzed_at': datetime.utcnow().isoformat(), 'error': error, 'duplicate_of': ''})
+    return row
+
+
+def duplicate_row(path, sha1, original, columns, model_name, root):
+    """Row for a file whose content was already scored under the path `original`"""
+    row = error_row(path, sha1, '', columns, model_name, root)
+    row['duplicate_of'] = original
+    return row
+
+
+def run(args):
+    # Imported here rather than at the top: spawned decode workers re-import this module
+    # and only need the transform they are given, not the model code
+    import torch
+    from analyzer import BloodSmearAnalyzer
+
+    fmt = args.format or os.path.splitext(args.output)[1].lstrip('.').replace('jsonl', 'ndjson')
+    if fmt not in FORMATS:
+        raise SystemExit(f"Unknown output format {fmt!r}; use --format {'/'.join(FORMATS)}")
+    if fmt == 'parquet':
+        if importlib.util.find_spec('pyarrow') is None:
+            raise SystemExit('Parquet output needs pyarrow: pip install pyarrow')
+
+    analyzer = BloodSmearAnalyzer(args.model)
+    model_name = os.path.basename(args.model)
+    columns = BASE_COLUMNS + [f'p_{name}' for name in analyzer.class_names] + TAIL_COLUMNS
+
+    root = os.path.abspath(args.root) if args.root else None
+    paths = list(read_manifest(args.manifest) if args.manifest else find_images(root))
+    writer = ResultWriter(args.output, fmt, columns)
+    done, done_paths = writer.done()
+    print(f"{len(paths)} images, {len(done_paths)} already in {args.output}")
+
+    stats = collections.Counter()
+    inference_seconds = 0.0
+    start = time.perf_counter()
+    batch, arrays = [], []
+    # Hash -> first path queued for inference in this run; `done` only covers earlier runs
+    seen = {}
+
+    def flush():
+        nonlocal inference_seconds
+        if not batch:
+            return
+        infer_start = time.perf_counter()
+        probabilities = analyzer.infer(torch.from_numpy(np.stack(arrays)))
+        inference_seconds += time.perf_counter() - infer_start
+        writer.write(result_rows(analyzer, batch, probabilities, model_name, root))
+        stats['scored'] += len(batch)
+        batch.clear()
+        arrays.clear()
+
+    def handle(loaded):
+        path, sha1, array, error = loaded
+        original = done.get(sha1) if error == 'skip' else seen.get(sha1) if error is None else None
+        if output_path(path, root) in done_paths:
+            stats['skipped'] += 1
+        elif original is not None:
+            stats['duplicates'] += 1
+            writer.write([duplicate_row(path, sha1, original, columns, model_name, root)])
+        elif error:
+            stats['errors'] += 1
+            writer.write([error_row(path, sha1, error, columns, model_name, root)])
+        else:
+            seen[sha1] = output_path(path, root)
+            batch.append((path, sha1))
+            arrays.append(array)
+            if len(batch) >= args.batch_size:
+                flush()
+        progress.update(1)
+        progress.set_postfix(scored=stats['scored'], duplicates=stats['duplicates'], skipped=stats['skipped'],
+                             errors=stats['errors'],
+                             img_s=f"{stats['scored'] / (time.perf_counter() - start):.1f}", refresh=False)
+
+    # Spawned workers: forking after torch has started its thread pools is unsafe
+    context = mp.get_context('spawn')
+    window = args.decode_workers * args.batch_size * 2
+    with ProcessPoolExecutor(args.decode_workers, mp_context=context, initializer=_init_worker,
+                             initargs=(analyzer.transform, frozenset(done))) as pool, \
+            tqdm(total=len(paths), unit='img') as progress:
+        # A bounded number of decodes in flight, consumed in submission order
+        pending = collections.deque()
+        for path in paths:
+            pending.append(pool.submit(_load, path))
+            while len(pending) >= window:
+                handle(pending.popleft().result())
+        while pending:
+            handle(pending.popleft().result())
+        flush()
+    writer.close()
+
+    elapsed = time.perf_counter() - start
+    print(f"Scored {stats['scored']}, {stats['duplicates']} duplicates of scored files, "
+          f"skipped {stats['skipped']} already in the output, {stats['errors']} errors in {elapsed:.1f}s")
+    if stats['scored']:
+        print(f"Throughput: {stats['scored'] / elapsed:.1f} img/s overall, "
+              f"{stats['scored'] / inference_seconds:.1f} img/s inference only (batch {args.batch_size})")
+    return stats
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Analyze a directory of blood smear images in batches')
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('root', nargs='?', help='Directory to walk recursively')
+    source.add_argument('--manifest', help='Text file listing one image path per line')
+    parser.add_argument('-o', '--output', required=True, help='results.csv, results.ndjson or a Parquet directory')
+    parser.add_argument('--format', choices=FORMATS, help='Default: from the output extension')
+    parser.add_argument('--model', default=os.getenv('MODEL_PATH', 'models/best_model.pth'))
+    parser.add_argument('--batch-size', type=int, default=32)
+    parser.add_argument('--decode-workers', type=int, default=max(1, (os.cpu_count() or 2) - 1))
+    run(parser.parse_args())
@@ -0,0 +1,278 @@
+"""
+End-to-end inference benchmark for BloodSmearAnalyzer.
+
+Times each stage of the analyze path separately (base64 decode, PIL decode,
+preprocessing, forward pass, JSON serialization) on synthetic smear-like
+images at several resolutions, plus forward-pass scaling across batch sizes.
+Results are written to benchmarks/results/ and compared against
+benchmarks/baseline.json; any tracked metric that regresses by more than the
+tolerance makes the script exit with status 1.
+
+Usage:
+    python benchmark_inference.py                      # use models/best_model.pth
+    python benchmark_inference.py --random-weights     # no checkpoint needed
+    python benchmark_inference.py --update-baseline
+
+Peak RSS uses the `resource` module; on Windows it needs psutil
+(requirements-tools.txt).
+"""
+import argparse
+import base64
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+import numpy as np
+import torch
+from PIL import Image
+
+from analyzer import BloodSmearAnalyzer
+from model_builder import DEFAULT_ARCHITECTURE, build_model
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+BENCHMARK_DIR = os.path.join(BASE_DIR, 'benchmarks')
+BASELINE_PATH = os.path.join(BENCHMARK_DIR, 'baseline.json')
+
+RESOLUTIONS = [(224, 224), (640, 480), (1280, 960), (1920, 1080)]
+BATCH_SIZES = [1, 2, 4, 8, 16, 32]
+STAGES = ['base64_decode', 'pil_decode', 'preprocess', 'forward', 'serialize', 'total']
+
+
+def synthetic_smear(width, height, rng):
+    """Pale pink background with red cells and a few purple-stained nuclei"""
+    img = np.empty((height, width, 3), dtype=np.float32)
+    img[:] = (232, 205, 212)
+    img += rng.normal(0, 6, img.shape)
+
+    yy, xx = np.ogrid[:height, :width]
+    scale = min(width, height) / 224
+    n_cells = int(40 * (width * height) / (640 * 480)) + 8
+    for _ in range(n_cells):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        r = rng.uniform(9, 14) * scale
+        d2 = (xx - cx) ** 2 + (yy - cy) ** 2
+        img[d2 < r ** 2] = (205, 110, 120)
+        img[d2 < (0.4 * r) ** 2] = (222, 160, 168)
+    for _ in range(max(2, n_cells // 10)):
+        cx, cy = rng.uniform(0, width), rng.uniform(0, height)
+        r = rng.uniform(10, 16) * scale
+        img[(xx - cx) ** 2 + (yy - cy) ** 2 < r ** 2] = (110, 60, 150)
+
+    return Image.fromarray(np.clip(img, 0, 255).astype(np.uint8))
+
+
+def encode_data_url(image, quality=90):
+    buffered = io.BytesIO()
+    image.save(buffered, format='JPEG', quality=quality)
+    return 'data:image/jpeg;base64,' + base64.b64encode(buffered.getvalue()).decode()
+
+
+def percentiles(samples_ms):
+    arr = np.asarray(samples_ms)
+    return {
+        'mean_ms': float(arr.mean()),
+        'p50_ms': float(np.percentile(arr, 50)),
+        'p95_ms': float(np.percentile(arr, 95)),
+        'p99_ms': float(np.percentile(arr, 99)),
+    }
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process, or None when it cannot be measured"""
+    if resource is not None:
+        usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on Linux
+        return usage / 1024 ** 2 if sys.platform == 'darwin' else usage / 1024
+    try:
+        import psutil
+    except ImportError:
+        return None
+    memory = psutil.Process().memory_info()
+    # Windows reports the peak working set; elsewhere only the current RSS is available
+    return getattr(memory, 'peak_wset', memory.rss) / 1024 ** 2
+
+
+def random_weight_checkpoint(num_classes=10):
+    """Write an untrained checkpoint so the suite can run without best_model.pth"""
+    model = build_model(DEFAULT_ARCHITECTURE, num_classes)
+    path = os.path.join(tempfile.mkdtemp(), 'random_model.pth')
+    torch.save({
+        'model_state_dict': model.state_dict(),
+        'class_names': [f'class_{i}' for i in range(num_classes)],
+        'val_acc': 0.0,
+        'architecture': DEFAULT_ARCHITECTURE,
+    }, path)
+    return path
+
+
+def bench_stages(analyzer, data_urls, iterations, warmup):
+    timings = {stage: [] for stage in STAGES}
+    for i in range(warmup + iterations):
+        data_url = data_urls[i % len(data_urls)]
+
+        t0 = time.perf_counter()
+        raw = analyzer.decode_base64(data_url)
+        t1 = time.perf_counter()
+        image = analyzer.open_image(raw)
+        t2 = time.perf_counter()
+        inputs = analyzer.preprocess(image).unsqueeze(0)
+        t3 = time.perf_counter()
+        probabilities = analyzer.infer(inputs)
+        t4 = time.perf_counter()
+        json.dumps(analyzer.format_result(probabilities[0]))
+        t5 = time.perf_counter()
+
+        if i < warmup:
+            continue
+        for stage, start, end in zip(STAGES, (t0, t1, t2, t3, t4, t0), (t1, t2, t3, t4, t5, t5)):
+            timings[stage].append((end - start) * 1000)
+
+    result = {stage: percentiles(samples) for stage, samples in timings.items()}
+    result['images_per_sec'] = 1000.0 / result['total']['mean_ms']
+    return result
+
+
+def bench_batches(analyzer, tensors, batch_sizes, iterations, warmup):
+    results = {}
+    for batch_size in batch_sizes:
+        batch = torch.stack([tensors[i % len(tensors)] for i in range(batch_size)])
+        samples = []
+        for i in range(warmup + iterations):
+            start = time.perf_counter()
+            analyzer.infer(batch)
+            if i >= warmup:
+                samples.append((time.perf_counter() - start) * 1000)
+        stats = percentiles(samples)
+        stats['images_per_sec'] = batch_size * 1000.0 / stats['mean_ms']
+        results[str(batch_size)] = stats
+    return results
+
+
+def tracked_metrics(results):
+    """Flatten the metrics that gate regressions: name -> (value, higher_is_better)"""
+    metrics = {}
+    for resolution, stages in results['resolutions'].items():
+        metrics[f'{resolution}.total.p50_ms'] = (stages['total']['p50_ms'], False)
+        metrics[f'{resolution}.total.p95_ms'] = (stages['total']['p95_ms'], False)
+        metrics[f'{resolution}.images_per_sec'] = (stages['images_per_sec'], True)
+    for batch_size, stats in results['batches'].items():
+        metrics[f'batch_{batch_size}.images_per_sec'] = (stats['images_per_sec'], True)
+    if results.get('peak_rss_mb') is not None:
+        metrics['peak_rss_mb'] = (results['peak_rss_mb'], False)
+    return metrics
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    current = tracked_metrics(results)
+    previous = tracked_metrics(baseline)
+    regressions = []
+    for name, (value, higher_is_better) in current.items():
+        if name not in previous:
+            continue
+        base = previous[name][0]
+        if base <= 0:
+            continue
+        change = (value - base) / base
+        worse = -change if higher_is_better else change
+        if worse > tolerance:
+            regressions.append((name, base, value, worse))
+    return regressions
+
+
+def run(args):
+    torch.manual_seed(0)
+    rng = np.random.default_rng(0)
+
+    model_path = random_weight_checkpoint() if args.random_weights else args.model
+    analyzer = BloodSmearAnalyzer(model_path)
+
+    results = {
+        'created_at': time.time(),
+        'model': 'random' if args.random_weights else args.model,
+        'environment': {
+            'python': platform.python_version(),
+            'torch': torch.__version__,
+            'machine': platform.machine(),
+            'cpu_count': os.cpu_count(),
+            'torch_threads': torch.get_num_threads(),
+            'device': str(analyzer.device),
+        },
+        'resolutions': {},
+    }
+
+    for width, height in RESOLUTIONS:
+        data_urls = [encode_data_url(synthetic_smear(width, height, rng)) for _ in range(args.corpus_size)]
+        name = f'{width}x{height}'
+        results['resolutions'][name] = bench_stages(analyzer, data_urls, args.iterations, args.warmup)
+        stats = results['resolutions'][name]
+        print(f"{name:>10}: " + '  '.join(
+            f"{stage} {stats[stage]['p50_ms']:.2f}ms" for stage in STAGES
+        ) + f"  ({stats['images_per_sec']:.1f} img/s)")
+
+    tensors = [analyzer.preprocess(synthetic_smear(640, 480, rng)) for _ in range(8)]
+    results['batches'] = bench_batches(analyzer, tensors, BATCH_SIZES, max(5, args.iterations // 4), args.warmup)
+    for batch_size, stats in results['batches'].items():
+        print(f"  batch {batch_size:>3}: p50 {stats['p50_ms']:8.2f}ms  p99 {stats['p99_ms']:8.2f}ms  "
+              f"{stats['images_per_sec']:7.1f} img/s")
+
+    results['peak_rss_mb'] = peak_rss_mb()
+    if results['peak_rss_mb'] is not None:
+        print(f"Peak RSS: {results['peak_rss_mb']:.1f} MB")
+    else:
+        print("Peak RSS: not measured (pip install -r requirements-tools.txt for psutil)")
+    return results
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark the inference hot path')
+    parser.add_argument('--model', default='models/best_model.pth')
+    parser.add_argument('--random-weights', action='store_true',
+                        help='Benchmark an untrained model instead of a checkpoint')
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--corpus-size', type=int, default=8)
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--tolerance', type=float, default=0.15,
+                        help='Allowed relative regression before failing')
+    parser.add_argument('--update-baseline', action='store_true')
+    args = parser.parse_args()
+
+    results = run(args)
+
+    os.makedirs(os.path.join(BENCHMARK_DIR, 'results'), exist_ok=True)
+    result_path = os.path.join(BENCHMARK_DIR, 'results', time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(result_path, 'w') as f:
+        json.dump(results, f, indent=2)
+    print(f"Results saved to {result_path}")
+
+    if args.update_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline updated: {args.baseline}")
+        sys.exit(0)
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}; run with --update-baseline to create one")
+        sys.exit(0)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get('environment') != results['environment']:
+        print("⚠️  Baseline was recorded in a different environment; comparisons may be noisy")
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("❌ PERFORMANCE REGRESSION")
+        for name, base, value, worse in regressions:
+            print(f"  {name}: {base:.2f} -> {value:.2f} ({worse * 100:+.1f}% worse)")
+        sys.exit(1)
+    print(f"✅ No regressions beyond {args.tolerance * 100:.0f}% against {args.baseline}")
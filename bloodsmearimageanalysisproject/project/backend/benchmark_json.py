@@ -0,0 +1,127 @@
+"""
+Microbenchmark for /api/results serialization.
+
+Compares the previous path (convert every `created_at` with `.isoformat()`,
+then Flask's default stdlib encoder with sorted keys) against the
+OrjsonProvider path (documents as read from MongoDB, encoded in one call),
+plus the provider's stdlib fallback. Payloads mirror a full results page:
+100 analysis documents with nested `all_predictions` arrays. The script also
+checks that every path decodes to the same JSON.
+
+Usage:
+    python benchmark_json.py
+    python benchmark_json.py --documents 100 --iterations 500
+"""
+import argparse
+import copy
+import json
+import statistics
+import time
+import uuid
+from datetime import datetime, timedelta
+
+import numpy as np
+from bson import ObjectId
+
+import json_provider
+from json_provider import default, dumps_bytes
+
+CLASS_NAMES = [
+    'babesia', 'leishmania', 'leukemia', 'lymphoma', 'malaria',
+    'normal', 'sickle_cell', 'thalassemia', 'trypanosoma', 'anemia'
+]
+
+
+def synthetic_analyses(count, rng):
+    """Analysis documents shaped like the ones /api/results reads from MongoDB"""
+    now = datetime.utcnow()
+    documents = []
+    for i in range(count):
+        probs = rng.dirichlet(np.ones(len(CLASS_NAMES)))
+        predictions = sorted(
+            ({'disease': name, 'confidence': float(p)} for name, p in zip(CLASS_NAMES, probs)),
+            key=lambda x: x['confidence'], reverse=True
+        )
+        documents.append({
+            'analysis_id': str(uuid.uuid4()),
+            'user_id': 'benchmark-user',
+            'notes': f'Sample {i}: thin smear, Giemsa stain',
+            'result': {
+                'predicted_class': predictions[0]['disease'],
+                'confidence': predictions[0]['confidence'],
+                'all_predictions': predictions,
+                'status': 'success'
+            },
+            'created_at': now - timedelta(minutes=7 * i, microseconds=int(rng.integers(0, 10 ** 6)))
+        })
+    return documents
+
+
+def previous_path(documents):
+    # The loop mutates the documents; each request used to work on its own fresh copies
+    for analysis in documents:
+        analysis['created_at'] = analysis['created_at'].isoformat()
+    return json.dumps({'analyses': documents}, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+def stdlib_fallback_path(documents):
+    return json.dumps({'analyses': documents}, default=default, separators=(',', ':')).encode('utf-8')
+
+
+def provider_path(documents):
+    return dumps_bytes({'analyses': documents})
+
+
+def time_path(fn, documents, iterations, warmup, copy_input):
+    samples = []
+    for i in range(warmup + iterations):
+        # The copy is made outside the timed region so only serialization is measured
+        payload = copy.deepcopy(documents) if copy_input else documents
+        start = time.perf_counter()
+        fn(payload)
+        if i >= warmup:
+            samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return {
+        'mean_ms': statistics.fmean(samples),
+        'p50_ms': samples[len(samples) // 2],
+        'p95_ms': samples[int(len(samples) * 0.95)],
+    }
+
+
+def run(args):
+    rng = np.random.default_rng(0)
+    documents = synthetic_analyses(args.documents, rng)
+
+    expected = json.loads(previous_path(copy.deepcopy(documents)))
+    assert json.loads(stdlib_fallback_path(documents)) == expected, 'stdlib fallback output differs'
+    if json_provider.orjson is not None:
+        assert json.loads(provider_path(documents)) == expected, 'orjson output differs'
+
+    # Extra types the provider must accept without pre-processing
+    extras = {'_id': ObjectId(), 'score': np.float32(0.5), 'counts': np.arange(3), 'at': datetime.utcnow()}
+    json.loads(provider_path(extras))
+
+    paths = [('previous (isoformat loop + stdlib)', previous_path, True),
+             ('provider, stdlib fallback', stdlib_fallback_path, False)]
+    if json_provider.orjson is not None:
+        paths.append(('provider, orjson', provider_path, False))
+    else:
+        print('orjson not installed; only the stdlib paths are measured')
+
+    payload_bytes = len(provider_path(documents))
+    print(f"{args.documents} documents, {payload_bytes / 1024:.1f} KB payload, {args.iterations} iterations")
+    baseline = None
+    for name, fn, copy_input in paths:
+        stats = time_path(fn, documents, args.iterations, args.warmup, copy_input)
+        baseline = baseline or stats['p50_ms']
+        print(f"  {name:<36} p50 {stats['p50_ms']:7.3f}ms  p95 {stats['p95_ms']:7.3f}ms  "
+              f"({baseline / stats['p50_ms']:.1f}x)")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmark JSON serialization of /api/results')
+    parser.add_argument('--documents', type=int, default=100)
+    parser.add_argument('--iterations', type=int, default=300)
+    parser.add_argument('--warmup', type=int, default=20)
+    run(parser.parse_args())
@@ -0,0 +1,118 @@
+"""
+Confidence-gated two-stage inference.
+
+A cheap first stage scores every image; images whose top-1 probability
+reaches the threshold for the predicted class keep that answer, and only the
+uncertain ones are re-run through the full model. The first stage is either a
+separate small model (e.g. the distilled student) or the full model itself on
+a downsampled input.
+
+Thresholds come from a config written by tune_cascade.py:
+
+    {
+      "first_stage": "models/student_best_model.safetensors",   # or null
+      "first_resolution": null,                                 # or e.g. 160
+      "threshold": 0.92,
+      "per_class": {"malaria": 0.97, ...}                        # optional overrides
+    }
+
+`CascadeAnalyzer` has the same interface as `BloodSmearAnalyzer`, so the
+request path, live sessions and the model manager use it unchanged.
+"""
+import json
+
+import torch
+import torch.nn.functional as F
+
+from instrumentation import REGISTRY, stage
+
+ROUTED = REGISTRY.counter(
+    'bloodsmear_cascade_routed_total', 'Images answered by each cascade stage', ('stage',))
+FIRST_CONFIDENCE = REGISTRY.histogram(
+    'bloodsmear_cascade_first_confidence', 'Top-1 probability of the first stage',
+    buckets=(0.5, 0.6, 0.7, 0.8, 0.85, 0.9, 0.95, 0.98, 0.99, 1.0))
+
+
+def downsample(inputs, resolution):
+    """Resize a preprocessed batch for a reduced-resolution first pass"""
+    if resolution is None or inputs.shape[-1] == resolution:
+        return inputs
+    return F.interpolate(inputs, size=(resolution, resolution), mode='bilinear',
+                         align_corners=False, antialias=True)
+
+
+def load_config(path):
+    with open(path) as f:
+        config = json.load(f)
+    if not config.get('first_stage') and not config.get('first_resolution'):
+        raise ValueError(f"{path}: set first_stage or first_resolution")
+    return config
+
+
+class CascadeAnalyzer:
+    def __init__(self, full, first=None, first_resolution=None, threshold=0.9, per_class=None):
+        if first is not None and first.class_names != full.class_names:
+            raise ValueError(
+                f"First-stage classes {first.class_names} do not match {full.class_names}"
+            )
+        self.full = full
+        self.first = first or full
+        self.first_resolution = first_resolution
+        self.threshold = threshold
+        self.per_class = dict(per_class or {})
+        self.thresholds = torch.tensor(
+            [self.per_class.get(name, threshold) for name in full.class_names]
+        )
+
+        # The rest of the analyzer interface is the full model's
+        self.device = full.device
+        self.class_names = full.class_names
+        self.architecture = full.architecture
+        self.transform = full.transform
+        self.decode_base64 = full.decode_base64
+        self.open_image = full.open_image
+        self.preprocess = full.preprocess
+        self.format_result = full.format_result
+
+    @classmethod
+    def from_config(cls, full, config_path, load_analyzer):
+        config = load_config(config_path)
+        first = load_analyzer(config['first_stage']) if config.get('first_stage') else None
+        cascade = cls(full, first, config.get('first_resolution'),
+                      config.get('threshold', 0.9), config.get('per_class'))
+        print(f"Cascade enabled: {cascade.describe()}")
+        return cascade
+
+    def describe(self):
+        first = f"{self.first.architecture}" if self.first is not self.full else 'full model'
+        if self.first_resolution:
+            first += f" @ {self.first_resolution}px"
+        return f"{first} -> {self.full.architecture}, threshold {self.threshold:.3f}"
+
+    def infer(self, inputs):
+        """Batch of preprocessed tensors -> class probabilities on CPU"""
+        # Stage timings show up as cascade_first / cascade_full in Server-Timing and /metrics
+        with stage('cascade_first'):
+            probabilities = self.first.infer(downsample(inputs, self.first_resolution))
+
+        confidence, predicted = probabilities.max(1)
+        escalate = confidence < self.thresholds[predicted]
+        for value in confidence.tolist():
+            FIRST_CONFIDENCE.observe(value)
+
+        escalated = int(escalate.sum())
+        ROUTED.inc(len(probabilities) - escalated, stage='first')
+        if escalated:
+            ROUTED.inc(escalated, stage='full')
+            index = escalate.nonzero().squeeze(1)
+            with stage('cascade_full'):
+                probabilities[index] = self.full.infer(inputs[index])
+        return probabilities
+
+    def predict(self, image_data):
+        try:
+            image = self.open_image(self.decode_base64(image_data))
+            probabilities = self.infer(self.preprocess(image).unsqueeze(0))
+            return self.format_result(probabilities[0])
+        except Exception as e:
+            return {'error': str(e), 'status': 'error'}
@@ -0,0 +1,200 @@
+"""
+Dataset manifest for ImageFolder-style directories.
+
+Records every image's relative path, label, byte size, mtime, SHA-1 and pixel
+dimensions, in the exact order torchvision's ImageFolder would enumerate
+them. Files whose size and mtime are unchanged are never re-read, so updating
+the manifest after adding images only touches the new files.
+
+Loading stats only the directories recorded in the manifest: while none of
+their mtimes changed (no image added, removed or renamed), the stored file
+list and class counts are used as they are. Images overwritten in place are
+picked up with --verify, which stats every file.
+
+The manifest is kept next to the dataset root (<root>.manifest.json), not
+inside it: writing a file into the root would change the root's mtime and
+make the manifest stale again on every save. A --manifest path inside the
+dataset has the same problem.
+
+Usage:
+    python dataset_manifest.py <dataset_root> [--manifest PATH] [--verify]
+"""
+import argparse
+import json
+import os
+
+import torch
+from PIL import Image
+from torchvision.datasets import ImageFolder
+from tqdm import tqdm
+
+from feature_cache import file_hash
+
+IMG_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.ppm', '.bmp', '.pgm', '.tif', '.tiff', '.webp')
+MANIFEST_VERSION = 1
+
+
+class DatasetManifest:
+    def __init__(self, root, manifest_path=None):
+        self.root = os.path.abspath(root)
+        self.manifest_path = manifest_path or self.root + '.manifest.json'
+        self.classes = []
+        self.files = []
+        self.directories = {}
+        self._class_counts = None
+
+        load_path = self.manifest_path
+        legacy_path = os.path.join(self.root, '.manifest.json')
+        if manifest_path is None and not os.path.exists(load_path) and os.path.exists(legacy_path):
+            # Manifests used to live inside the root; reuse their hashes, the next save moves them out
+            load_path = legacy_path
+        if os.path.exists(load_path):
+            with open(load_path) as f:
+                data = json.load(f)
+            if data.get('version') == MANIFEST_VERSION:
+                self.classes = data['classes']
+                self.files = data['files']
+                # Written by older manifests without directory mtimes too: the first update adds them
+                self.directories = data.get('directories', {})
+                self._class_counts = data.get('class_counts')
+
+    @classmethod
+    def load_or_build(cls, root, manifest_path=None, verify=False):
+        manifest = cls(root, manifest_path)
+        if verify or not manifest.is_current():
+            manifest.update()
+        return manifest
+
+    def is_current(self):
+        """True while no recorded directory's mtime changed since the manifest was saved"""
+        if not self.directories:
+            return False
+        for rel_dir, mtime in self.directories.items():
+            try:
+                if os.stat(os.path.join(self.root, rel_dir)).st_mtime != mtime:
+                    return False
+            except OSError:
+                return False
+        return True
+
+    def _scan(self):
+        """Enumerate (relative path, label) in ImageFolder order, and the mtime of every directory walked"""
+        classes = sorted(entry.name for entry in os.scandir(self.root) if entry.is_dir())
+        found = []
+        directories = {'.': os.stat(self.root).st_mtime}
+        for label, class_name in enumerate(classes):
+            class_dir = os.path.join(self.root, class_name)
+            for dirpath, _, fnames in sorted(os.walk(class_dir, followlinks=True)):
+                directories[os.path.relpath(dirpath, self.root)] = os.stat(dirpath).st_mtime
+                for fname in sorted(fnames):
+                    if fname.lower().endswith(IMG_EXTENSIONS):
+                        full_path = os.path.join(dirpath, fname)
+                        found.append((os.path.relpath(full_path, self.root), label))
+        return classes, found, directories
+
+    def update(self):
+        """Bring the manifest in sync with the directory; returns the number of (re)hashed files"""
+        classes, found, directories = self._scan()
+        known = {entry['path']: entry for entry in self.files}
+
+        files = []
+        rehashed = 0
+        for rel_path, label in tqdm(found, desc='Indexing dataset', leave=False):
+            full_path = os.path.join(self.root, rel_path)
+            stat = os.stat(full_path)
+            entry = known.get(rel_path)
+            if entry is None or entry['size'] != stat.st_size or entry['mtime'] != stat.st_mtime:
+                with Image.open(full_path) as img:
+                    width, height = img.size
+                entry = {
+                    'path': rel_path,
+                    'size': stat.st_size,
+                    'mtime': stat.st_mtime,
+                    'sha1': file_hash(full_path),
+                    'width': width,
+                    'height': height,
+                }
+                rehashed += 1
+            files.append(dict(entry, label=label))
+
+        changed = (rehashed > 0 or classes != self.classes or len(files) != len(self.files)
+                   or directories != self.directories)
+        self.classes = classes
+        self.files = files
+        self.directories = directories
+        self._class_counts = None
+        if changed:
+            self.save()
+            print(f"Manifest updated: {len(files)} images, {rehashed} new or modified")
+        return rehashed
+
+    def save(self):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'version': MANIFEST_VERSION,
+                'classes': self.classes,
+                'class_counts': self.class_counts,
+                'directories': self.directories,
+                'files': self.files,
+            }, f)
+        os.replace(tmp_path, self.manifest_path)
+
+    def __len__(self):
+        return len(self.files)
+
+    @property
+    def labels(self):
+        return [entry['label'] for entry in self.files]
+
+    @property
+    def hashes(self):
+        return [entry['sha1'] for entry in self.files]
+
+    @property
+    def samples(self):
+        return [(os.path.join(self.root, entry['path']), entry['label']) for entry in self.files]
+
+    @property
+    def class_counts(self):
+        if self._class_counts is None:
+            counts = [0] * len(self.classes)
+            for entry in self.files:
+                counts[entry['label']] += 1
+            self._class_counts = counts
+        return self._class_counts
+
+    def sample_weights(self):
+        """Inverse-frequency weight per sample, for WeightedRandomSampler"""
+        counts = torch.tensor(self.class_counts, dtype=torch.float).clamp(min=1)
+        return (1.0 / counts)[torch.tensor(self.labels, dtype=torch.long)]
+
+
+class ManifestImageFolder(ImageFolder):
+    """ImageFolder that takes its class list and samples from a manifest instead of walking the tree"""
+
+    def __init__(self, manifest, transform=None):
+        self.manifest = manifest
+        super().__init__(manifest.root, transform=transform)
+
+    def find_classes(self, directory):
+        classes = list(self.manifest.classes)
+        return classes, {name: i for i, name in enumerate(classes)}
+
+    def make_dataset(self, directory, class_to_idx, *args, **kwargs):
+        return self.manifest.samples
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Build or update a dataset manifest')
+    parser.add_argument('root')
+    parser.add_argument('--manifest', default=None)
+    parser.add_argument('--verify', action='store_true',
+                        help='Stat every file, also when no directory changed')
+    args = parser.parse_args()
+
+    manifest = DatasetManifest.load_or_build(args.root, args.manifest, verify=args.verify)
+    print(f"Dataset: {manifest.root}")
+    print(f"Images:  {len(manifest)}")
+    for name, count in zip(manifest.classes, manifest.class_counts):
+        print(f"  {name:25}: {count}")
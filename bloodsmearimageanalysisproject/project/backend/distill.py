@@ -0,0 +1,137 @@
+"""
+Knowledge distillation of the served EfficientNet-B0 into a smaller student.
+
+The student is trained with BloodSmearTrainer against a blend of the teacher's
+temperature-softened predictions and the ground-truth labels, and is saved in
+the usual checkpoint format (plus `architecture`) as models/student_best_model.pth,
+so any analyzer can serve it by pointing MODEL_PATH at it.
+
+Usage:
+    python distill.py --teacher models/best_model.pth --architecture mobilenet_v3_small
+    python distill.py --report-only
+"""
+import argparse
+import json
+import os
+import time
+
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+from metrics import MetricsAccumulator
+from model_builder import ARCHITECTURES, checkpoint_architecture, load_checkpoint_model
+from train_gpu_optimized import BloodSmearTrainer
+
+
+class DistillationTrainer(BloodSmearTrainer):
+    def __init__(self, teacher_path='models/best_model.pth', architecture='mobilenet_v3_small',
+                 temperature=4.0, alpha=0.7):
+        super().__init__(architecture=architecture, output_prefix='student_')
+        self.teacher_path = teacher_path
+        self.temperature = temperature
+        self.alpha = alpha
+
+    def setup_model(self, class_counts):
+        super().setup_model(class_counts)
+
+        self.teacher, checkpoint = load_checkpoint_model(self.teacher_path, self.device)
+        if checkpoint['class_names'] != self.train_dataset.classes:
+            raise ValueError(
+                f"Teacher classes {checkpoint['class_names']} do not match dataset classes {self.train_dataset.classes}"
+            )
+        for param in self.teacher.parameters():
+            param.requires_grad = False
+        print(f"Teacher loaded from {self.teacher_path}: {checkpoint['val_acc']:.2f}% accuracy")
+
+    def compute_loss(self, images, outputs, labels):
+        with torch.no_grad():
+            teacher_logits = self.teacher(images)
+
+        t = self.temperature
+        soft_loss = F.kl_div(
+            F.log_softmax(outputs / t, dim=1),
+            F.softmax(teacher_logits / t, dim=1),
+            reduction='batchmean'
+        ) * (t * t)
+        hard_loss = self.criterion(outputs, labels)
+        return self.alpha * soft_loss + (1 - self.alpha) * hard_loss
+
+
+def measure_cpu_latency(model, runs=50, warmup=10, image_size=224):
+    """Single-image CPU latency in milliseconds (median, p95)"""
+    model = model.to('cpu').eval()
+    inputs = torch.randn(1, 3, image_size, image_size)
+    timings = []
+    with torch.no_grad():
+        for i in range(warmup + runs):
+            start = time.perf_counter()
+            model(inputs)
+            if i >= warmup:
+                timings.append((time.perf_counter() - start) * 1000)
+    return float(np.median(timings)), float(np.percentile(timings, 95))
+
+
+def evaluate_checkpoint(model_path, val_loader, class_names, device):
+    model, checkpoint = load_checkpoint_model(model_path, device)
+    metrics = MetricsAccumulator(class_names, device=device)
+    with torch.no_grad():
+        for images, labels in val_loader:
+            images, labels = images.to(device), labels.to(device)
+            metrics.update(model(images), labels)
+    results = metrics.compute()
+
+    latency_p50, latency_p95 = measure_cpu_latency(model)
+    return {
+        'checkpoint': model_path,
+        'architecture': checkpoint_architecture(checkpoint),
+        'val_acc': results['accuracy'],
+        'macro_f1': results['macro_f1'],
+        'ece': results['ece'],
+        'parameters': sum(p.numel() for p in model.parameters()),
+        'file_size_mb': os.path.getsize(model_path) / 1024 ** 2,
+        'cpu_latency_p50_ms': latency_p50,
+        'cpu_latency_p95_ms': latency_p95,
+    }
+
+
+def compare_checkpoints(trainer, model_paths, report_path='models/distillation_report.json'):
+    """Evaluate each checkpoint on the validation set and write a latency/accuracy report"""
+    if not hasattr(trainer, 'val_loader'):
+        trainer.setup_data()
+
+    rows = [
+        evaluate_checkpoint(path, trainer.val_loader, trainer.train_dataset.classes, trainer.device)
+        for path in model_paths if os.path.exists(path)
+    ]
+
+    print(f"{'Checkpoint':40} {'Arch':20} {'Val Acc':>8} {'Params':>11} {'Size MB':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        print(f"{row['checkpoint']:40} {row['architecture']:20} {row['val_acc']:7.2f}% "
+              f"{row['parameters']:11,d} {row['file_size_mb']:8.1f} "
+              f"{row['cpu_latency_p50_ms']:8.1f} {row['cpu_latency_p95_ms']:8.1f}")
+
+    with open(report_path, 'w') as f:
+        json.dump({'created_at': time.time(), 'models': rows}, f, indent=2)
+    print(f"Report saved to {report_path}")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Distill the blood smear classifier into a smaller student')
+    parser.add_argument('--teacher', default='models/best_model.pth')
+    parser.add_argument('--architecture', default='mobilenet_v3_small', choices=ARCHITECTURES)
+    parser.add_argument('--epochs', type=int, default=30)
+    parser.add_argument('--temperature', type=float, default=4.0)
+    parser.add_argument('--alpha', type=float, default=0.7,
+                        help='Weight of the soft-target loss versus the hard-label loss')
+    parser.add_argument('--report-only', action='store_true',
+                        help='Skip training and only compare the existing teacher and student')
+    args = parser.parse_args()
+
+    trainer = DistillationTrainer(args.teacher, args.architecture, args.temperature, args.alpha)
+    if not args.report_only:
+        best_accuracy = trainer.train(epochs=args.epochs)
+        print(f"Student best accuracy: {best_accuracy:.2f}%")
+
+    compare_checkpoints(trainer, [args.teacher, trainer.output_path('best_model.pth')])
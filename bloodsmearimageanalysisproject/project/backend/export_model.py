@@ -0,0 +1,68 @@
+"""
+Export a training checkpoint as a serving artifact.
+
+Drops the optimizer state and training history, stores the weights as
+safetensors (optionally fp16) and puts class names, architecture and
+normalization constants in the file header. BatchNorm is folded into the
+conv/linear weights and dropout removed (--no-fold keeps the training graph). Point MODEL_PATH at the result;
+every server loads `.safetensors` files through model_builder.load_model.
+
+Usage:
+    python export_model.py models/best_model.pth                   # -> models/best_model.safetensors
+    python export_model.py models/best_model.pth --fp16 -o models/best_model.fp16.safetensors
+    python export_model.py models/best_model.pth --verify          # compare outputs and load time
+"""
+import argparse
+import os
+import time
+
+import torch
+
+from model_builder import SERVING_SUFFIX, export_serving_artifact, load_checkpoint_model, load_serving_model
+
+
+def timed_load(loader, path):
+    start = time.perf_counter()
+    model, metadata = loader(path, torch.device('cpu'))
+    return model, metadata, time.perf_counter() - start
+
+
+def verify(checkpoint_path, artifact_path, fp16):
+    reference, _, checkpoint_seconds = timed_load(load_checkpoint_model, checkpoint_path)
+    exported, metadata, artifact_seconds = timed_load(load_serving_model, artifact_path)
+
+    torch.manual_seed(0)
+    inputs = torch.randn(4, 3, metadata['image_size'], metadata['image_size'])
+    with torch.no_grad():
+        expected = torch.softmax(reference(inputs), dim=1)
+        actual = torch.softmax(exported(inputs), dim=1)
+    max_diff = (expected - actual).abs().max().item()
+    same_top1 = bool((expected.argmax(1) == actual.argmax(1)).all())
+
+    print(f"Load time: checkpoint {checkpoint_seconds * 1000:.0f}ms, artifact {artifact_seconds * 1000:.0f}ms")
+    print(f"Max probability difference: {max_diff:.2e}, same top-1: {same_top1}")
+    # Folding changes float rounding slightly
+    tolerance = 1e-2 if fp16 else 1e-4 if metadata['folded'] else 1e-5
+    if max_diff > tolerance or not same_top1:
+        raise SystemExit(f"Exported model differs from the checkpoint (tolerance {tolerance})")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Export a serving-only model artifact')
+    parser.add_argument('checkpoint', help='Training checkpoint (.pth)')
+    parser.add_argument('-o', '--output', help='Output path (default: checkpoint name with .safetensors)')
+    parser.add_argument('--fp16', action='store_true', help='Store weights in half precision')
+    parser.add_argument('--no-fold', action='store_true', help='Export the weights without BatchNorm folding')
+    parser.add_argument('--verify', action='store_true', help='Check outputs against the checkpoint')
+    args = parser.parse_args()
+
+    output = args.output or os.path.splitext(args.checkpoint)[0] + SERVING_SUFFIX
+    metadata = export_serving_artifact(args.checkpoint, output, fp16=args.fp16, fold=not args.no_fold)
+
+    checkpoint_mb = os.path.getsize(args.checkpoint) / 1024 ** 2
+    artifact_mb = os.path.getsize(output) / 1024 ** 2
+    print(f"Exported {metadata['architecture']} ({metadata['dtype']}) -> {output}")
+    print(f"Size: {checkpoint_mb:.1f} MB -> {artifact_mb:.1f} MB ({artifact_mb / checkpoint_mb:.0%})")
+
+    if args.verify:
+        verify(args.checkpoint, output, args.fp16)
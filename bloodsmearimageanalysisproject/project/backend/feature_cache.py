@@ -0,0 +1,132 @@
+"""
+Memory-mapped cache of pooled EfficientNet-B0 backbone features.
+
+Features are stored as float16 rows in a flat file next to a JSON index that
+maps image content hashes to row numbers. The cache directory is keyed by a
+hash of the backbone weights, so retraining the backbone never reuses stale
+features, while adding images only computes the new rows.
+"""
+import hashlib
+import json
+import os
+
+import numpy as np
+import torch
+from PIL import Image
+from torch.utils.data import DataLoader, Dataset
+from tqdm import tqdm
+
+FEATURE_DIM = 1280
+CACHE_VERSION = 'v1'
+
+
+def file_hash(path):
+    """SHA-1 of an image file's bytes"""
+    sha = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def backbone_hash(backbone):
+    """SHA-1 over the backbone state dict (names, shapes and values)"""
+    sha = hashlib.sha1(CACHE_VERSION.encode())
+    for name, tensor in backbone.state_dict().items():
+        sha.update(name.encode())
+        sha.update(str(tuple(tensor.shape)).encode())
+        sha.update(tensor.detach().cpu().contiguous().numpy().tobytes())
+    return sha.hexdigest()
+
+
+def pooled_features(model, images):
+    """Run the EfficientNet backbone and global pooling, skipping the classifier"""
+    return torch.flatten(model.avgpool(model.features(images)), 1)
+
+
+class _ImageFiles(Dataset):
+    def __init__(self, paths, transform):
+        self.paths = paths
+        self.transform = transform
+
+    def __len__(self):
+        return len(self.paths)
+
+    def __getitem__(self, idx):
+        return self.transform(Image.open(self.paths[idx]).convert('RGB'))
+
+
+class FeatureCache:
+    def __init__(self, cache_dir, weights_hash, dim=FEATURE_DIM):
+        self.dim = dim
+        self.weights_hash = weights_hash
+        self.cache_dir = os.path.join(cache_dir, weights_hash[:16])
+        self.index_path = os.path.join(self.cache_dir, 'index.json')
+        self.features_path = os.path.join(self.cache_dir, 'features.f16')
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.index = {}
+        if os.path.exists(self.index_path):
+            with open(self.index_path) as f:
+                meta = json.load(f)
+            if meta.get('weights_hash') == weights_hash and meta.get('dim') == dim:
+                self.index = meta['rows']
+
+        # Rows past the index belong to an interrupted append; drop them
+        expected_bytes = len(self.index) * dim * 2
+        if os.path.exists(self.features_path) and os.path.getsize(self.features_path) != expected_bytes:
+            with open(self.features_path, 'r+b') as f:
+                f.truncate(expected_bytes)
+
+    def __len__(self):
+        return len(self.index)
+
+    def _save_index(self):
+        tmp_path = self.index_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({'weights_hash': self.weights_hash, 'dim': self.dim, 'rows': self.index}, f)
+        os.replace(tmp_path, self.index_path)
+
+    def features(self):
+        """Read-only memmap over all cached rows"""
+        if not self.index:
+            return np.zeros((0, self.dim), dtype=np.float16)
+        return np.memmap(self.features_path, dtype=np.float16, mode='r', shape=(len(self.index), self.dim))
+
+    def extract(self, model, paths, transform, device, hashes=None, batch_size=64, num_workers=2):
+        """
+        Make sure every image in `paths` has a cached feature row.
+        Returns (memmap, rows) where memmap[rows[i]] is the feature of paths[i].
+        """
+        if hashes is None:
+            hashes = [file_hash(p) for p in tqdm(paths, desc='Hashing images')]
+
+        missing = {}
+        for path, h in zip(paths, hashes):
+            if h not in self.index and h not in missing:
+                missing[h] = path
+
+        if missing:
+            print(f"Extracting features for {len(missing)} new images ({len(self.index)} cached)")
+            loader = DataLoader(
+                _ImageFiles(list(missing.values()), transform),
+                batch_size=batch_size, shuffle=False, num_workers=num_workers
+            )
+            missing_hashes = list(missing.keys())
+            next_row = len(self.index)
+            model.eval()
+            with open(self.features_path, 'ab') as f, torch.no_grad():
+                offset = 0
+                for images in tqdm(loader, desc='Caching features'):
+                    feats = pooled_features(model, images.to(device))
+                    f.write(feats.cpu().numpy().astype(np.float16).tobytes())
+                    for h in missing_hashes[offset:offset + len(images)]:
+                        self.index[h] = next_row
+                        next_row += 1
+                    offset += len(images)
+            self._save_index()
+        else:
+            print(f"All {len(paths)} images found in feature cache")
+
+        rows = np.array([self.index[h] for h in hashes], dtype=np.int64)
+        return self.features(), rows
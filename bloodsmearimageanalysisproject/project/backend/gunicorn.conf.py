@@ -0,0 +1,19 @@
+"""
+gunicorn settings; workers and threads come from inference_config.json (see autotune_threads.py).
+
+    gunicorn --config gunicorn.conf.py app:app
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+import inference_config  # noqa: E402
+
+settings = inference_config.load()
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5001')}"
+workers = settings['workers']
+# Open live sockets (LIVE_SESSIONS) and job event streams (JOB_EVENT_STREAMS) each hold one of these
+threads = settings['threads']
+timeout = 120
@@ -0,0 +1,123 @@
+"""
+Conditional requests and response compression for the Flask app.
+
+`conditional(fingerprint)` wraps a GET view with a strong ETag derived from a
+cheap fingerprint of the underlying data (e.g. the user's analysis count and
+latest `created_at`). When the client's If-None-Match still matches, the
+view is never called and a 304 goes back without querying full documents.
+Responses are per-user, so they are marked `private, no-cache`: browsers keep
+them but revalidate every time, and shared caches never store them.
+
+`init_app(app)` compresses JSON/text responses with Brotli (when the
+`brotli` package is installed) or gzip, according to Accept-Encoding.
+"""
+import gzip
+import hashlib
+from functools import wraps
+
+from flask import Response, make_response, request
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CACHE_CONTROL = 'private, no-cache'
+MIN_COMPRESS_BYTES = 1024
+COMPRESSIBLE_TYPES = ('application/json', 'text/plain', 'text/csv')
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 5
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def make_etag(*parts):
+    return hashlib.sha1('|'.join(str(part) for part in parts).encode('utf-8')).hexdigest()[:32]
+
+
+def _client_etags():
+    """Entity tags from If-None-Match"""
+    header = request.headers.get('If-None-Match', '')
+    tags = set()
+    for tag in header.split(','):
+        tag = tag.strip()
+        if tag.startswith('W/'):
+            tag = tag[2:]
+        tag = tag.strip('"')
+        if tag:
+            tags.add(tag)
+    return tags
+
+
+def _representation_etags(etag):
+    """Tags the 200 for this request may have carried: `init_app` suffixes the coding
+    when it compresses, and only the body size (unknown here) decides whether it does"""
+    tags = [etag]
+    encoding = request.accept_encodings.best_match(ENCODINGS)
+    if encoding is not None:
+        tags.append(f'{etag}-{encoding}')
+    return tags
+
+
+def conditional(fingerprint):
+    """Decorator for GET views: `fingerprint(*args, **kwargs)` returns a cheap version of the response data"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                etag = make_etag(request.full_path, fingerprint(*args, **kwargs))
+            except Exception:
+                # Let the view produce its usual error response
+                return view(*args, **kwargs)
+
+            client_etags = _client_etags()
+            matched = [tag for tag in _representation_etags(etag) if tag in client_etags]
+            if matched:
+                # The 304 repeats the exact tag the client's cached representation carries
+                response = Response(status=304)
+                etag = matched[-1]
+            else:
+                response = make_response(view(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = CACHE_CONTROL
+            response.vary.add('Accept-Encoding')
+            return response
+        return wrapper
+    return decorator
+
+
+def compress(data, encoding):
+    if encoding == 'br':
+        return brotli.compress(data, quality=BROTLI_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL)
+
+
+def init_app(app):
+    """Compress eligible responses according to Accept-Encoding"""
+
+    @app.after_request
+    def _compress_response(response):
+        if (response.direct_passthrough or response.is_streamed
+                or response.status_code < 200 or response.status_code in (204, 304)
+                or 'Content-Encoding' in response.headers
+                or response.mimetype not in COMPRESSIBLE_TYPES):
+            return response
+
+        response.vary.add('Accept-Encoding')
+        encoding = request.accept_encodings.best_match(ENCODINGS)
+        if encoding is None:
+            return response
+        data = response.get_data()
+        if len(data) < MIN_COMPRESS_BYTES:
+            return response
+
+        response.set_data(compress(data, encoding))
+        response.headers['Content-Encoding'] = encoding
+        # A strong ETag names one exact representation, so each coding gets its own
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f'{etag}-{encoding}', weak)
+        return response
+
+    return app
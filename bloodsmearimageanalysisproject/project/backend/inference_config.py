@@ -0,0 +1,84 @@
+"""
+Thread and worker settings for CPU inference.
+
+autotune_threads.py sweeps these settings on the target machine and writes
+the best configuration to inference_config.json (or INFERENCE_CONFIG):
+
+    {"intra_op_threads": 2, "interop_threads": 1, "workers": 2, "threads": 4, ...}
+
+gunicorn.conf.py takes `workers` and `threads` from it. The analyzer applies
+the torch thread counts before it loads a model. Without a config file,
+PyTorch picks its own thread counts (every visible core) and gunicorn runs
+one worker with four threads.
+
+Admission control (INFERENCE_SLOTS, MAX_REQUESTS_PER_USER, MAX_QUEUED_REQUESTS)
+is per process, so with `workers` > 1 the server runs workers x INFERENCE_SLOTS
+inferences at once and each limit applies per worker.
+
+Environment variables override the file:
+    TORCH_NUM_THREADS, TORCH_INTEROP_THREADS, WEB_CONCURRENCY (workers), GUNICORN_THREADS
+"""
+import json
+import os
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.getenv('INFERENCE_CONFIG', os.path.join(BASE_DIR, 'inference_config.json'))
+
+DEFAULTS = {
+    'intra_op_threads': None,
+    'interop_threads': None,
+    'workers': 1,
+    'threads': 4
+}
+ENV_OVERRIDES = {
+    'intra_op_threads': 'TORCH_NUM_THREADS',
+    'interop_threads': 'TORCH_INTEROP_THREADS',
+    'workers': 'WEB_CONCURRENCY',
+    'threads': 'GUNICORN_THREADS'
+}
+
+_applied = None
+
+
+def load(path=CONFIG_PATH):
+    """Effective settings: defaults, then the config file, then environment overrides"""
+    settings = dict(DEFAULTS, source='defaults', path=path)
+    if os.path.exists(path):
+        with open(path) as f:
+            saved = json.load(f)
+        settings.update({key: saved[key] for key in DEFAULTS if key in saved})
+        settings['source'] = 'file'
+    settings['env_overrides'] = [variable for variable in ENV_OVERRIDES.values() if os.getenv(variable)]
+    for key, variable in ENV_OVERRIDES.items():
+        if os.getenv(variable):
+            settings[key] = int(os.getenv(variable))
+    return settings
+
+
+def apply_torch_settings(settings=None):
+    """Set torch's intra-/inter-op thread counts once per process; returns the counts in effect"""
+    global _applied
+    if _applied is not None:
+        return _applied
+
+    import torch
+
+    settings = settings or load()
+    if settings['intra_op_threads']:
+        torch.set_num_threads(settings['intra_op_threads'])
+    if settings['interop_threads']:
+        try:
+            torch.set_num_interop_threads(settings['interop_threads'])
+        except RuntimeError as e:
+            # Only allowed before any inter-op parallel work has started
+            print(f"⚠️ Could not set inter-op threads: {e}")
+    _applied = {
+        'intra_op_threads': torch.get_num_threads(),
+        'interop_threads': torch.get_num_interop_threads()
+    }
+    return _applied
+
+
+def status():
+    """Configured settings plus the torch thread counts applied in this process (None before the first model load)"""
+    return dict(load(), applied=_applied)
@@ -0,0 +1,275 @@
+"""
+Request instrumentation for the Flask backend.
+
+Provides thread-safe counters, gauges and histograms rendered in the
+Prometheus text exposition format on /metrics, per-stage timers that also
+feed a `Server-Timing` response header, and a pymongo command listener that
+times every MongoDB call.
+"""
+import threading
+import time
+from contextlib import contextmanager
+
+from flask import Response, g, has_request_context, request
+from pymongo import monitoring
+
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labelnames, values, extra=None):
+    pairs = list(zip(labelnames, values))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{name}="{_escape(value)}"' for name, value in pairs) + '}'
+
+
+class _Metric:
+    type_name = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labelnames)
+
+    def header(self):
+        return [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.type_name}']
+
+
+class Counter(_Metric):
+    type_name = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in items
+        ]
+
+
+class Gauge(_Metric):
+    type_name = 'gauge'
+
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set_function(self, fn, **labels):
+        """Sample `fn()` at scrape time instead of storing a value"""
+        with self._lock:
+            self._functions[self._key(labels)] = fn
+
+    def render(self):
+        with self._lock:
+            items = list(self._values.items())
+            functions = list(self._functions.items())
+        items += [(key, fn()) for key, fn in functions]
+        return self.header() + [
+            f'{self.name}{_format_labels(self.labelnames, key)} {value}' for key, value in items
+        ]
+
+
+class Histogram(_Metric):
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def render(self):
+        with self._lock:
+            items = [(key, (list(s[0]), s[1], s[2])) for key, s in self._values.items()]
+        lines = self.header()
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", bound))} {cumulative}')
+            lines.append(f'{self.name}_bucket{_format_labels(self.labelnames, key, ("le", "+Inf"))} {count}')
+            lines.append(f'{self.name}_sum{_format_labels(self.labelnames, key)} {total}')
+            lines.append(f'{self.name}_count{_format_labels(self.labelnames, key)} {count}')
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _register(self, cls, name, *args, **kwargs):
+        with self._lock:
+            if name not in self._metrics:
+                self._metrics[name] = cls(name, *args, **kwargs)
+            return self._metrics[name]
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter, name, documentation, labelnames)
+
+    def gauge(self, name, documentation, labelnames=()):
+        return self._register(Gauge, name, documentation, labelnames)
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.counter(
+    'bloodsmear_http_requests_total', 'HTTP requests handled', ('method', 'endpoint', 'status'))
+ERRORS = REGISTRY.counter(
+    'bloodsmear_http_errors_total', 'HTTP requests that returned a 5xx status', ('method', 'endpoint'))
+REQUEST_SECONDS = REGISTRY.histogram(
+    'bloodsmear_http_request_duration_seconds', 'End-to-end request latency', ('method', 'endpoint'))
+STAGE_SECONDS = REGISTRY.histogram(
+    'bloodsmear_stage_duration_seconds', 'Latency of individual request stages', ('stage',))
+MONGO_SECONDS = REGISTRY.histogram(
+    'bloodsmear_mongodb_command_duration_seconds', 'MongoDB command latency', ('command',))
+MONGO_FAILURES = REGISTRY.counter(
+    'bloodsmear_mongodb_command_failures_total', 'Failed MongoDB commands', ('command',))
+BATCH_SIZE = REGISTRY.histogram(
+    'bloodsmear_inference_batch_size', 'Images per model forward pass', (),
+    buckets=(1, 2, 4, 8, 16, 32, 64))
+MODEL_LOAD_SECONDS = REGISTRY.gauge(
+    'bloodsmear_model_load_seconds', 'Time taken to load the serving model')
+INFLIGHT = REGISTRY.gauge(
+    'bloodsmear_inflight_requests', 'Requests currently being handled', ('endpoint',))
+
+
+def _record_timing(name, seconds):
+    if has_request_context():
+        timings = g.setdefault('server_timings', [])
+        timings.append((name, seconds))
+
+
+@contextmanager
+def stage(name):
+    """Time a block as a request stage: histogram + Server-Timing entry"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.observe(elapsed, stage=name)
+        _record_timing(name, elapsed)
+
+
+class MongoCommandTimer(monitoring.CommandListener):
+    """Times MongoDB commands; register via MongoClient(event_listeners=[...])"""
+
+    def __init__(self):
+        self._started = {}
+        self._lock = threading.Lock()
+
+    def started(self, event):
+        with self._lock:
+            self._started[(event.connection_id, event.request_id)] = time.perf_counter()
+
+    def _finish(self, event):
+        with self._lock:
+            start = self._started.pop((event.connection_id, event.request_id), None)
+        if start is None:
+            return None
+        elapsed = time.perf_counter() - start
+        MONGO_SECONDS.observe(elapsed, command=event.command_name)
+        _record_timing(f'mongo-{event.command_name}', elapsed)
+        return elapsed
+
+    def succeeded(self, event):
+        self._finish(event)
+
+    def failed(self, event):
+        self._finish(event)
+        MONGO_FAILURES.inc(command=event.command_name)
+
+
+def _server_timing_header(timings, total):
+    merged = {}
+    for name, seconds in timings:
+        merged[name] = merged.get(name, 0.0) + seconds
+    entries = [f'{name};dur={seconds * 1000:.2f}' for name, seconds in merged.items()]
+    entries.append(f'total;dur={total * 1000:.2f}')
+    return ', '.join(entries)
+
+
+def init_app(app):
+    """Register request hooks and the /metrics endpoint on a Flask app"""
+
+    @app.before_request
+    def _start_timer():
+        g.request_start = time.perf_counter()
+        g.inflight_endpoint = request.endpoint or 'unknown'
+        INFLIGHT.inc(endpoint=g.inflight_endpoint)
+
+    @app.after_request
+    def _record_request(response):
+        start = g.get('request_start')
+        if start is None:
+            return response
+        endpoint = request.endpoint or 'unknown'
+        total = time.perf_counter() - start
+        REQUESTS.inc(method=request.method, endpoint=endpoint, status=response.status_code)
+        REQUEST_SECONDS.observe(total, method=request.method, endpoint=endpoint)
+        if response.status_code >= 500:
+            ERRORS.inc(method=request.method, endpoint=endpoint)
+        response.headers['Server-Timing'] = _server_timing_header(g.get('server_timings', []), total)
+        return response
+
+    @app.teardown_request
+    def _end_inflight(exc):
+        endpoint = g.pop('inflight_endpoint', None)
+        if endpoint is not None:
+            INFLIGHT.dec(endpoint=endpoint)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(REGISTRY.render(), mimetype='text/plain; version=0.0.4')
+
+    return app
@@ -0,0 +1,200 @@
+"""
+Background analysis jobs.
+
+`POST /api/analyze` with `"async": true` stores a job document in the `jobs`
+collection and returns 202 with its ID straight away; a worker pool runs the
+analysis and records each stage on the document. Because the state lives in
+MongoDB, any server process can answer:
+
+    GET /api/jobs/<job_id>          current job document
+    GET /api/jobs/<job_id>/events   server-sent events: `progress` on every
+                                    stage change, then `done` or `failed`
+
+Environment:
+    JOB_WORKERS      threads running jobs, default 2
+    JOB_QUEUE_SIZE   jobs allowed to wait for a worker, default 64
+    JOB_TTL_HOURS    finished jobs are removed after this long, default 24
+    JOB_EVENT_STREAMS  open event streams per process, default 2; each holds a
+                     server thread, so further streams get 503 and clients poll
+"""
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from flask import Response, jsonify, stream_with_context
+
+from instrumentation import REGISTRY
+
+QUEUED = 'queued'
+RUNNING = 'running'
+SUCCEEDED = 'succeeded'
+FAILED = 'failed'
+FINISHED = (SUCCEEDED, FAILED)
+
+JOBS = REGISTRY.counter(
+    'bloodsmear_jobs_total', 'Analysis jobs by final status', ('status',))
+JOB_SECONDS = REGISTRY.histogram(
+    'bloodsmear_job_duration_seconds', 'Time from job submission to completion')
+
+
+class JobQueueFull(Exception):
+    pass
+
+
+class JobRunner:
+    def __init__(self, jobs_collection, workers=None, queue_size=None):
+        self.jobs = jobs_collection
+        self.workers = workers or int(os.getenv('JOB_WORKERS', '2'))
+        self.capacity = self.workers + (queue_size or int(os.getenv('JOB_QUEUE_SIZE', '64')))
+        self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='job')
+        self.pending = 0
+        self._lock = threading.Lock()
+        REGISTRY.gauge('bloodsmear_jobs_pending', 'Jobs queued or running in this process') \
+            .set_function(lambda: self.pending)
+
+        if self.jobs is not None:
+            try:
+                self.jobs.create_index('job_id', unique=True)
+                ttl = int(float(os.getenv('JOB_TTL_HOURS', '24')) * 3600)
+                self.jobs.create_index('finished_at', expireAfterSeconds=ttl)
+            except Exception as e:
+                print(f"⚠️ Could not create job indexes: {e}")
+
+    def submit(self, user_id, work):
+        """Create a job and run `work(progress)` in the pool.
+
+        `work` returns `(analysis_id, result)`; `progress(stage)` records the
+        current stage on the job document.
+        """
+        with self._lock:
+            if self.pending >= self.capacity:
+                raise JobQueueFull('Job queue is full, retry shortly')
+            self.pending += 1
+
+        job_id = str(uuid.uuid4())
+        now = datetime.utcnow()
+        try:
+            self.jobs.insert_one({
+                'job_id': job_id,
+                'user_id': user_id,
+                'status': QUEUED,
+                'stage': QUEUED,
+                'created_at': now,
+                'updated_at': now
+            })
+            self.executor.submit(self._run, job_id, work)
+        except Exception:
+            with self._lock:
+                self.pending -= 1
+            raise
+        return job_id
+
+    def _update(self, job_id, **fields):
+        fields['updated_at'] = datetime.utcnow()
+        self.jobs.update_one({'job_id': job_id}, {'$set': fields})
+
+    def _run(self, job_id, work):
+        start = time.perf_counter()
+        status = FAILED
+        try:
+            self._update(job_id, status=RUNNING, stage='starting')
+            analysis_id, result = work(lambda stage: self._update(job_id, stage=stage))
+            status = SUCCEEDED
+            self._update(job_id, status=SUCCEEDED, stage='done', analysis_id=analysis_id,
+                         result=result, finished_at=datetime.utcnow())
+        except Exception as e:
+            # Admission and quality rejections keep their reason, retry_after and quality scores
+            failure = e.to_dict() if hasattr(e, 'to_dict') else {'error': str(e)}
+            failure.pop('status', None)
+            try:
+                self._update(job_id, status=FAILED, **failure, finished_at=datetime.utcnow())
+            except Exception as update_error:
+                print(f"❌ Could not record failure of job {job_id}: {update_error}")
+        finally:
+            JOBS.inc(status=status)
+            JOB_SECONDS.observe(time.perf_counter() - start)
+            with self._lock:
+                self.pending -= 1
+
+    def get(self, job_id):
+        return self.jobs.find_one({'job_id': job_id}, {'_id': 0})
+
+
+def _public(job):
+    job = dict(job)
+    for key in ('created_at', 'updated_at', 'finished_at'):
+        if isinstance(job.get(key), datetime):
+            job[key] = job[key].isoformat()
+    return job
+
+
+def _sse(event, data):
+    return f'event: {event}\ndata: {json.dumps(data)}\n\n'
+
+
+def init_app(app, runner, poll_interval=1.0, keepalive=15.0, timeout=120.0, max_streams=None):
+    """Register the job status and event-stream endpoints"""
+    max_streams = max_streams or int(os.getenv('JOB_EVENT_STREAMS', '2'))
+    streams = threading.BoundedSemaphore(max_streams)
+
+    @app.route('/api/jobs/<job_id>', methods=['GET'])
+    def get_job(job_id):
+        if runner.jobs is None:
+            return jsonify({'error': 'Database not connected'}), 503
+        job = runner.get(job_id)
+        if job is None:
+            return jsonify({'error': 'Job not found'}), 404
+        return jsonify(_public(job))
+
+    @app.route('/api/jobs/<job_id>/events', methods=['GET'])
+    def job_events(job_id):
+        if runner.jobs is None:
+            return jsonify({'error': 'Database not connected'}), 503
+        if runner.get(job_id) is None:
+            return jsonify({'error': 'Job not found'}), 404
+        if not streams.acquire(blocking=False):
+            response = jsonify({'error': 'Too many open event streams, poll the job instead',
+                                'status_url': f'/api/jobs/{job_id}'})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+
+        def stream():
+            last = None
+            last_sent = time.monotonic()
+            deadline = last_sent + timeout
+            while time.monotonic() < deadline:
+                job = runner.get(job_id)
+                if job is None:
+                    yield _sse('failed', {'job_id': job_id, 'error': 'Job expired'})
+                    return
+                state = (job['status'], job.get('stage'))
+                if state != last:
+                    last = state
+                    last_sent = time.monotonic()
+                    if job['status'] == SUCCEEDED:
+                        yield _sse('done', _public(job))
+                        return
+                    if job['status'] == FAILED:
+                        yield _sse('failed', _public(job))
+                        return
+                    yield _sse('progress', {'job_id': job_id, 'status': job['status'], 'stage': job.get('stage')})
+                elif time.monotonic() - last_sent >= keepalive:
+                    # Comment line keeps proxies from closing an idle stream
+                    last_sent = time.monotonic()
+                    yield ': keepalive\n\n'
+                time.sleep(poll_interval)
+            yield _sse('timeout', {'job_id': job_id})
+
+        response = Response(stream_with_context(stream()), mimetype='text/event-stream', headers={
+            'Cache-Control': 'no-cache',
+            'X-Accel-Buffering': 'no'
+        })
+        # Runs when the server closes the response, including on client disconnect
+        response.call_on_close(streams.release)
+        return response
+
+    return app
@@ -0,0 +1,88 @@
+"""
+Fast JSON provider for the Flask app.
+
+Serializes responses with orjson, which writes `datetime` values as ISO 8601
+and NumPy arrays/scalars natively; BSON types from MongoDB documents
+(ObjectId, Decimal128, Binary, Timestamp) go through `default`. Documents
+read from MongoDB can therefore be passed to `jsonify` as they are. When
+orjson is not installed the standard library encoder is used with the same
+type handling, so responses look the same either way.
+
+Install with `app.json = OrjsonProvider(app)`.
+"""
+import base64
+import datetime
+import decimal
+import uuid
+
+from bson import Binary, Decimal128, ObjectId, Timestamp
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+ORJSON_OPTIONS = orjson.OPT_SERIALIZE_NUMPY if orjson is not None else 0
+
+
+def default(obj):
+    """Types neither orjson nor the stdlib encoder know how to write"""
+    if isinstance(obj, ObjectId):
+        return str(obj)
+    if isinstance(obj, Decimal128):
+        return str(obj.to_decimal())
+    if isinstance(obj, Binary):
+        return base64.b64encode(bytes(obj)).decode('ascii')
+    if isinstance(obj, Timestamp):
+        return obj.as_datetime().isoformat()
+    if isinstance(obj, (datetime.datetime, datetime.date, datetime.time)):
+        return obj.isoformat()
+    # NumPy scalars and arrays, without importing NumPy for every process that serves JSON
+    if type(obj).__module__ == 'numpy' and hasattr(obj, 'tolist'):
+        return obj.tolist()
+    if isinstance(obj, (decimal.Decimal, uuid.UUID)):
+        return str(obj)
+    if isinstance(obj, bytes):
+        return base64.b64encode(obj).decode('ascii')
+    if isinstance(obj, (set, frozenset)):
+        return list(obj)
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+
+def dumps_bytes(obj):
+    """UTF-8 encoded JSON for `obj`"""
+    if orjson is not None:
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS)
+    import json
+    return json.dumps(obj, default=default, separators=(',', ':')).encode('utf-8')
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    # orjson keeps insertion order; sorting keys would only add cost
+    sort_keys = False
+
+    default = staticmethod(default)
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            kwargs.setdefault('default', default)
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=default, option=ORJSON_OPTIONS).decode('utf-8')
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+    def response(self, *args, **kwargs):
+        # Hand the encoded bytes straight to the response; no str round trip
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None:
+            return super().response(obj)
+        option = ORJSON_OPTIONS
+        if self.compact is False or (self.compact is None and self._app.debug):
+            option |= orjson.OPT_INDENT_2
+        return self._app.response_class(
+            orjson.dumps(obj, default=default, option=option), mimetype=self.mimetype
+        )
@@ -0,0 +1,239 @@
+"""
+Live-session channel for the camera page.
+
+One WebSocket per session at /ws/live?user_id=...&notes=...  The client sends
+each frame as a binary message: one flag byte (0 = auto capture, 1 = manual
+capture) followed by the JPEG bytes. Text messages carry control commands:
+
+    {"type": "notes", "notes": "..."}   update the session notes
+    {"type": "end"}                      close the session
+
+Every frame gets exactly one reply, so the client sends the next frame only
+after the previous one is answered:
+
+    {"type": "result", "frame": n, "result": {...}}
+    {"type": "duplicate", "frame": n, "distance": d}   near-identical to the last analysed frame
+    {"type": "dropped", "frame": n, "reason": "..."}   refused by admission control
+    {"type": "quality_rejected", "frame": n, "reasons": [...], "quality": {...}}   failed the quality gate
+    {"type": "error", "frame": n, "error": "..."}
+
+Auto frames whose difference hash is within LIVE_DEDUP_THRESHOLD bits
+(default 5 of 64) of the last analysed frame skip inference entirely. All
+results of a session are appended to one document in `live_sessions`.
+
+Each open socket holds a server thread for its whole lifetime, so only
+LIVE_SESSIONS are served per process; further connections get
+{"type": "error"} and are closed. The default is gunicorn's `threads` minus
+JOB_EVENT_STREAMS minus one (at least 1), which leaves a thread for analyze,
+results and health requests; with the default 4 threads that is one session
+per worker. A socket that sends nothing for LIVE_IDLE_TIMEOUT seconds
+(default 60) is closed as well.
+
+Live frames are stored in `live_sessions` only, not in `analyses`, so they do
+not appear in /api/results or /api/stats.
+"""
+import io
+import json
+import os
+import threading
+import uuid
+from datetime import datetime
+
+from flask import request
+from flask_sock import Sock
+from simple_websocket import ConnectionClosed
+
+import inference_config
+from admission import BACKGROUND, INTERACTIVE, AdmissionRejected
+from instrumentation import REGISTRY
+from quality import QualityRejected
+
+FLAG_MANUAL = 1
+
+FRAMES = REGISTRY.counter(
+    'bloodsmear_live_frames_total', 'Live-session frames by outcome', ('outcome',))
+SESSIONS = REGISTRY.gauge(
+    'bloodsmear_live_sessions', 'Open live-session connections')
+
+
+def dhash(image, size=8):
+    """64-bit difference hash: compares neighbouring pixels of a (size+1) x size grayscale thumbnail"""
+    from PIL import Image
+
+    small = image.convert('L').resize((size + 1, size), Image.BILINEAR)
+    pixels = small.tobytes()
+    bits = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            bits = (bits << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return bits
+
+
+def hamming(a, b):
+    return bin(a ^ b).count('1')
+
+
+class LiveSession:
+    def __init__(self, collection, user_id, notes='', threshold=None, max_results=None):
+        self.collection = collection
+        self.user_id = user_id
+        self.session_id = str(uuid.uuid4())
+        self.threshold = threshold if threshold is not None else int(os.getenv('LIVE_DEDUP_THRESHOLD', '5'))
+        # Keep the document well under MongoDB's 16 MB limit on very long sessions
+        self.max_results = max_results or int(os.getenv('LIVE_MAX_RESULTS', '5000'))
+        self.frames = 0
+        self.last_hash = None
+        self._pending = {'frames_received': 0, 'frames_skipped': 0, 'frames_dropped': 0, 'frames_rejected': 0}
+
+        now = datetime.utcnow()
+        self.collection.insert_one({
+            'session_id': self.session_id,
+            'user_id': user_id,
+            'notes': notes,
+            'status': 'active',
+            'frames_received': 0,
+            'frames_analyzed': 0,
+            'frames_skipped': 0,
+            'frames_dropped': 0,
+            'frames_rejected': 0,
+            'results': [],
+            'started_at': now,
+            'updated_at': now
+        })
+
+    def _flush(self, update=None):
+        """Write buffered counters (plus an optional update) in one round trip"""
+        update = update or {}
+        increments = {k: v for k, v in self._pending.items() if v}
+        increments.update(update.pop('$inc', {}))
+        if increments:
+            update['$inc'] = increments
+        update.setdefault('$set', {})['updated_at'] = datetime.utcnow()
+        self.collection.update_one({'session_id': self.session_id}, update)
+        self._pending = dict.fromkeys(self._pending, 0)
+
+    def handle_frame(self, message, analyze):
+        """Process one binary frame; `analyze(image, user_id, priority)` returns (result, model version, quality)"""
+        self.frames += 1
+        self._pending['frames_received'] += 1
+        manual = bool(message and message[0] & FLAG_MANUAL)
+        # PIL is imported with the first frame, not when the app starts
+        from PIL import Image
+        try:
+            image = Image.open(io.BytesIO(message[1:])).convert('RGB')
+        except Exception as e:
+            FRAMES.inc(outcome='error')
+            return {'type': 'error', 'frame': self.frames, 'error': f'Could not decode frame: {e}'}
+
+        frame_hash = dhash(image)
+        if not manual and self.last_hash is not None:
+            distance = hamming(frame_hash, self.last_hash)
+            if distance <= self.threshold:
+                self._pending['frames_skipped'] += 1
+                FRAMES.inc(outcome='duplicate')
+                return {'type': 'duplicate', 'frame': self.frames, 'distance': distance}
+
+        try:
+            result, model_version, quality = analyze(image, self.user_id, INTERACTIVE if manual else BACKGROUND)
+        except AdmissionRejected as e:
+            self._pending['frames_dropped'] += 1
+            FRAMES.inc(outcome='dropped')
+            return {'type': 'dropped', 'frame': self.frames, 'reason': e.reason}
+        except QualityRejected as e:
+            self._pending['frames_rejected'] += 1
+            FRAMES.inc(outcome='quality_rejected')
+            return {'type': 'quality_rejected', 'frame': self.frames, 'error': str(e),
+                    'reasons': e.reasons, 'quality': e.scores}
+
+        self.last_hash = frame_hash
+        entry = {
+            'frame': self.frames,
+            'manual': manual,
+            'hash': f'{frame_hash:016x}',
+            'result': result,
+            'model_version': model_version,
+            'quality': quality,
+            'created_at': datetime.utcnow()
+        }
+        self._flush({
+            '$push': {'results': {'$each': [entry], '$slice': -self.max_results}},
+            '$inc': {'frames_analyzed': 1}
+        })
+        FRAMES.inc(outcome='analyzed')
+        return {'type': 'result', 'frame': self.frames, 'result': result}
+
+    def set_notes(self, notes):
+        self._flush({'$set': {'notes': notes}})
+
+    def end(self):
+        self._flush({'$set': {'status': 'ended', 'ended_at': datetime.utcnow()}})
+
+
+def default_max_sessions():
+    """Live sockets per process that still leave a server thread free next to the job event streams"""
+    threads = inference_config.load()['threads']
+    return max(1, threads - int(os.getenv('JOB_EVENT_STREAMS', '2')) - 1)
+
+
+def init_app(app, get_collection, analyze, max_sessions=None, idle_timeout=None):
+    """Register /ws/live; `get_collection()` returns the live_sessions collection or None"""
+    sock = Sock(app)
+    max_sessions = max_sessions or int(os.getenv('LIVE_SESSIONS', '0')) or default_max_sessions()
+    idle_timeout = idle_timeout or float(os.getenv('LIVE_IDLE_TIMEOUT', '60'))
+    slots = threading.BoundedSemaphore(max_sessions)
+
+    @sock.route('/ws/live')
+    def live(ws):
+        collection = get_collection()
+        if collection is None:
+            ws.send(json.dumps({'type': 'error', 'error': 'Database not connected'}))
+            return
+        if not slots.acquire(blocking=False):
+            ws.send(json.dumps({'type': 'error', 'error': 'Too many live sessions, use POST /api/analyze instead'}))
+            return
+
+        try:
+            session = LiveSession(collection, request.args.get('user_id'), request.args.get('notes', ''))
+        except Exception:
+            slots.release()
+            raise
+        ws.send(json.dumps({'type': 'session', 'session_id': session.session_id}))
+        SESSIONS.inc()
+        try:
+            while True:
+                message = ws.receive(timeout=idle_timeout)
+                if message is None:
+                    ws.send(json.dumps({'type': 'error', 'error': 'Session idle for too long'}))
+                    break
+                if isinstance(message, bytes):
+                    try:
+                        reply = session.handle_frame(message, analyze)
+                    except Exception as e:
+                        FRAMES.inc(outcome='error')
+                        reply = {'type': 'error', 'frame': session.frames, 'error': str(e)}
+                    ws.send(json.dumps(reply))
+                    continue
+
+                try:
+                    command = json.loads(message)
+                except ValueError:
+                    command = None
+                if not isinstance(command, dict):
+                    ws.send(json.dumps({'type': 'error', 'error': 'Invalid command: expected a JSON object'}))
+                    continue
+                if command.get('type') == 'notes':
+                    session.set_notes(command.get('notes', ''))
+                elif command.get('type') == 'end':
+                    break
+        except ConnectionClosed:
+            pass
+        finally:
+            SESSIONS.dec()
+            slots.release()
+            try:
+                session.end()
+            except Exception as e:
+                print(f"❌ Could not close live session {session.session_id}: {e}")
+
+    return sock
@@ -0,0 +1,307 @@
+"""
+HTTP load-testing harness for the Flask API.
+
+Boots the backend under gunicorn (via loadtest_server.py) for every
+worker/thread configuration requested, drives each scenario with an async
+client at a fixed concurrency, and records throughput, latency percentiles,
+error rates and the server process tree's CPU and RSS.
+
+Usage:
+    python loadtest.py --mongo mongomock --random-weights
+    python loadtest.py --workers 1,2,4 --threads 1,4 --scenarios analyze,mixed --concurrency 16
+    python loadtest.py --mongo mongodb://localhost:27017/bloodsmear --target vercel_app
+
+Requires gunicorn (requirements.txt) and aiohttp, psutil and mongomock
+(requirements-tools.txt).
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import aiohttp
+import numpy as np
+import psutil
+
+from benchmark_inference import encode_data_url, random_weight_checkpoint, synthetic_smear
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'loadtest')
+USER_ID = 'loadtest-user'
+# app.py always uses this database, whatever the URI names
+DB_NAME = 'bloodsmear'
+
+SCENARIOS = {
+    'analyze': {'analyze': 1.0},
+    'results': {'results': 1.0},
+    'stats': {'stats': 1.0},
+    'mixed': {'analyze': 0.2, 'results': 0.5, 'stats': 0.3},
+}
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+class ServerProcess:
+    """gunicorn serving loadtest_server:app, with resource sampling of its process tree"""
+
+    def __init__(self, target, mongo, workers, threads, model_path, seed, concurrency):
+        self.port = free_port()
+        self.url = f'http://127.0.0.1:{self.port}'
+        env = dict(os.environ, LOADTEST_TARGET=target, LOADTEST_USER=USER_ID, LOADTEST_SEED=str(seed))
+        # Every client sends as USER_ID: admission limits sized to the client count, unless set
+        # explicitly, so the run measures inference rather than user_limit/queue_full 429s
+        env.setdefault('MAX_REQUESTS_PER_USER', str(concurrency))
+        env.setdefault('MAX_QUEUED_REQUESTS', str(concurrency))
+        if mongo == 'mongomock':
+            env['LOADTEST_MONGO'] = 'mongomock'
+        else:
+            env['MONGO_URI'] = mongo
+        if model_path:
+            env['MODEL_PATH'] = model_path
+
+        self.command = [
+            sys.executable, '-m', 'gunicorn', '--bind', f'127.0.0.1:{self.port}',
+            '--workers', str(workers), '--threads', str(threads),
+            '--timeout', '120', 'loadtest_server:app'
+        ]
+        self.proc = subprocess.Popen(self.command, cwd=BASE_DIR, env=env)
+        self.samples = []
+        self._sampling = False
+
+    async def wait_ready(self, session, timeout=60):
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.proc.returncode}")
+            try:
+                async with session.get(f'{self.url}/api/health') as resp:
+                    if resp.status == 200:
+                        return
+            except aiohttp.ClientError:
+                pass
+            await asyncio.sleep(0.5)
+        raise TimeoutError('Server did not become healthy')
+
+    def _tree(self):
+        try:
+            root = psutil.Process(self.proc.pid)
+            return [root] + root.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    def _sample_loop(self, interval):
+        procs = {p.pid: p for p in self._tree()}
+        for p in procs.values():
+            p.cpu_percent(None)
+        while self._sampling:
+            time.sleep(interval)
+            cpu, rss = 0.0, 0
+            for p in self._tree():
+                proc = procs.setdefault(p.pid, p)
+                try:
+                    cpu += proc.cpu_percent(None)
+                    rss += proc.memory_info().rss
+                except psutil.NoSuchProcess:
+                    continue
+            self.samples.append((cpu, rss))
+
+    def start_sampling(self, interval=0.5):
+        self.samples = []
+        self._sampling = True
+        self._thread = threading.Thread(target=self._sample_loop, args=(interval,), daemon=True)
+        self._thread.start()
+
+    def stop_sampling(self):
+        self._sampling = False
+        self._thread.join()
+        if not self.samples:
+            return {'cpu_percent_mean': 0.0, 'cpu_percent_max': 0.0, 'rss_mb_max': 0.0}
+        cpu = np.array([s[0] for s in self.samples])
+        rss = np.array([s[1] for s in self.samples]) / 1024 ** 2
+        return {
+            'cpu_percent_mean': float(cpu.mean()),
+            'cpu_percent_max': float(cpu.max()),
+            'rss_mb_mean': float(rss.mean()),
+            'rss_mb_max': float(rss.max()),
+        }
+
+    def stop(self):
+        self.proc.send_signal(signal.SIGTERM)
+        try:
+            self.proc.wait(timeout=30)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+
+
+def build_request(kind, url, images):
+    if kind == 'analyze':
+        return 'POST', f'{url}/api/analyze', {
+            'image': random.choice(images), 'user_id': USER_ID, 'notes': 'load test'
+        }
+    if kind == 'results':
+        return 'GET', f'{url}/api/results?user_id={USER_ID}', None
+    return 'GET', f'{url}/api/stats/{USER_ID}', None
+
+
+async def run_scenario(session, url, mix, images, concurrency, duration):
+    kinds, weights = zip(*mix.items())
+    records = []
+    deadline = time.perf_counter() + duration
+
+    async def client():
+        while time.perf_counter() < deadline:
+            kind = random.choices(kinds, weights)[0]
+            method, request_url, body = build_request(kind, url, images)
+            start = time.perf_counter()
+            try:
+                async with session.request(method, request_url, json=body) as resp:
+                    await resp.read()
+                    ok = resp.status < 400
+                    status = resp.status
+            except aiohttp.ClientError as e:
+                ok, status = False, type(e).__name__
+            records.append((kind, time.perf_counter() - start, ok, status))
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return records, elapsed
+
+
+def summarize(records, elapsed):
+    def stats(rows):
+        latencies = np.array([r[1] for r in rows]) * 1000
+        errors = sum(1 for r in rows if not r[2])
+        return {
+            'requests': len(rows),
+            'throughput_rps': len(rows) / elapsed,
+            'error_rate': errors / len(rows),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+        }
+
+    if not records:
+        return {'requests': 0}
+    summary = stats(records)
+    summary['by_endpoint'] = {
+        kind: stats([r for r in records if r[0] == kind])
+        for kind in sorted({r[0] for r in records})
+    }
+    statuses = {}
+    for r in records:
+        statuses[str(r[3])] = statuses.get(str(r[3]), 0) + 1
+    summary['status_codes'] = statuses
+    return summary
+
+
+async def run_configuration(args, workers, threads, images, model_path):
+    server = ServerProcess(args.target, args.mongo, workers, threads, model_path,
+                           seed=args.seed if args.mongo == 'mongomock' else 0,
+                           concurrency=args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.request_timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    results = []
+    try:
+        async with aiohttp.ClientSession(timeout=timeout, connector=connector) as session:
+            await server.wait_ready(session)
+            # Load the model before timing anything
+            await run_scenario(session, server.url, {'analyze': 1.0}, images, 1, 0.1)
+
+            for name in args.scenarios:
+                server.start_sampling()
+                records, elapsed = await run_scenario(
+                    session, server.url, SCENARIOS[name], images, args.concurrency, args.duration
+                )
+                summary = summarize(records, elapsed)
+                summary['server'] = server.stop_sampling()
+                summary.update({'scenario': name, 'workers': workers, 'threads': threads,
+                                'concurrency': args.concurrency})
+                results.append(summary)
+                print(f"  {name:8} w={workers} t={threads}: {summary.get('throughput_rps', 0):7.1f} req/s  "
+                      f"p50 {summary.get('p50_ms', 0):7.1f}ms  p99 {summary.get('p99_ms', 0):7.1f}ms  "
+                      f"err {100 * summary.get('error_rate', 0):5.1f}%  "
+                      f"cpu {summary['server']['cpu_percent_mean']:5.0f}%  "
+                      f"rss {summary['server']['rss_mb_max']:6.0f}MB")
+    finally:
+        server.stop()
+    return results
+
+
+def seed_external_mongo(uri, seed):
+    from pymongo import MongoClient
+    from loadtest_server import seed_fixtures
+    seed_fixtures(MongoClient(uri)[DB_NAME], USER_ID, seed)
+
+
+async def main(args):
+    rng = np.random.default_rng(0)
+    width, height = args.image_size
+    images = [encode_data_url(synthetic_smear(width, height, rng)) for _ in range(4)]
+    model_path = random_weight_checkpoint() if args.random_weights else None
+
+    if args.mongo != 'mongomock':
+        seed_external_mongo(args.mongo, args.seed)
+
+    all_results = []
+    for workers in args.workers:
+        for threads in args.threads:
+            print(f"Configuration: {workers} worker(s) x {threads} thread(s)")
+            all_results.extend(await run_configuration(args, workers, threads, images, model_path))
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    path = os.path.join(RESULTS_DIR, time.strftime('%Y%m%d-%H%M%S') + '.json')
+    with open(path, 'w') as f:
+        json.dump({
+            'created_at': time.time(),
+            'target': args.target,
+            'mongo': 'mongomock' if args.mongo == 'mongomock' else 'external',
+            'image_size': args.image_size,
+            'duration': args.duration,
+            'results': all_results,
+        }, f, indent=2)
+    print(f"Results saved to {path}")
+
+
+def int_list(value):
+    return [int(v) for v in value.split(',') if v.strip()]
+
+
+def image_size(value):
+    width, height = value.lower().split('x')
+    return int(width), int(height)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Load-test the blood smear analysis API')
+    parser.add_argument('--target', default='app', choices=['app', 'vercel_app'])
+    parser.add_argument('--mongo', default='mongomock',
+                        help="'mongomock' or a MongoDB URI (e.g. a local mongod)")
+    parser.add_argument('--workers', type=int_list, default=[1])
+    parser.add_argument('--threads', type=int_list, default=[1])
+    parser.add_argument('--scenarios', type=lambda v: v.split(','), default=list(SCENARIOS))
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--duration', type=float, default=20.0, help='Seconds per scenario')
+    parser.add_argument('--image-size', type=image_size, default=(1280, 960))
+    parser.add_argument('--seed', type=int, default=100, help='Analyses to seed for the test user')
+    parser.add_argument('--request-timeout', type=float, default=120.0)
+    parser.add_argument('--random-weights', action='store_true',
+                        help='Serve an untrained model instead of models/best_model.pth')
+    args = parser.parse_args()
+
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"Unknown scenarios: {unknown}")
+
+    asyncio.run(main(args))
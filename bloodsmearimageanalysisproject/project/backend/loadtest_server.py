@@ -0,0 +1,73 @@
+"""
+WSGI entry point used by loadtest.py.
+
+Environment:
+    LOADTEST_TARGET   backend module to serve: app (default) or vercel_app
+    LOADTEST_MONGO    'mongomock' to replace pymongo with an in-memory stand-in,
+                      otherwise the target's normal MONGO_URI is used
+    LOADTEST_SEED     number of analyses to seed for LOADTEST_USER (default 100)
+    LOADTEST_USER     user id used by the load-test scenarios
+
+With mongomock every gunicorn worker gets its own in-memory database, so each
+worker seeds its own copy of the fixture data.
+"""
+import importlib
+import os
+import uuid
+from datetime import datetime, timedelta
+
+import pymongo
+
+TARGET = os.getenv('LOADTEST_TARGET', 'app')
+USER_ID = os.getenv('LOADTEST_USER', 'loadtest-user')
+SEED_COUNT = int(os.getenv('LOADTEST_SEED', '100'))
+
+if os.getenv('LOADTEST_MONGO') == 'mongomock':
+    import mongomock
+
+    class _MockClient(mongomock.MongoClient):
+        def __init__(self, *args, **kwargs):
+            super().__init__()
+
+    pymongo.MongoClient = _MockClient
+
+
+def seed_fixtures(db, user_id=USER_ID, count=SEED_COUNT, class_names=None):
+    """Insert a user and `count` analyses shaped like the ones /api/analyze writes"""
+    class_names = class_names or [f'class_{i}' for i in range(10)]
+    if db['users'].find_one({'user_id': user_id}) is None:
+        db['users'].insert_one({
+            'user_id': user_id,
+            'email': f'{user_id}@loadtest.local',
+            'password': 'loadtest',
+            'name': 'Load Test',
+            'role': 'technician',
+            'created_at': datetime.utcnow()
+        })
+
+    existing = db['analyses'].count_documents({'user_id': user_id})
+    now = datetime.utcnow()
+    docs = []
+    for i in range(existing, count):
+        confidence = 1.0 / len(class_names)
+        docs.append({
+            'analysis_id': str(uuid.uuid4()),
+            'user_id': user_id,
+            'notes': 'seeded by loadtest_server',
+            'result': {
+                'predicted_class': class_names[i % len(class_names)],
+                'confidence': confidence,
+                'all_predictions': [{'disease': name, 'confidence': confidence} for name in class_names],
+                'status': 'success'
+            },
+            'created_at': now - timedelta(minutes=i)
+        })
+    if docs:
+        db['analyses'].insert_many(docs)
+
+
+target = importlib.import_module(TARGET)
+app = target.app
+
+if SEED_COUNT and getattr(target, 'db', None) is not None:
+    seed_fixtures(target.db)
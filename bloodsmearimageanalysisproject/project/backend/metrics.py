@@ -0,0 +1,127 @@
+"""
+Validation metrics accumulated on-device.
+
+The confusion matrix, top-k hits and calibration bins are updated with
+`torch.bincount` per batch, so nothing is copied to Python lists and every
+metric can be computed each epoch for a handful of small tensor ops.
+"""
+import json
+import os
+import time
+
+import torch
+
+
+class MetricsAccumulator:
+    def __init__(self, class_names, device='cpu', topk=(1, 3), n_bins=15, keep_outputs=False):
+        self.class_names = list(class_names)
+        self.num_classes = len(self.class_names)
+        self.topk = tuple(k for k in topk if k <= self.num_classes)
+        self.n_bins = n_bins
+        self.device = device
+        # Per-sample probabilities are only kept on request (e.g. for threshold tuning)
+        self.keep_outputs = keep_outputs
+        self.reset()
+
+    def reset(self):
+        c = self.num_classes
+        self.confusion = torch.zeros(c, c, dtype=torch.long, device=self.device)
+        self.topk_hits = torch.zeros(len(self.topk), dtype=torch.long, device=self.device)
+        self.bin_count = torch.zeros(self.n_bins, dtype=torch.float, device=self.device)
+        self.bin_confidence = torch.zeros(self.n_bins, dtype=torch.float, device=self.device)
+        self.bin_correct = torch.zeros(self.n_bins, dtype=torch.float, device=self.device)
+        self.loss_sum = 0.0
+        self.loss_batches = 0
+        self._probs = []
+        self._labels = []
+
+    @torch.no_grad()
+    def update(self, logits, labels, loss=None):
+        c = self.num_classes
+        probs = torch.softmax(logits.float(), dim=1)
+        confidence, predicted = probs.max(1)
+
+        self.confusion += torch.bincount(
+            labels * c + predicted, minlength=c * c
+        ).view(c, c)
+
+        if self.topk:
+            top = probs.topk(max(self.topk), dim=1).indices
+            hits = top == labels.unsqueeze(1)
+            for i, k in enumerate(self.topk):
+                self.topk_hits[i] += hits[:, :k].any(dim=1).sum()
+
+        bins = (confidence * self.n_bins).long().clamp_(max=self.n_bins - 1)
+        self.bin_count += torch.bincount(bins, minlength=self.n_bins).float()
+        self.bin_confidence += torch.bincount(bins, weights=confidence, minlength=self.n_bins)
+        self.bin_correct += torch.bincount(
+            bins, weights=(predicted == labels).float(), minlength=self.n_bins
+        )
+
+        if loss is not None:
+            self.loss_sum += float(loss)
+            self.loss_batches += 1
+
+        if self.keep_outputs:
+            self._probs.append(probs.cpu())
+            self._labels.append(labels.cpu())
+
+    def outputs(self):
+        """(probabilities [N, C], labels [N]) for every sample seen; needs keep_outputs=True"""
+        if not self._probs:
+            return torch.zeros(0, self.num_classes), torch.zeros(0, dtype=torch.long)
+        return torch.cat(self._probs), torch.cat(self._labels)
+
+    def compute(self):
+        cm = self.confusion.double()
+        tp = cm.diag()
+        support = cm.sum(1)
+        predicted_count = cm.sum(0)
+        total = cm.sum().clamp(min=1)
+
+        precision = tp / predicted_count.clamp(min=1)
+        recall = tp / support.clamp(min=1)
+        f1 = 2 * precision * recall / (precision + recall).clamp(min=1e-12)
+
+        bin_count = self.bin_count.double()
+        seen = bin_count > 0
+        gap = (self.bin_confidence.double()[seen] - self.bin_correct.double()[seen]).abs()
+        ece = (gap.sum() / total).item()
+
+        present = support > 0
+        per_class = [
+            {
+                'class': name,
+                'precision': precision[i].item(),
+                'recall': recall[i].item(),
+                'f1': f1[i].item(),
+                'support': int(support[i].item()),
+            }
+            for i, name in enumerate(self.class_names)
+        ]
+
+        return {
+            'loss': self.loss_sum / max(self.loss_batches, 1),
+            'accuracy': 100.0 * (tp.sum() / total).item(),
+            'macro_f1': f1[present].mean().item() if present.any() else 0.0,
+            'ece': ece,
+            'top_k': {f'top{k}': 100.0 * self.topk_hits[i].item() / total.item()
+                      for i, k in enumerate(self.topk)},
+            'per_class': per_class,
+            'confusion_matrix': self.confusion.cpu().tolist(),
+        }
+
+
+class MetricsLogger:
+    """Append-only JSONL log of per-epoch metrics"""
+
+    def __init__(self, path):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def log(self, record):
+        record = dict(record, timestamp=time.time())
+        with open(self.path, 'a') as f:
+            f.write(json.dumps(record) + '\n')
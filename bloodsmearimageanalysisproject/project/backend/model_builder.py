@@ -0,0 +1,188 @@
+"""
+Model construction shared by training and serving.
+
+Checkpoints carry an `architecture` field; checkpoints written before the
+field existed are EfficientNet-B0 with the custom classifier head. Pruned
+checkpoints also carry a `channel_config` describing their layer widths.
+
+Serving artifacts (`*.safetensors`, written by export_model.py) hold only the
+weights, optionally in fp16, with class names, architecture and
+normalization constants in the file header. BatchNorm layers are folded into
+the neighbouring conv/linear weights and dropout is removed at export time, so
+the artifact is already the inference graph. Artifacts are memory-mapped on
+load instead of unpickled, so fp32 weights are paged in lazily and shared
+between worker processes through the page cache. The runtime optimization pass
+copies weights into private tensors, so the analyzer only applies it to .pth
+checkpoints unless MODEL_OPTIMIZE=on.
+"""
+import json
+import os
+
+import torch
+import torch.nn as nn
+
+from model_optimization import fold_batchnorm, strip_dropout
+import torchvision.models as models
+
+DEFAULT_ARCHITECTURE = 'efficientnet_b0'
+ARCHITECTURES = ('efficientnet_b0', 'mobilenet_v3_small')
+
+SERVING_FORMAT = 'bloodsmear-serving/1'
+SERVING_SUFFIX = '.safetensors'
+IMAGENET_MEAN = [0.485, 0.456, 0.406]
+IMAGENET_STD = [0.229, 0.224, 0.225]
+IMAGE_SIZE = 224
+
+
+def build_model(architecture, num_classes, pretrained=False, channel_config=None):
+    if architecture == 'efficientnet_b0':
+        model = models.efficientnet_b0(weights='IMAGENET1K_V1' if pretrained else None)
+        in_features = model.classifier[1].in_features
+        model.classifier = nn.Sequential(
+            nn.Dropout(0.3),
+            nn.Linear(in_features, 512),
+            nn.ReLU(),
+            nn.BatchNorm1d(512),
+            nn.Dropout(0.2),
+            nn.Linear(512, num_classes)
+        )
+    elif architecture == 'mobilenet_v3_small':
+        model = models.mobilenet_v3_small(weights='IMAGENET1K_V1' if pretrained else None)
+        in_features = model.classifier[0].in_features
+        model.classifier = nn.Sequential(
+            nn.Linear(in_features, 512),
+            nn.Hardswish(),
+            nn.Dropout(0.2),
+            nn.Linear(512, num_classes)
+        )
+    else:
+        raise ValueError(f"Unknown architecture: {architecture}")
+
+    if channel_config:
+        from pruning import apply_channel_config
+        apply_channel_config(model, channel_config)
+    return model
+
+
+def checkpoint_architecture(checkpoint):
+    return checkpoint.get('architecture', DEFAULT_ARCHITECTURE)
+
+
+def is_serving_artifact(model_path):
+    return str(model_path).endswith(SERVING_SUFFIX)
+
+
+def load_model(model_path, device):
+    """Load a training checkpoint or a serving artifact; returns (model in eval mode, metadata dict)
+
+    The metadata always has `class_names`, `val_acc` and `architecture`, like a checkpoint.
+    """
+    if is_serving_artifact(model_path):
+        return load_serving_model(model_path, device)
+    return load_checkpoint_model(model_path, device)
+
+
+def fold_for_serving(model):
+    """Fold BatchNorm and remove dropout in place; the structure an exported artifact's weights fit"""
+    return {'batchnorm_folded': fold_batchnorm(model), 'dropout_removed': strip_dropout(model)}
+
+
+def export_serving_artifact(checkpoint_path, output_path, fp16=False, fold=True):
+    """Write the weights and serving metadata of a training checkpoint as safetensors"""
+    from safetensors.torch import save_file
+
+    checkpoint = torch.load(checkpoint_path, map_location='cpu', weights_only=False)
+    weights = checkpoint['model_state_dict']
+    if fold:
+        # Folded in fp32 before any fp16 cast, once here rather than in every worker
+        model = build_model(
+            checkpoint_architecture(checkpoint), len(checkpoint['class_names']),
+            channel_config=checkpoint.get('channel_config')
+        )
+        model.load_state_dict(weights)
+        model.eval()
+        fold_for_serving(model)
+        weights = model.state_dict()
+    state_dict = {}
+    for name, tensor in weights.items():
+        if fp16 and tensor.is_floating_point():
+            tensor = tensor.half()
+        state_dict[name] = tensor.contiguous()
+
+    # safetensors headers are str -> str
+    metadata = {
+        'format': SERVING_FORMAT,
+        'architecture': checkpoint_architecture(checkpoint),
+        'class_names': json.dumps(checkpoint['class_names']),
+        'val_acc': str(float(checkpoint.get('val_acc', 0.0))),
+        'dtype': 'float16' if fp16 else 'float32',
+        'image_size': str(IMAGE_SIZE),
+        'mean': json.dumps(IMAGENET_MEAN),
+        'std': json.dumps(IMAGENET_STD),
+        'source': os.path.basename(checkpoint_path),
+        'folded': 'true' if fold else 'false',
+    }
+    if checkpoint.get('channel_config'):
+        metadata['channel_config'] = json.dumps(checkpoint['channel_config'])
+
+    os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+    save_file(state_dict, output_path, metadata=metadata)
+    return metadata
+
+
+def read_serving_metadata(model_path):
+    """Header of a serving artifact, decoded; reads no tensor data"""
+    from safetensors import safe_open
+
+    with safe_open(model_path, framework='pt', device='cpu') as f:
+        raw = f.metadata() or {}
+    if raw.get('format') != SERVING_FORMAT:
+        raise ValueError(f"{model_path} is not a serving artifact (format={raw.get('format')!r})")
+
+    return {
+        'architecture': raw['architecture'],
+        'class_names': json.loads(raw['class_names']),
+        'val_acc': float(raw.get('val_acc', 0.0)),
+        'dtype': raw.get('dtype', 'float32'),
+        'image_size': int(raw.get('image_size', IMAGE_SIZE)),
+        'mean': json.loads(raw['mean']) if 'mean' in raw else IMAGENET_MEAN,
+        'std': json.loads(raw['std']) if 'std' in raw else IMAGENET_STD,
+        'channel_config': json.loads(raw['channel_config']) if 'channel_config' in raw else None,
+        'source': raw.get('source'),
+        'folded': raw.get('folded') == 'true',
+    }
+
+
+def load_serving_model(model_path, device):
+    """Build the model without allocating weights and point it at the memory-mapped tensors"""
+    from safetensors.torch import load_file
+
+    metadata = read_serving_metadata(model_path)
+    with torch.device('meta'):
+        model = build_model(
+            metadata['architecture'], len(metadata['class_names']),
+            channel_config=metadata['channel_config']
+        )
+        if metadata['folded']:
+            # Same structural change as at export, on meta tensors, so the folded weights fit
+            fold_for_serving(model)
+    model.load_state_dict(load_file(model_path, device='cpu'), assign=True)
+    if metadata['dtype'] != 'float32':
+        # Served in fp32: fp16 artifacts trade the mmap sharing for half the download size
+        model.float()
+    model.to(device)
+    model.eval()
+    return model, metadata
+
+
+def load_checkpoint_model(model_path, device):
+    """Load a training checkpoint and return (model in eval mode, checkpoint dict)"""
+    checkpoint = torch.load(model_path, map_location=device, weights_only=False)
+    model = build_model(
+        checkpoint_architecture(checkpoint), len(checkpoint['class_names']),
+        channel_config=checkpoint.get('channel_config')
+    )
+    model.load_state_dict(checkpoint['model_state_dict'])
+    model.to(device)
+    model.eval()
+    return model, checkpoint
@@ -0,0 +1,126 @@
+"""
+Inference-time graph optimization for the served classifier.
+
+Applied to a model in eval mode after its weights are loaded:
+  * BatchNorm folding. A BatchNorm directly after a Conv2d/Linear is folded
+    into that layer's weights and bias (EfficientNet's conv/BN pairs). The
+    classifier head's BatchNorm1d sits after the ReLU, so it is folded
+    forward into the next Linear instead (only dropout lies between them).
+  * Dropout and stochastic depth are replaced by Identity.
+  * The model is converted to channels_last, which lets oneDNN pick its
+    blocked convolution kernels on CPU without per-layer layout reorders.
+  * Optionally the result is compiled: `compile` (torch.compile) or `jit`
+    (trace + freeze + torch.jit.optimize_for_inference, which fuses
+    conv/add/activation chains through oneDNN on CPU).
+
+The optimized model computes the same function as the original up to float
+rounding; test_optimized_model.py checks this and compares latency.
+"""
+import torch
+import torch.nn as nn
+
+try:
+    from torchvision.ops import StochasticDepth
+except ImportError:
+    StochasticDepth = ()
+
+COMPILE_MODES = ('off', 'compile', 'jit')
+_DROPOUT = nn.modules.dropout._DropoutNd
+_PASSTHROUGH = (_DROPOUT, nn.Identity)
+
+
+def _bn_scale_shift(bn):
+    scale = torch.rsqrt(bn.running_var + bn.eps)
+    if bn.weight is not None:
+        scale = scale * bn.weight
+    shift = -bn.running_mean * scale
+    if bn.bias is not None:
+        shift = shift + bn.bias
+    return scale, shift
+
+
+# New tensors rather than in-place updates: weights loaded from a serving
+# artifact may be backed by a read-only memory map.
+@torch.no_grad()
+def _fold_into_previous(layer, bn):
+    """layer followed by bn -> one layer"""
+    scale, shift = _bn_scale_shift(bn)
+    shape = (-1,) + (1,) * (layer.weight.dim() - 1)
+    bias = layer.bias if layer.bias is not None else torch.zeros_like(shift)
+    layer.weight = nn.Parameter(layer.weight * scale.view(shape), requires_grad=False)
+    layer.bias = nn.Parameter(bias * scale + shift, requires_grad=False)
+
+
+@torch.no_grad()
+def _fold_into_next(bn, linear):
+    """bn followed by linear -> one linear: W(s*x + t) + c = (W*s)x + (Wt + c)"""
+    scale, shift = _bn_scale_shift(bn)
+    bias = linear.bias if linear.bias is not None else torch.zeros(linear.out_features, device=shift.device)
+    linear.bias = nn.Parameter(bias + linear.weight @ shift, requires_grad=False)
+    linear.weight = nn.Parameter(linear.weight * scale.view(1, -1), requires_grad=False)
+
+
+def fold_batchnorm(model):
+    """Fold every foldable BatchNorm in nn.Sequential containers; returns how many were folded"""
+    folded = 0
+    for module in model.modules():
+        if not isinstance(module, nn.Sequential):
+            continue
+        names = list(module._modules)
+        for i, name in enumerate(names):
+            child = module._modules[name]
+            if not isinstance(child, (nn.BatchNorm1d, nn.BatchNorm2d)) or not child.track_running_stats:
+                continue
+            previous = module._modules[names[i - 1]] if i > 0 else None
+            if (isinstance(child, nn.BatchNorm2d) and isinstance(previous, nn.Conv2d)) or \
+                    (isinstance(child, nn.BatchNorm1d) and isinstance(previous, nn.Linear)):
+                _fold_into_previous(previous, child)
+            elif isinstance(child, nn.BatchNorm1d):
+                following = next((module._modules[n] for n in names[i + 1:]
+                                  if not isinstance(module._modules[n], _PASSTHROUGH)), None)
+                if not isinstance(following, nn.Linear):
+                    continue
+                _fold_into_next(child, following)
+            else:
+                # A conv's zero padding is applied after the BN shift, so folding forward is not exact
+                continue
+            module._modules[name] = nn.Identity()
+            folded += 1
+    return folded
+
+
+def strip_dropout(model):
+    """Replace dropout and stochastic depth with Identity; returns how many were removed"""
+    removed = 0
+    for module in model.modules():
+        for name, child in module._modules.items():
+            if isinstance(child, _DROPOUT) or (StochasticDepth and isinstance(child, StochasticDepth)):
+                module._modules[name] = nn.Identity()
+                removed += 1
+    return removed
+
+
+def optimize_for_inference(model, channels_last=True, compile_mode='off', image_size=224):
+    """Optimize `model` (modified in place); returns (model to serve, summary dict)"""
+    if compile_mode not in COMPILE_MODES:
+        raise ValueError(f"Unknown compile mode {compile_mode!r}, expected one of {COMPILE_MODES}")
+    model.eval()
+    summary = {
+        'batchnorm_folded': fold_batchnorm(model),
+        'dropout_removed': strip_dropout(model),
+        'channels_last': channels_last,
+        'compile': compile_mode
+    }
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+    if channels_last:
+        model = model.to(memory_format=memory_format)
+
+    if compile_mode == 'compile':
+        model = torch.compile(model)
+    elif compile_mode == 'jit':
+        device = next(model.parameters()).device
+        example = torch.randn(1, 3, image_size, image_size, device=device).to(memory_format=memory_format)
+        with torch.no_grad():
+            traced = torch.jit.trace(model, example)
+            model = torch.jit.optimize_for_inference(torch.jit.freeze(traced))
+    return model, summary
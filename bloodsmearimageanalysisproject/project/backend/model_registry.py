@@ -0,0 +1,363 @@
+"""
+Versioned model registry and zero-downtime model swaps.
+
+The registry is a directory of serving artifacts plus a manifest:
+
+    models/registry/
+        manifest.json          {"active": "v2", "previous": "v1", "versions": {...}, "history": [...]}
+        v1.safetensors
+        v2.safetensors
+
+`ModelManager` serves whichever version the manifest marks active. Activating
+a version loads and warms it up on a background thread, then swaps a single
+reference: requests that already picked up the old model finish on it, new
+requests get the new one. The previously active model stays loaded, so a
+rollback is an instant swap back. Each process re-reads the manifest every
+MODEL_SYNC_SECONDS (default 5), so a swap made through one gunicorn worker
+reaches the others.
+
+Usage:
+    python model_registry.py register models/best_model.pth --activate
+    python model_registry.py list
+    python model_registry.py activate v1
+"""
+import argparse
+import hashlib
+import json
+import os
+import shutil
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+from flask import jsonify, request
+
+from admin_auth import require_admin
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+REGISTRY_DIR = os.path.join(BASE_DIR, 'models', 'registry')
+
+
+def _lock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        return
+    f.seek(0)
+    while True:
+        try:
+            # LK_LOCK gives up with OSError after ten one-second retries
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+            return
+        except OSError:
+            pass
+
+
+def _unlock_file(f):
+    if fcntl is not None:
+        fcntl.flock(f, fcntl.LOCK_UN)
+    else:
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ModelRegistry:
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+        self.manifest_path = os.path.join(root, 'manifest.json')
+
+    @contextmanager
+    def _locked(self):
+        """Serialize manifest read-modify-write cycles across processes"""
+        os.makedirs(self.root, exist_ok=True)
+        with open(os.path.join(self.root, '.lock'), 'w') as lock:
+            _lock_file(lock)
+            try:
+                yield
+            finally:
+                _unlock_file(lock)
+
+    def exists(self):
+        return os.path.exists(self.manifest_path)
+
+    def mtime(self):
+        try:
+            return os.path.getmtime(self.manifest_path)
+        except OSError:
+            return None
+
+    def manifest(self):
+        if not self.exists():
+            return {'active': None, 'previous': None, 'versions': {}, 'history': []}
+        with open(self.manifest_path) as f:
+            return json.load(f)
+
+    def _write(self, manifest):
+        tmp_path = self.manifest_path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(manifest, f, indent=2)
+        os.replace(tmp_path, self.manifest_path)
+
+    def path(self, version):
+        entry = self.manifest()['versions'].get(version)
+        if entry is None:
+            raise KeyError(f"Unknown model version: {version}")
+        return os.path.join(self.root, entry['file'])
+
+    def register(self, source_path, version=None, notes='', fp16=False):
+        """Add a checkpoint (exported on the way in) or serving artifact as a new version"""
+        from model_builder import SERVING_SUFFIX, export_serving_artifact, is_serving_artifact, read_serving_metadata
+
+        with self._locked():
+            manifest = self.manifest()
+            version = version or f"v{len(manifest['versions']) + 1}"
+            if version in manifest['versions']:
+                raise ValueError(f"Version {version} already exists")
+
+            filename = version + SERVING_SUFFIX
+            target = os.path.join(self.root, filename)
+            if is_serving_artifact(source_path):
+                shutil.copyfile(source_path, target)
+            else:
+                export_serving_artifact(source_path, target, fp16=fp16)
+            metadata = read_serving_metadata(target)
+
+            manifest['versions'][version] = {
+                'file': filename,
+                'source': os.path.basename(source_path),
+                'sha256': file_sha256(target),
+                'architecture': metadata['architecture'],
+                'val_acc': metadata['val_acc'],
+                'dtype': metadata['dtype'],
+                'notes': notes,
+                'registered_at': datetime.utcnow().isoformat()
+            }
+            self._write(manifest)
+        return version
+
+    def set_active(self, version):
+        with self._locked():
+            manifest = self.manifest()
+            if version not in manifest['versions']:
+                raise KeyError(f"Unknown model version: {version}")
+            if manifest['active'] != version:
+                manifest['previous'] = manifest['active']
+                manifest['active'] = version
+                manifest['history'].append({'version': version, 'activated_at': datetime.utcnow().isoformat()})
+                self._write(manifest)
+        return manifest
+
+    def rollback(self):
+        previous = self.manifest().get('previous')
+        if not previous:
+            raise KeyError('No previous version to roll back to')
+        return self.set_active(previous)
+
+
+class ModelManager:
+    """Serves the registry's active version; falls back to a single fixed model file"""
+
+    def __init__(self, registry, loader, fallback_path=None, sync_interval=None):
+        self.registry = registry
+        self.loader = loader
+        self.fallback_path = fallback_path
+        self.sync_interval = sync_interval if sync_interval is not None else float(os.getenv('MODEL_SYNC_SECONDS', '5'))
+        self._current = None
+        self._previous = None
+        self._lock = threading.Lock()
+        self._loading = None
+        self._last_error = None
+        self._last_sync = 0.0
+        self._manifest_mtime = None
+
+    def _load(self, version, path):
+        from PIL import Image
+
+        analyzer = self.loader(path)
+        # Warm-up: the first forward pass pays for lazy initialisation and page faults
+        size = analyzer.transform.transforms[0].size[0]
+        analyzer.infer(analyzer.preprocess(Image.new('RGB', (size, size))).unsqueeze(0))
+        return version, analyzer
+
+    def current(self):
+        """(version, analyzer); loads synchronously only when nothing is being served yet"""
+        self._maybe_sync()
+        current = self._current
+        if current is not None:
+            return current
+        with self._lock:
+            if self._current is None:
+                self._current = self._load(*self._initial_target())
+            return self._current
+
+    def _initial_target(self):
+        active = self.registry.manifest().get('active') if self.registry.exists() else None
+        if active:
+            self._manifest_mtime = self.registry.mtime()
+            return active, self.registry.path(active)
+        if self.fallback_path is None:
+            raise FileNotFoundError('No active model in the registry and no MODEL_PATH set')
+        return os.path.basename(self.fallback_path), self.fallback_path
+
+    def _maybe_sync(self):
+        now = time.monotonic()
+        if now - self._last_sync < self.sync_interval:
+            return
+        self._last_sync = now
+        mtime = self.registry.mtime()
+        if mtime is None or mtime == self._manifest_mtime or self._current is None:
+            return
+        try:
+            active = self.registry.manifest().get('active')
+        except (OSError, ValueError) as e:
+            print(f"⚠️ Could not read model manifest: {e}")
+            return
+        # Only mark the manifest as seen once this process serves (or is loading) its active version
+        if not active or active == self._current[0] or self.activate(active):
+            self._manifest_mtime = mtime
+
+    def activate(self, version, commit=None):
+        """Start switching to `version`; returns False if a load is already running
+
+        `commit()` (e.g. the manifest write) runs only once the switch is accepted,
+        so a refused request leaves the registry unchanged.
+        """
+        with self._lock:
+            if self._loading is not None:
+                return False
+            self._loading = version
+        try:
+            if commit is not None:
+                commit()
+        except Exception:
+            with self._lock:
+                self._loading = None
+            raise
+        previous = self._previous
+        if previous is not None and previous[0] == version:
+            self._swap(previous)
+            with self._lock:
+                self._loading = None
+            return True
+        threading.Thread(target=self._load_and_swap, args=(version,), daemon=True).start()
+        return True
+
+    def _load_and_swap(self, version):
+        try:
+            loaded = self._load(version, self.registry.path(version))
+            self._swap(loaded)
+            self._last_error = None
+        except Exception as e:
+            self._last_error = {'version': version, 'error': str(e)}
+            print(f"❌ Could not activate model {version}: {e}")
+        finally:
+            with self._lock:
+                self._loading = None
+
+    def _swap(self, loaded):
+        with self._lock:
+            if self._current is not None and self._current[0] == loaded[0]:
+                return
+            # In-flight requests hold their own reference to the old analyzer
+            self._previous, self._current = self._current, loaded
+        print(f"✅ Serving model {loaded[0]}")
+
+    def status(self):
+        return {
+            'active': self._current[0] if self._current else None,
+            'standby': self._previous[0] if self._previous else None,
+            'loading': self._loading,
+            'last_error': self._last_error
+        }
+
+
+def init_app(app, manager):
+    """Register the admin model-management endpoints"""
+
+    @app.route('/api/admin/models', methods=['GET'])
+    @require_admin
+    def list_models():
+        return jsonify({'manifest': manager.registry.manifest(), 'serving': manager.status()})
+
+    @app.route('/api/admin/models/activate', methods=['POST'])
+    @require_admin
+    def activate_model():
+        version = (request.get_json(silent=True) or {}).get('version')
+        try:
+            accepted = manager.activate(version, commit=lambda: manager.registry.set_active(version))
+        except KeyError as e:
+            return jsonify({'error': str(e.args[0])}), 404
+        if not accepted:
+            return jsonify({'error': 'Another model is still loading', 'serving': manager.status()}), 409
+        return jsonify({'activating': version, 'serving': manager.status()}), 202
+
+    @app.route('/api/admin/models/rollback', methods=['POST'])
+    @require_admin
+    def rollback_model():
+        previous = manager.registry.manifest().get('previous')
+        if not previous:
+            return jsonify({'error': 'No previous version to roll back to'}), 409
+        try:
+            accepted = manager.activate(previous, commit=lambda: manager.registry.set_active(previous))
+        except KeyError as e:
+            return jsonify({'error': str(e.args[0])}), 409
+        if not accepted:
+            return jsonify({'error': 'Another model is still loading', 'serving': manager.status()}), 409
+        return jsonify({'active': previous, 'serving': manager.status()})
+
+    return app
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Manage the versioned model registry')
+    parser.add_argument('--root', default=REGISTRY_DIR)
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    register_parser = subparsers.add_parser('register', help='Add a checkpoint or serving artifact')
+    register_parser.add_argument('path')
+    register_parser.add_argument('--version')
+    register_parser.add_argument('--notes', default='')
+    register_parser.add_argument('--fp16', action='store_true')
+    register_parser.add_argument('--activate', action='store_true')
+
+    subparsers.add_parser('list', help='Show registered versions')
+
+    activate_parser = subparsers.add_parser('activate', help='Mark a version active')
+    activate_parser.add_argument('version')
+
+    subparsers.add_parser('rollback', help='Re-activate the previous version')
+
+    args = parser.parse_args()
+    registry = ModelRegistry(args.root)
+
+    if args.command == 'register':
+        version = registry.register(args.path, args.version, args.notes, args.fp16)
+        print(f"Registered {args.path} as {version}")
+        if args.activate:
+            registry.set_active(version)
+            print(f"Active version: {version}")
+    elif args.command == 'list':
+        manifest = registry.manifest()
+        for version, entry in manifest['versions'].items():
+            marker = '*' if version == manifest['active'] else ' '
+            print(f"{marker} {version:<8} {entry['architecture']:<20} {entry['val_acc']:6.2f}%  "
+                  f"{entry['dtype']:<8} {entry['registered_at']}  {entry['source']}")
+    elif args.command == 'activate':
+        registry.set_active(args.version)
+        print(f"Active version: {args.version}")
+    elif args.command == 'rollback':
+        print(f"Active version: {registry.rollback()['active']}")
@@ -0,0 +1,149 @@
+"""
+Cold-start profile of the backend entry points.
+
+Imports each app module in a fresh interpreter under `python -X importtime`,
+then serves one `/api/health` request through the Flask test client. The
+report contains:
+
+  * wall time of the import and of the first health request
+  * import time per top-level package (self time, so nothing is double counted)
+  * the slowest individual modules
+  * which ML packages (torch, torchvision, PIL, numpy, safetensors) were
+    loaded by the import and by the health request; both lists should be
+    empty, since ML modules load lazily with the first analysis
+
+Each run is saved to benchmarks/results/startup-<module>-<timestamp>.json
+and compared with the previous run of the same module, so cold-start time can
+be tracked across releases. MongoDB is contacted during import; point
+MONGO_URI at the deployment's database for representative numbers.
+
+Usage:
+    python profile_startup.py                    # app and vercel_app
+    python profile_startup.py --module vercel_app --top 30
+"""
+import argparse
+import glob
+import json
+import os
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+RESULTS_DIR = os.path.join(BASE_DIR, 'benchmarks', 'results')
+ML_PACKAGES = ('torch', 'torchvision', 'PIL', 'numpy', 'safetensors')
+
+PROBE = """
+import json, sys, time
+ML_PACKAGES = {ml_packages!r}
+start = time.perf_counter()
+import {module} as target
+import_seconds = time.perf_counter() - start
+ml_after_import = [name for name in ML_PACKAGES if name in sys.modules]
+client = target.app.test_client()
+start = time.perf_counter()
+status = client.get('/api/health').status_code
+health_seconds = time.perf_counter() - start
+print('PROFILE ' + json.dumps({{
+    'import_seconds': import_seconds,
+    'health_seconds': health_seconds,
+    'health_status': status,
+    'ml_after_import': ml_after_import,
+    'ml_after_health': [name for name in ML_PACKAGES if name in sys.modules],
+}}))
+"""
+
+IMPORTTIME_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+
+def parse_importtime(stderr):
+    """[(module, self_us, cumulative_us)] from -X importtime output"""
+    modules = []
+    for line in stderr.splitlines():
+        match = IMPORTTIME_LINE.match(line)
+        if match:
+            modules.append((match.group(4), int(match.group(1)), int(match.group(2))))
+    return modules
+
+
+def profile(module, top):
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', PROBE.format(module=module, ml_packages=ML_PACKAGES)],
+        cwd=BASE_DIR, capture_output=True, text=True
+    )
+    line = next((l for l in completed.stdout.splitlines() if l.startswith('PROFILE ')), None)
+    if completed.returncode != 0 or line is None:
+        raise SystemExit(f"Importing {module} failed:\n{completed.stderr[-2000:]}")
+
+    modules = parse_importtime(completed.stderr)
+    packages = defaultdict(int)
+    for name, self_us, _ in modules:
+        packages[name.split('.')[0]] += self_us
+
+    report = json.loads(line[len('PROFILE '):])
+    report.update({
+        'module': module,
+        'created_at': time.time(),
+        'python': sys.version.split()[0],
+        'modules_imported': len(modules),
+        'packages_ms': {name: us / 1000 for name, us in sorted(packages.items(), key=lambda x: -x[1])[:top]},
+        'slowest_modules_ms': [
+            {'module': name, 'self_ms': self_us / 1000, 'cumulative_ms': cumulative_us / 1000}
+            for name, self_us, cumulative_us in sorted(modules, key=lambda m: -m[1])[:top]
+        ],
+    })
+    return report
+
+
+def previous_report(module):
+    paths = sorted(glob.glob(os.path.join(RESULTS_DIR, f'startup-{module}-*.json')))
+    if not paths:
+        return None
+    with open(paths[-1]) as f:
+        return json.load(f)
+
+
+def print_report(report, previous):
+    print(f"\n== {report['module']}")
+    delta = ''
+    if previous:
+        change = report['import_seconds'] - previous['import_seconds']
+        delta = f" ({change * 1000:+.0f}ms vs previous run)"
+    print(f"Import: {report['import_seconds'] * 1000:.0f}ms{delta}, "
+          f"{report['modules_imported']} modules")
+    print(f"First /api/health: {report['health_seconds'] * 1000:.0f}ms (status {report['health_status']})")
+    print(f"ML packages after import: {report['ml_after_import'] or 'none'}, "
+          f"after health: {report['ml_after_health'] or 'none'}")
+
+    print(f"  {'Package':<28} {'Self ms':>8}")
+    for name, ms in report['packages_ms'].items():
+        print(f"  {name:<28} {ms:8.1f}")
+    print(f"  {'Module':<40} {'Self ms':>8} {'Cumul ms':>9}")
+    for row in report['slowest_modules_ms']:
+        print(f"  {row['module']:<40} {row['self_ms']:8.1f} {row['cumulative_ms']:9.1f}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Profile backend import time and cold start')
+    parser.add_argument('--module', action='append', choices=['app', 'vercel_app'],
+                        help='Entry point to profile (repeatable; default: both)')
+    parser.add_argument('--top', type=int, default=15, help='Rows in each table')
+    args = parser.parse_args()
+
+    os.makedirs(RESULTS_DIR, exist_ok=True)
+    eager_ml = False
+    for module in args.module or ['app', 'vercel_app']:
+        report = profile(module, args.top)
+        print_report(report, previous_report(module))
+        eager_ml = eager_ml or bool(report['ml_after_health'])
+
+        path = os.path.join(RESULTS_DIR, f"startup-{module}-{time.strftime('%Y%m%d-%H%M%S')}.json")
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Saved {path}")
+
+    if eager_ml:
+        print("\n❌ ML packages are imported before the first analysis")
+        sys.exit(1)
@@ -0,0 +1,195 @@
+"""
+On-demand profiling of the /api/analyze hot path.
+
+An admin arms the profiler for the next N analyze requests. Each captured
+request produces:
+  * forward.json     - torch.profiler operator trace (open in chrome://tracing or Perfetto)
+  * handler.folded   - collapsed Python stacks sampled from the handler thread
+                       (feed to flamegraph.pl or speedscope)
+While disarmed, the wrapped handler costs one integer check per request.
+
+The profiler lives in one process: under gunicorn with several workers, only
+the worker that received the admin request is armed, and only the analyze
+requests that worker serves are captured. Responses carry its `pid`.
+"""
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+from flask import abort, g, has_request_context, jsonify, request, send_from_directory
+from werkzeug.utils import safe_join
+
+from admin_auth import require_admin
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StackSampler(threading.Thread):
+    """Samples one thread's Python stack at a fixed interval into collapsed-stack counts"""
+
+    def __init__(self, thread_id, interval=0.002):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = {}
+        self._stop_event = threading.Event()
+
+    def run(self):
+        while not self._stop_event.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            key = ';'.join(reversed(stack))
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def stop(self):
+        self._stop_event.set()
+        self.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in sorted(self.counts.items()):
+                f.write(f'{stack} {count}\n')
+
+
+class RequestProfiler:
+    def __init__(self, output_dir=os.path.join(BASE_DIR, 'profiles')):
+        self.output_dir = output_dir
+        self.remaining = 0
+        self.session_id = None
+        self.captured = 0
+        self._lock = threading.Lock()
+
+    def arm(self, count):
+        with self._lock:
+            self.session_id = time.strftime('%Y%m%d-%H%M%S-') + uuid.uuid4().hex[:6]
+            self.remaining = count
+            self.captured = 0
+            os.makedirs(os.path.join(self.output_dir, self.session_id), exist_ok=True)
+            return self.session_id
+
+    def disarm(self):
+        with self._lock:
+            self.remaining = 0
+
+    def _claim(self):
+        with self._lock:
+            if self.remaining <= 0:
+                return None
+            self.remaining -= 1
+            self.captured += 1
+            capture_dir = os.path.join(self.output_dir, self.session_id, f'request_{self.captured:03d}')
+        os.makedirs(capture_dir, exist_ok=True)
+        return capture_dir
+
+    def profile_handler(self, view):
+        """Decorator: sample the handler's Python stacks when armed"""
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if not self.remaining:
+                return view(*args, **kwargs)
+            capture_dir = self._claim()
+            if capture_dir is None:
+                return view(*args, **kwargs)
+
+            g.profile_dir = capture_dir
+            sampler = StackSampler(threading.get_ident())
+            sampler.start()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                sampler.stop()
+                sampler.write(os.path.join(capture_dir, 'handler.folded'))
+        return wrapper
+
+    def forward(self):
+        """Context manager around the model forward pass; records a torch.profiler trace when capturing"""
+        # Background jobs run outside a request and are never captured
+        capture_dir = g.get('profile_dir') if self.session_id and has_request_context() else None
+        if capture_dir is None:
+            return nullcontext()
+        return self._torch_trace(capture_dir)
+
+    @contextmanager
+    def _torch_trace(self, capture_dir):
+        import torch
+        from torch.profiler import ProfilerActivity, profile
+
+        activities = [ProfilerActivity.CPU]
+        if torch.cuda.is_available():
+            activities.append(ProfilerActivity.CUDA)
+        with profile(activities=activities, record_shapes=True, with_stack=True) as prof:
+            yield
+        prof.export_chrome_trace(os.path.join(capture_dir, 'forward.json'))
+        with open(os.path.join(capture_dir, 'forward_ops.txt'), 'w') as f:
+            f.write(prof.key_averages().table(sort_by='self_cpu_time_total', row_limit=50))
+
+    def sessions(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        result = []
+        for session_id in sorted(os.listdir(self.output_dir)):
+            session_dir = os.path.join(self.output_dir, session_id)
+            files = []
+            for dirpath, _, fnames in os.walk(session_dir):
+                for fname in sorted(fnames):
+                    files.append(os.path.relpath(os.path.join(dirpath, fname), session_dir))
+            result.append({'session_id': session_id, 'files': sorted(files)})
+        return result
+
+
+def init_app(app, profiler):
+    """Register the admin profiling endpoints"""
+
+    @app.route('/api/admin/profile', methods=['POST'])
+    @require_admin
+    def start_profile():
+        data = request.get_json(silent=True) or {}
+        try:
+            count = int(data.get('requests', 1))
+        except (TypeError, ValueError):
+            count = 0
+        if count < 1 or count > 100:
+            return jsonify({'error': 'requests must be an integer between 1 and 100'}), 400
+        session_id = profiler.arm(count)
+        return jsonify({
+            'session_id': session_id,
+            'requests': count,
+            'pid': os.getpid(),
+            'note': 'Only analyze requests served by this worker process are captured'
+        })
+
+    @app.route('/api/admin/profile', methods=['GET'])
+    @require_admin
+    def profile_status():
+        return jsonify({
+            'pid': os.getpid(),
+            'active_session': profiler.session_id,
+            'remaining': profiler.remaining,
+            'sessions': profiler.sessions()
+        })
+
+    @app.route('/api/admin/profile', methods=['DELETE'])
+    @require_admin
+    def stop_profile():
+        profiler.disarm()
+        return jsonify({'remaining': 0})
+
+    @app.route('/api/admin/profile/<session_id>/<path:filename>', methods=['GET'])
+    @require_admin
+    def download_profile(session_id, filename):
+        session_dir = safe_join(profiler.output_dir, session_id)
+        if session_dir is None or not os.path.isdir(session_dir):
+            abort(404)
+        return send_from_directory(session_dir, filename, as_attachment=True)
+
+    return app
@@ -0,0 +1,107 @@
+"""
+Structured pruning sweep for a trained checkpoint.
+
+For each sparsity level the checkpoint is channel-pruned (see pruning.py),
+fine-tuned for a few epochs with BloodSmearTrainer, and evaluated for
+validation accuracy, parameter count, file size and CPU latency.
+
+Usage:
+    python prune_model.py --checkpoint models/best_model.pth --levels 0.25,0.5,0.7 --epochs 3
+"""
+import argparse
+import json
+import os
+import time
+
+from distill import evaluate_checkpoint
+from model_builder import checkpoint_architecture, load_checkpoint_model
+from pruning import prune_model
+from train_gpu_optimized import BloodSmearTrainer
+
+
+class PrunedFineTuner(BloodSmearTrainer):
+    def __init__(self, base_checkpoint, sparsity):
+        super().__init__(output_prefix=f'pruned_{round(sparsity * 100)}_')
+        self.base_checkpoint = base_checkpoint
+        self.sparsity = sparsity
+        self.channel_config = None
+
+    def create_model(self):
+        model, checkpoint = load_checkpoint_model(self.base_checkpoint, 'cpu')
+        self.architecture = checkpoint_architecture(checkpoint)
+        if self.architecture != 'efficientnet_b0':
+            raise ValueError(f"Pruning supports efficientnet_b0 checkpoints, got {self.architecture}")
+        if checkpoint['class_names'] != self.train_dataset.classes:
+            raise ValueError("Checkpoint classes do not match the dataset")
+
+        self.channel_config = prune_model(model, self.sparsity)
+        print(f"Pruned {len(self.channel_config['blocks'])} blocks at sparsity {self.sparsity:.2f}, "
+              f"head width {self.channel_config['head']}")
+        return model.train()
+
+    def checkpoint_metadata(self):
+        metadata = super().checkpoint_metadata()
+        metadata['channel_config'] = self.channel_config
+        metadata['sparsity'] = self.sparsity
+        return metadata
+
+
+def fine_tuned_checkpoint(trainer):
+    """Best checkpoint of a fine-tuning run, else its final one (best_model.pth is only
+    written when validation accuracy improves on 0); None if training never ran"""
+    for name in ('best_model.pth', 'final_model.pth'):
+        path = trainer.output_path(name)
+        if os.path.exists(path):
+            return path
+    return None
+
+
+def pruning_sweep(checkpoint_path, levels, epochs, report_path='models/pruning_report.json'):
+    rows, skipped = [], []
+    for sparsity in levels:
+        trainer = PrunedFineTuner(checkpoint_path, sparsity)
+        trainer.train(epochs=epochs)
+        model_path = fine_tuned_checkpoint(trainer)
+        if model_path is None:
+            print(f"Sparsity {sparsity:.2f}: no checkpoint written, skipped")
+            skipped.append(sparsity)
+            continue
+        row = evaluate_checkpoint(model_path, trainer.val_loader, trainer.train_dataset.classes, trainer.device)
+        row['sparsity'] = sparsity
+        rows.append(row)
+
+    if not rows:
+        print("No sparsity level produced a checkpoint; nothing to report")
+        return rows
+
+    # Unpruned reference, evaluated on the same validation loader
+    baseline = evaluate_checkpoint(checkpoint_path, trainer.val_loader, trainer.train_dataset.classes, trainer.device)
+    baseline['sparsity'] = 0.0
+    rows.insert(0, baseline)
+
+    print(f"{'Sparsity':>8} {'Val Acc':>8} {'Params':>11} {'Size MB':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for row in rows:
+        print(f"{row['sparsity']:8.2f} {row['val_acc']:7.2f}% {row['parameters']:11,d} "
+              f"{row['file_size_mb']:8.1f} {row['cpu_latency_p50_ms']:8.1f} {row['cpu_latency_p95_ms']:8.1f}")
+
+    with open(report_path, 'w') as f:
+        json.dump({'created_at': time.time(), 'checkpoint': checkpoint_path, 'levels': rows,
+                   'skipped': skipped}, f, indent=2)
+    if skipped:
+        print(f"Skipped sparsity levels without a checkpoint: {', '.join(f'{s:.2f}' for s in skipped)}")
+    print(f"Report saved to {report_path}")
+    return rows
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Prune a checkpoint at several sparsity levels')
+    parser.add_argument('--checkpoint', default='models/best_model.pth')
+    parser.add_argument('--levels', default='0.25,0.5,0.7',
+                        help='Comma-separated fractions of channels to remove')
+    parser.add_argument('--epochs', type=int, default=3, help='Fine-tuning epochs per level')
+    args = parser.parse_args()
+
+    levels = [float(level) for level in args.levels.split(',') if level.strip()]
+    if not levels:
+        parser.error('--levels needs at least one sparsity level')
+    pruning_sweep(args.checkpoint, levels, args.epochs)
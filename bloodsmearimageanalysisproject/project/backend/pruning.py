@@ -0,0 +1,137 @@
+"""
+Structured channel pruning for the EfficientNet-B0 classifier.
+
+Only channels that are internal to a unit are removed, so residual
+connections and the 1280-d pooled feature size are untouched:
+  * MBConv blocks with an expansion conv lose hidden (expanded) channels,
+    which shrinks the expand conv, depthwise conv, squeeze-excitation and
+    the project conv's input.
+  * The classifier head loses units of its 512-wide hidden layer.
+
+A pruned network is described by a `channel_config` dict stored in the
+checkpoint; `apply_channel_config` rebuilds that shape on a fresh model
+before its state dict is loaded.
+"""
+import torch
+import torch.nn as nn
+from torchvision.models.efficientnet import MBConv
+
+
+def _round_channels(n, divisor=8, minimum=8):
+    return max(minimum, int(round(n / divisor)) * divisor)
+
+
+def _new_conv(conv, in_channels, out_channels, groups=1):
+    return nn.Conv2d(
+        in_channels, out_channels, conv.kernel_size, stride=conv.stride,
+        padding=conv.padding, dilation=conv.dilation, groups=groups,
+        bias=conv.bias is not None
+    )
+
+
+def _select_conv(conv, out_idx=None, in_idx=None, depthwise=False):
+    weight = conv.weight.data
+    bias = conv.bias.data if conv.bias is not None else None
+    if out_idx is not None:
+        weight = weight[out_idx]
+        bias = bias[out_idx] if bias is not None else None
+    if in_idx is not None and not depthwise:
+        weight = weight[:, in_idx]
+
+    out_channels = weight.shape[0]
+    in_channels = out_channels if depthwise else weight.shape[1]
+    new = _new_conv(conv, in_channels, out_channels, groups=out_channels if depthwise else 1)
+    new.weight.data.copy_(weight)
+    if bias is not None:
+        new.bias.data.copy_(bias)
+    return new
+
+
+def _select_norm(norm, idx):
+    new = type(norm)(len(idx), eps=norm.eps, momentum=norm.momentum)
+    new.weight.data.copy_(norm.weight.data[idx])
+    new.bias.data.copy_(norm.bias.data[idx])
+    new.running_mean.copy_(norm.running_mean[idx])
+    new.running_var.copy_(norm.running_var[idx])
+    return new
+
+
+def _select_linear(linear, out_idx=None, in_idx=None):
+    weight = linear.weight.data
+    bias = linear.bias.data
+    if out_idx is not None:
+        weight = weight[out_idx]
+        bias = bias[out_idx]
+    if in_idx is not None:
+        weight = weight[:, in_idx]
+    new = nn.Linear(weight.shape[1], weight.shape[0])
+    new.weight.data.copy_(weight)
+    new.bias.data.copy_(bias)
+    return new
+
+
+def prunable_blocks(model):
+    """(name, MBConv) for every block that has an expansion conv"""
+    return [
+        (name, module) for name, module in model.features.named_modules()
+        if isinstance(module, MBConv) and len(module.block) == 4
+    ]
+
+
+def _prune_block(block, keep):
+    expand, depthwise, se, project = block.block
+    expand[0] = _select_conv(expand[0], out_idx=keep)
+    expand[1] = _select_norm(expand[1], keep)
+    depthwise[0] = _select_conv(depthwise[0], out_idx=keep, depthwise=True)
+    depthwise[1] = _select_norm(depthwise[1], keep)
+    se.fc1 = _select_conv(se.fc1, in_idx=keep)
+    se.fc2 = _select_conv(se.fc2, out_idx=keep)
+    project[0] = _select_conv(project[0], in_idx=keep)
+
+
+def _prune_head(classifier, keep):
+    classifier[1] = _select_linear(classifier[1], out_idx=keep)
+    classifier[3] = _select_norm(classifier[3], keep)
+    classifier[5] = _select_linear(classifier[5], in_idx=keep)
+
+
+@torch.no_grad()
+def apply_channel_config(model, channel_config):
+    """Shrink a freshly built model to the layer widths recorded in channel_config"""
+    blocks = channel_config.get('blocks', {})
+    for name, block in prunable_blocks(model):
+        if name in blocks:
+            _prune_block(block, torch.arange(blocks[name]))
+    if channel_config.get('head'):
+        _prune_head(model.classifier, torch.arange(channel_config['head']))
+    return model
+
+
+@torch.no_grad()
+def prune_model(model, sparsity, prune_head=True):
+    """
+    Remove the `sparsity` fraction of lowest-importance channels in place.
+    Importance is |gamma| of the BatchNorm following each channel, which is
+    what scales the channel's contribution at inference time.
+    Returns the channel_config describing the pruned shape.
+    """
+    channel_config = {'blocks': {}, 'head': None}
+    if sparsity <= 0:
+        return channel_config
+
+    for name, block in prunable_blocks(model):
+        gamma = block.block[0][1].weight.abs()
+        n_keep = min(len(gamma), _round_channels(len(gamma) * (1 - sparsity)))
+        keep = gamma.argsort(descending=True)[:n_keep].sort().values
+        _prune_block(block, keep)
+        channel_config['blocks'][name] = n_keep
+
+    if prune_head:
+        linear, norm = model.classifier[1], model.classifier[3]
+        importance = norm.weight.abs() * linear.weight.abs().sum(dim=1)
+        n_keep = min(len(importance), _round_channels(len(importance) * (1 - sparsity)))
+        keep = importance.argsort(descending=True)[:n_keep].sort().values
+        _prune_head(model.classifier, keep)
+        channel_config['head'] = n_keep
+
+    return channel_config
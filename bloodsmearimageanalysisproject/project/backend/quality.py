@@ -0,0 +1,146 @@
+"""
+Image-quality gate run before model inference.
+
+Scores a downsampled copy of each decoded image with a few NumPy array ops:
+
+    focus         variance of the Laplacian of the grayscale image (low = blurry)
+    brightness    mean gray level, 0-255
+    overexposed   fraction of pixels at or above 250
+    underexposed  fraction of pixels at or below 5
+    stained       fraction of pixels with HSV saturation above QUALITY_STAIN_SATURATION
+                  (Giemsa/Wright-stained cells; an empty slide or a white frame has ~none)
+
+The thresholds are not calibrated on clinical uploads, so by default only
+live auto-capture frames that fail a limit are rejected with a
+`quality_rejected` response before preprocessing and inference. Any other
+failing image is still analysed: its scores carry the `failed` checks and the
+result gets a `quality_warning`. Every analysis stores the scores under
+`quality`.
+
+Environment:
+    QUALITY_GATE               "flag" (default): reject auto frames only, flag the rest;
+                               "reject": reject every failing image; "off": never reject
+    QUALITY_MIN_FOCUS          default 15
+    QUALITY_MAX_OVEREXPOSED    default 0.5
+    QUALITY_MAX_UNDEREXPOSED   default 0.5
+    QUALITY_MIN_STAINED        default 0.01
+    QUALITY_STAIN_SATURATION   default 40
+"""
+import os
+
+from instrumentation import REGISTRY
+
+# Longest side of the copy that is scored; thresholds are calibrated at this size
+QUALITY_SIZE = 256
+
+CHECKS = REGISTRY.counter(
+    'bloodsmear_quality_checks_total', 'Images scored by the quality gate', ('outcome',))
+REJECTIONS = REGISTRY.counter(
+    'bloodsmear_quality_rejections_total', 'Images failing each quality check', ('reason',))
+
+MODES = ('flag', 'reject', 'off')
+
+MESSAGES = {
+    'blurry': 'image is out of focus',
+    'overexposed': 'image is overexposed',
+    'underexposed': 'image is too dark',
+    'no_stained_cells': 'no stained cells visible'
+}
+
+
+class QualityRejected(Exception):
+    def __init__(self, reasons, scores):
+        super().__init__('Image quality check failed: ' + ', '.join(MESSAGES[r] for r in reasons))
+        self.reasons = reasons
+        self.scores = scores
+
+    def to_dict(self):
+        return {'error': str(self), 'status': 'quality_rejected', 'reason': 'quality_rejected',
+                'reasons': self.reasons, 'quality': self.scores}
+
+
+def downsample(image, size=QUALITY_SIZE):
+    from PIL import Image
+
+    scale = size / max(image.size)
+    if scale >= 1:
+        return image
+    return image.resize((max(1, round(image.width * scale)), max(1, round(image.height * scale))), Image.BILINEAR)
+
+
+def score(image, stain_saturation=40):
+    """Quality scores for an RGB PIL image"""
+    # Imported here so routes that never score an image don't load NumPy
+    import numpy as np
+
+    small = downsample(image)
+    gray = np.asarray(small.convert('L'), dtype=np.float32)
+    saturation = np.asarray(small.convert('HSV'), dtype=np.uint8)[:, :, 1]
+
+    laplacian = (gray[:-2, 1:-1] + gray[2:, 1:-1] + gray[1:-1, :-2] + gray[1:-1, 2:]
+                 - 4 * gray[1:-1, 1:-1])
+    return {
+        'focus': round(float(laplacian.var()) if laplacian.size else 0.0, 2),
+        'brightness': round(float(gray.mean()), 2),
+        'overexposed': round(float((gray >= 250).mean()), 4),
+        'underexposed': round(float((gray <= 5).mean()), 4),
+        'stained': round(float((saturation > stain_saturation).mean()), 4)
+    }
+
+
+class QualityGate:
+    def __init__(self, min_focus=None, max_overexposed=None, max_underexposed=None, min_stained=None,
+                 stain_saturation=None, mode=None):
+        self.min_focus = min_focus if min_focus is not None else float(os.getenv('QUALITY_MIN_FOCUS', '15'))
+        self.max_overexposed = max_overexposed if max_overexposed is not None else float(
+            os.getenv('QUALITY_MAX_OVEREXPOSED', '0.5'))
+        self.max_underexposed = max_underexposed if max_underexposed is not None else float(
+            os.getenv('QUALITY_MAX_UNDEREXPOSED', '0.5'))
+        self.min_stained = min_stained if min_stained is not None else float(os.getenv('QUALITY_MIN_STAINED', '0.01'))
+        self.stain_saturation = stain_saturation if stain_saturation is not None else int(
+            os.getenv('QUALITY_STAIN_SATURATION', '40'))
+        self.mode = mode or os.getenv('QUALITY_GATE', 'flag').lower()
+        if self.mode not in MODES:
+            raise ValueError(f"QUALITY_GATE must be one of {', '.join(MODES)}, got {self.mode!r}")
+
+    def reasons(self, scores):
+        failed = []
+        if scores['focus'] < self.min_focus:
+            failed.append('blurry')
+        if scores['overexposed'] > self.max_overexposed:
+            failed.append('overexposed')
+        if scores['underexposed'] > self.max_underexposed:
+            failed.append('underexposed')
+        if scores['stained'] < self.min_stained:
+            failed.append('no_stained_cells')
+        return failed
+
+    @staticmethod
+    def warning(scores):
+        """`quality_warning` text for a result whose image was flagged, else None"""
+        failed = (scores or {}).get('failed')
+        if not failed:
+            return None
+        return 'Low image quality: ' + ', '.join(MESSAGES[r] for r in failed) + '; interpret with care'
+
+    def rejects(self, auto):
+        return self.mode == 'reject' or (self.mode == 'flag' and auto)
+
+    def check(self, image, auto=False):
+        """Scores for an accepted or flagged image; raises QualityRejected when the mode rejects it
+
+        `auto` marks live auto-capture frames, the only images rejected by default.
+        """
+        scores = score(image, self.stain_saturation)
+        failed = self.reasons(scores)
+        if not failed:
+            CHECKS.inc(outcome='accepted')
+            return scores
+        for reason in failed:
+            REJECTIONS.inc(reason=reason)
+        if not self.rejects(auto):
+            # Keep the analysis but remember what would have rejected it
+            CHECKS.inc(outcome='flagged')
+            return dict(scores, failed=failed)
+        CHECKS.inc(outcome='rejected')
+        raise QualityRejected(failed, scores)
@@ -0,0 +1,223 @@
+"""
+Shadow evaluation of a candidate model on live traffic.
+
+A sampled fraction of analyzed images is handed to a background thread that
+scores it with the candidate model after the primary response is computed.
+Handing off is a non-blocking queue put. When the queue is full, or admission
+control has requests waiting, the sample is dropped instead. The shadow
+thread itself runs at a lower OS scheduling priority, but the candidate's
+forward pass is spread over torch's intra-op pool, which it shares with the
+primary model at normal priority; skipping samples while admission is busy
+is what keeps it out of the way of live requests.
+
+Comparisons accumulate into one `shadow_reports` document per candidate,
+primary version and UTC day, through `$inc` upserts every
+SHADOW_FLUSH_SECONDS. Each document holds agreement counts, a per-class
+primary->candidate confusion table, the confidence gap, and latency
+histograms for both models.
+
+Environment:
+    SHADOW_MODEL_VERSION   registry version to evaluate, or
+    SHADOW_MODEL_PATH      checkpoint / serving artifact to evaluate
+    SHADOW_SAMPLE_RATE     fraction of requests to shadow, default 0.1
+    SHADOW_QUEUE_SIZE      pending samples before new ones are dropped, default 16
+    SHADOW_FLUSH_SECONDS   report write interval, default 60
+"""
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime
+
+from flask import jsonify
+
+from admin_auth import require_admin
+from instrumentation import REGISTRY
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+COMPARISONS = REGISTRY.counter(
+    'bloodsmear_shadow_comparisons_total', 'Shadow predictions compared with the primary model', ('outcome',))
+SKIPPED = REGISTRY.counter(
+    'bloodsmear_shadow_skipped_total', 'Sampled requests not shadowed', ('reason',))
+CANDIDATE_LOAD_SECONDS = REGISTRY.gauge(
+    'bloodsmear_shadow_model_load_seconds', 'Time taken to load the shadow candidate model')
+
+
+def _bucket(ms):
+    for bound in LATENCY_BUCKETS_MS:
+        if ms <= bound:
+            return f'le_{bound}'
+    return 'le_inf'
+
+
+def _key(name):
+    # Class names become field names in the report document
+    return str(name).replace('.', '_').replace('$', '_')
+
+
+class ShadowEvaluator:
+    def __init__(self, load_candidate, collection, candidate_version, sample_rate=0.1,
+                 queue_size=16, flush_interval=60.0, busy=None):
+        self.load_candidate = load_candidate
+        self.collection = collection
+        self.candidate_version = candidate_version
+        self.sample_rate = sample_rate
+        self.flush_interval = flush_interval
+        self.busy = busy or (lambda: False)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._candidate = None
+        self._last_error = None
+        threading.Thread(target=self._worker, name='shadow', daemon=True).start()
+
+    @classmethod
+    def from_env(cls, load_analyzer, registry, collection, busy=None):
+        """Evaluator configured from SHADOW_* variables, or None when shadowing is off"""
+        version = os.getenv('SHADOW_MODEL_VERSION')
+        path = os.getenv('SHADOW_MODEL_PATH')
+        if not (version or path):
+            return None
+        if version:
+            def load_candidate():
+                return load_analyzer(registry.path(version))
+        else:
+            version = os.path.basename(path)
+
+            def load_candidate():
+                return load_analyzer(path)
+        return cls(
+            load_candidate, collection, version,
+            sample_rate=float(os.getenv('SHADOW_SAMPLE_RATE', '0.1')),
+            queue_size=int(os.getenv('SHADOW_QUEUE_SIZE', '16')),
+            flush_interval=float(os.getenv('SHADOW_FLUSH_SECONDS', '60')),
+            busy=busy
+        )
+
+    def submit(self, image, primary_result, primary_version, primary_seconds):
+        """Offer one analyzed image; never blocks"""
+        if random.random() >= self.sample_rate:
+            return
+        if self.busy():
+            SKIPPED.inc(reason='busy')
+            return
+        try:
+            self._queue.put_nowait((image, primary_result, primary_version, primary_seconds))
+        except queue.Full:
+            SKIPPED.inc(reason='queue_full')
+
+    def _lower_priority(self):
+        # Renices this thread only: torch's intra-op workers (process-wide, and
+        # torch.set_num_threads is process-wide too) keep their priority
+        try:
+            os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), 10)
+        except (AttributeError, OSError):
+            pass
+
+    def _worker(self):
+        self._lower_priority()
+        last_flush = time.monotonic()
+        while True:
+            timeout = max(0.0, self.flush_interval - (time.monotonic() - last_flush))
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                item = None
+
+            if item is not None:
+                try:
+                    self._compare(*item)
+                except Exception as e:
+                    self._last_error = str(e)
+                    SKIPPED.inc(reason='error')
+
+            if time.monotonic() - last_flush >= self.flush_interval:
+                last_flush = time.monotonic()
+                try:
+                    self.flush()
+                except Exception as e:
+                    self._last_error = f'flush failed: {e}'
+
+    def _compare(self, image, primary_result, primary_version, primary_seconds):
+        if self._candidate is None:
+            load_start = time.perf_counter()
+            self._candidate = self.load_candidate()
+            CANDIDATE_LOAD_SECONDS.set(time.perf_counter() - load_start)
+        candidate = self._candidate
+
+        start = time.perf_counter()
+        probabilities = candidate.infer(candidate.preprocess(image).unsqueeze(0))
+        candidate_seconds = time.perf_counter() - start
+        candidate_result = candidate.format_result(probabilities[0])
+
+        primary_class = primary_result['predicted_class']
+        candidate_class = candidate_result['predicted_class']
+        agree = primary_class == candidate_class
+        COMPARISONS.inc(outcome='agree' if agree else 'disagree')
+
+        p, c = _key(primary_class), _key(candidate_class)
+        increments = {
+            'samples': 1,
+            'agree': int(agree),
+            f'per_class.{p}.samples': 1,
+            f'per_class.{p}.disagree': int(not agree),
+            f'confusion.{p}.{c}': 1,
+            'confidence_delta_sum': candidate_result['confidence'] - primary_result['confidence'],
+            'primary_ms_sum': primary_seconds * 1000,
+            'candidate_ms_sum': candidate_seconds * 1000,
+            f'primary_ms_hist.{_bucket(primary_seconds * 1000)}': 1,
+            f'candidate_ms_hist.{_bucket(candidate_seconds * 1000)}': 1,
+        }
+        with self._lock:
+            pending = self._pending.setdefault(primary_version, {})
+            for field, amount in increments.items():
+                pending[field] = pending.get(field, 0) + amount
+
+    def flush(self):
+        """Write accumulated comparisons into today's report documents"""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        day = datetime.utcnow().strftime('%Y-%m-%d')
+        for primary_version, increments in pending.items():
+            self.collection.update_one(
+                {'candidate_version': self.candidate_version, 'primary_version': primary_version, 'day': day},
+                {'$inc': increments, '$set': {'updated_at': datetime.utcnow()}},
+                upsert=True
+            )
+
+    def status(self):
+        return {
+            'candidate_version': self.candidate_version,
+            'sample_rate': self.sample_rate,
+            'queued': self._queue.qsize(),
+            'candidate_loaded': self._candidate is not None,
+            'last_error': self._last_error
+        }
+
+    def reports(self, limit=30):
+        reports = list(self.collection.find(
+            {'candidate_version': self.candidate_version}, {'_id': 0}
+        ).sort('day', -1).limit(limit))
+        for report in reports:
+            samples = report.get('samples', 0)
+            if samples:
+                report['agreement_rate'] = report.get('agree', 0) / samples
+                report['mean_confidence_delta'] = report.get('confidence_delta_sum', 0) / samples
+                report['primary_ms_mean'] = report.get('primary_ms_sum', 0) / samples
+                report['candidate_ms_mean'] = report.get('candidate_ms_sum', 0) / samples
+        return reports
+
+
+def init_app(app, evaluator):
+    """Register the admin shadow-report endpoint"""
+
+    @app.route('/api/admin/shadow', methods=['GET'])
+    @require_admin
+    def shadow_report():
+        if evaluator is None:
+            return jsonify({'enabled': False})
+        return jsonify({'enabled': True, 'status': evaluator.status(), 'reports': evaluator.reports()})
+
+    return app
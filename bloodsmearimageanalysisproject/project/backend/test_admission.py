@@ -0,0 +1,91 @@
+"""
+Admission control checks: a live frame must not supersede a queued async job.
+
+    python test_admission.py
+"""
+import threading
+import time
+
+from admission import BACKGROUND, INTERACTIVE, AdmissionController, AdmissionRejected
+
+
+def _acquire_in_thread(controller, user_id, priority, deadline):
+    outcome = {}
+
+    def run():
+        try:
+            outcome['ticket'] = controller.acquire(user_id, priority, deadline)
+        except AdmissionRejected as e:
+            outcome['rejected'] = e.reason
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    return thread, outcome
+
+
+def _wait_queued(controller, count, timeout=2.0):
+    end = time.monotonic() + timeout
+    while sum(controller.snapshot()['queued'].values()) < count:
+        assert time.monotonic() < end, 'request never reached the queue'
+        time.sleep(0.01)
+
+
+def test_live_frame_does_not_supersede_async_job():
+    controller = AdmissionController(slots=1, per_user_limit=3)
+    holder = controller.acquire('other', INTERACTIVE)
+
+    # ?async=1 job: background priority from classify(), but no deadline
+    job_thread, job = _acquire_in_thread(controller, 'user', BACKGROUND, None)
+    _wait_queued(controller, 1)
+    frame_thread, frame = _acquire_in_thread(controller, 'user', BACKGROUND, 5.0)
+    _wait_queued(controller, 2)
+
+    controller.release(holder)
+    job_thread.join(2)
+    assert 'ticket' in job, f'async job was dropped: {job}'
+    controller.release(job['ticket'])
+    frame_thread.join(2)
+    assert 'ticket' in frame, f'live frame was dropped: {frame}'
+    controller.release(frame['ticket'])
+
+
+def test_live_frame_supersedes_older_live_frame():
+    controller = AdmissionController(slots=1, per_user_limit=3)
+    holder = controller.acquire('other', INTERACTIVE)
+
+    old_thread, old = _acquire_in_thread(controller, 'user', BACKGROUND, 5.0)
+    _wait_queued(controller, 1)
+    new_thread, new = _acquire_in_thread(controller, 'user', BACKGROUND, 5.0)
+    old_thread.join(2)
+    assert old.get('rejected') == 'superseded', old
+
+    controller.release(holder)
+    new_thread.join(2)
+    assert 'ticket' in new, new
+    controller.release(new['ticket'])
+
+
+def test_freed_slots_admit_every_waiter():
+    controller = AdmissionController(slots=2, per_user_limit=3)
+    holders = [controller.acquire('other', INTERACTIVE) for _ in range(2)]
+
+    job_thread, job = _acquire_in_thread(controller, 'user', BACKGROUND, None)
+    _wait_queued(controller, 1)
+    upload_thread, upload = _acquire_in_thread(controller, 'user', INTERACTIVE, None)
+    _wait_queued(controller, 2)
+
+    for holder in holders:
+        controller.release(holder)
+    upload_thread.join(2)
+    job_thread.join(2)
+    assert 'ticket' in upload, f'upload was not admitted: {upload}'
+    assert 'ticket' in job, f'async job was not admitted: {job}'
+    controller.release(upload['ticket'])
+    controller.release(job['ticket'])
+
+
+if __name__ == '__main__':
+    for check in (test_live_frame_does_not_supersede_async_job, test_live_frame_supersedes_older_live_frame,
+                  test_freed_slots_admit_every_waiter):
+        check()
+        print(f'ok  {check.__name__}')
@@ -0,0 +1,43 @@
+"""
+Dataset manifest checks: saving the manifest must not make it stale again.
+
+    python test_dataset_manifest.py
+"""
+import os
+import tempfile
+
+from PIL import Image
+
+from dataset_manifest import DatasetManifest
+
+
+def _make_dataset(root):
+    for class_name in ('Basophil', 'Eosinophil'):
+        os.makedirs(os.path.join(root, class_name))
+        for i in range(3):
+            Image.new('RGB', (8, 8)).save(os.path.join(root, class_name, f'{i}.png'))
+
+
+def test_second_load_skips_update():
+    with tempfile.TemporaryDirectory() as tmp:
+        root = os.path.join(tmp, 'train')
+        _make_dataset(root)
+
+        first = DatasetManifest.load_or_build(root)
+        assert len(first) == 6, len(first)
+        assert first.class_counts == [3, 3], first.class_counts
+
+        calls = []
+        original_update = DatasetManifest.update
+        DatasetManifest.update = lambda self: calls.append(self) or original_update(self)
+        try:
+            second = DatasetManifest.load_or_build(root)
+        finally:
+            DatasetManifest.update = original_update
+        assert not calls, 'manifest was rebuilt although no image changed'
+        assert second.class_counts == [3, 3], second.class_counts
+
+
+if __name__ == '__main__':
+    test_second_load_skips_update()
+    print('ok  test_second_load_skips_update')
@@ -0,0 +1,58 @@
+"""
+Conditional request checks: a 304 carries the same ETag as the 200 it revalidates.
+
+    python test_http_cache.py
+"""
+from flask import Flask, jsonify
+
+import http_cache
+
+PAYLOAD = {'analyses': [{'analysis_id': str(i), 'notes': 'x' * 64} for i in range(64)]}
+
+
+def _client():
+    app = Flask(__name__)
+    http_cache.init_app(app)
+
+    @app.route('/results')
+    @http_cache.conditional(lambda: 'v1')
+    def results():
+        return jsonify(PAYLOAD)
+
+    return app.test_client()
+
+
+def _revalidate(encoding):
+    client = _client()
+    first = client.get('/results', headers={'Accept-Encoding': encoding})
+    assert first.status_code == 200, first.status_code
+    etag = first.headers['ETag']
+    second = client.get('/results', headers={'Accept-Encoding': encoding, 'If-None-Match': etag})
+    assert second.status_code == 304, second.status_code
+    assert second.headers['ETag'] == etag, (second.headers['ETag'], etag)
+    return first
+
+
+def test_gzip_304_etag_matches_200():
+    first = _revalidate('gzip')
+    assert first.headers['Content-Encoding'] == 'gzip'
+    assert first.headers['ETag'].endswith('-gzip"')
+
+
+def test_identity_304_etag_matches_200():
+    first = _revalidate('identity')
+    assert 'Content-Encoding' not in first.headers
+
+
+def test_changed_coding_gets_full_response():
+    client = _client()
+    etag = client.get('/results', headers={'Accept-Encoding': 'gzip'}).headers['ETag']
+    response = client.get('/results', headers={'Accept-Encoding': 'identity', 'If-None-Match': etag})
+    assert response.status_code == 200, response.status_code
+
+
+if __name__ == '__main__':
+    for check in (test_gzip_304_etag_matches_200, test_identity_304_etag_matches_200,
+                  test_changed_coding_gets_full_response):
+        check()
+        print(f'ok  {check.__name__}')
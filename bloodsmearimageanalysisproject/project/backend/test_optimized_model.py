@@ -0,0 +1,110 @@
+"""
+Check that the inference-optimized model matches the model as loaded, and compare latency.
+
+Loads the same weights twice: once as-is (eval mode), once through
+model_optimization.optimize_for_inference. Compares class probabilities on
+random tensors and on synthetic smear images, then times the forward pass of
+both at several batch sizes on CPU. Exits with status 1 when the outputs
+differ by more than the tolerance or any top-1 prediction changes.
+
+Usage:
+    python test_optimized_model.py                          # models/best_model.pth
+    python test_optimized_model.py --random-weights --compile jit
+"""
+import argparse
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+import torch.nn as nn
+import torchvision.transforms as transforms
+
+from benchmark_inference import random_weight_checkpoint, synthetic_smear
+from model_builder import IMAGENET_MEAN, IMAGENET_STD, IMAGE_SIZE, load_model
+from model_optimization import COMPILE_MODES, optimize_for_inference
+
+
+def randomize_batchnorm_stats(model, seed=0):
+    # Fresh BatchNorms have mean 0 / var 1, which would make folding trivially exact
+    generator = torch.Generator().manual_seed(seed)
+    for module in model.modules():
+        if isinstance(module, (nn.BatchNorm1d, nn.BatchNorm2d)):
+            module.running_mean.copy_(torch.randn(module.num_features, generator=generator) * 0.1)
+            module.running_var.copy_(torch.rand(module.num_features, generator=generator) + 0.5)
+
+
+def sample_inputs(count=8):
+    rng = np.random.default_rng(0)
+    transform = transforms.Compose([
+        transforms.Resize((IMAGE_SIZE, IMAGE_SIZE)),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=IMAGENET_MEAN, std=IMAGENET_STD)
+    ])
+    smears = torch.stack([transform(synthetic_smear(640, 480, rng)) for _ in range(count)])
+    noise = torch.randn(count, 3, IMAGE_SIZE, IMAGE_SIZE, generator=torch.Generator().manual_seed(0))
+    return torch.cat([smears, noise])
+
+
+def forward(model, inputs, memory_format):
+    with torch.no_grad():
+        return torch.softmax(model(inputs.contiguous(memory_format=memory_format)), dim=1)
+
+
+def latency_ms(model, batch_size, memory_format, runs, warmup=5):
+    inputs = torch.randn(batch_size, 3, IMAGE_SIZE, IMAGE_SIZE)
+    timings = []
+    for i in range(warmup + runs):
+        start = time.perf_counter()
+        forward(model, inputs, memory_format)
+        if i >= warmup:
+            timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings)
+
+
+def check_optimized_model(args):
+    device = torch.device('cpu')
+    model_path = random_weight_checkpoint() if args.random_weights else args.model
+
+    reference, _ = load_model(model_path, device)
+    candidate, _ = load_model(model_path, device)
+    if args.random_weights:
+        randomize_batchnorm_stats(reference)
+        randomize_batchnorm_stats(candidate)
+
+    optimized, summary = optimize_for_inference(candidate, compile_mode=args.compile)
+    print(f"Optimization: {summary}")
+
+    inputs = sample_inputs()
+    expected = forward(reference, inputs, torch.contiguous_format)
+    actual = forward(optimized, inputs, torch.channels_last)
+    max_diff = (expected - actual).abs().max().item()
+    top1_changed = int((expected.argmax(1) != actual.argmax(1)).sum())
+    print(f"Max probability difference: {max_diff:.2e} (tolerance {args.tolerance:.0e}), "
+          f"top-1 changed on {top1_changed}/{len(inputs)} inputs")
+
+    print(f"{'Batch':>6} {'Original ms':>12} {'Optimized ms':>13} {'Speedup':>8}")
+    for batch_size in args.batch_sizes:
+        before = latency_ms(reference, batch_size, torch.contiguous_format, args.runs)
+        after = latency_ms(optimized, batch_size, torch.channels_last, args.runs)
+        print(f"{batch_size:>6} {before:12.2f} {after:13.2f} {before / after:7.2f}x")
+
+    return max_diff <= args.tolerance and top1_changed == 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Equivalence and latency check for the optimized model')
+    parser.add_argument('--model', default='models/best_model.pth')
+    parser.add_argument('--random-weights', action='store_true', help='Use an untrained model')
+    parser.add_argument('--compile', default='off', choices=COMPILE_MODES)
+    parser.add_argument('--batch-sizes', type=int, nargs='+', default=[1, 8])
+    parser.add_argument('--runs', type=int, default=30)
+    parser.add_argument('--tolerance', type=float, default=1e-4)
+    args = parser.parse_args()
+
+    if check_optimized_model(args):
+        print("✅ Optimized model matches the original")
+    else:
+        print("❌ Optimized model differs from the original")
+        sys.exit(1)
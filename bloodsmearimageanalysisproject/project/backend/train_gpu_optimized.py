@@ -3,17 +3,22 @@ import torch.nn as nn
 import torch.optim as optim
 from torch.utils.data import DataLoader, WeightedRandomSampler
 import torchvision.transforms as transforms
-import torchvision.models as models
-from torchvision.datasets import ImageFolder
 import matplotlib.pyplot as plt
 import numpy as np
 import time
 import os
-from sklearn.metrics import confusion_matrix
 from tqdm import tqdm
+import argparse
+
+from feature_cache import FeatureCache, backbone_hash
+from metrics import MetricsAccumulator, MetricsLogger
+from dataset_manifest import DatasetManifest, ManifestImageFolder
+from model_builder import DEFAULT_ARCHITECTURE, build_model
 
 class BloodSmearTrainer:
-    def __init__(self):
+    def __init__(self, architecture=DEFAULT_ARCHITECTURE, output_prefix=''):
+        self.architecture = architecture
+        self.output_prefix = output_prefix
         self.device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
         print(f"Using device: {self.device}")
         
@@ -22,9 +27,13 @@ class BloodSmearTrainer:
             print(f"GPU Memory: {torch.cuda.get_device_properties(0).total_memory / 1024**3:.1f} GB")
         
         os.makedirs('models', exist_ok=True)
+        self.metrics_logger = MetricsLogger(self.output_path('metrics.jsonl'))
+    
+    def output_path(self, name):
+        return os.path.join('models', f'{self.output_prefix}{name}')
         
     def setup_data(self):
-        base_path = r'C:\Users\SIVA\Desktop\datasets'
+        base_path = os.getenv('DATASET_PATH', r'C:\Users\SIVA\Desktop\datasets')
         
         train_path = os.path.join(base_path, 'train')
         val_path = os.path.join(base_path, 'val')
@@ -50,20 +59,20 @@ class BloodSmearTrainer:
             transforms.ToTensor(),
             transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
         ])
+        self.val_transform = val_transform
+        
+        self.train_manifest = DatasetManifest.load_or_build(train_path)
+        self.val_manifest = DatasetManifest.load_or_build(val_path)
         
-        self.train_dataset = ImageFolder(train_path, transform=train_transform)
-        self.val_dataset = ImageFolder(val_path, transform=val_transform)
+        self.train_dataset = ManifestImageFolder(self.train_manifest, transform=train_transform)
+        self.val_dataset = ManifestImageFolder(self.val_manifest, transform=val_transform)
         
-        class_counts = []
-        for class_idx in range(len(self.train_dataset.classes)):
-            count = sum(1 for _, label in self.train_dataset.samples if label == class_idx)
-            class_counts.append(count)
+        class_counts = self.train_manifest.class_counts
         
         print(f"Classes found: {self.train_dataset.classes}")
         print(f"Class distribution: {class_counts}")
         
-        class_weights = 1.0 / torch.tensor(class_counts, dtype=torch.float)
-        sample_weights = [class_weights[label] for _, label in self.train_dataset.samples]
+        sample_weights = self.train_manifest.sample_weights()
         
         sampler = WeightedRandomSampler(sample_weights, len(sample_weights), replacement=True)
         
@@ -86,19 +95,14 @@ class BloodSmearTrainer:
         
         return class_counts
     
+    def create_model(self):
+        return build_model(self.architecture, len(self.train_dataset.classes), pretrained=True)
+    
+    def checkpoint_metadata(self):
+        return {'architecture': self.architecture}
+    
     def setup_model(self, class_counts):
-        self.model = models.efficientnet_b0(weights='IMAGENET1K_V1')
-        
-        in_features = self.model.classifier[1].in_features
-        self.model.classifier = nn.Sequential(
-            nn.Dropout(0.3),
-            nn.Linear(in_features, 512),
-            nn.ReLU(),
-            nn.BatchNorm1d(512),
-            nn.Dropout(0.2),
-            nn.Linear(512, len(self.train_dataset.classes))
-        )
-        
+        self.model = self.create_model()
         self.model = self.model.to(self.device)
         
         class_weights = torch.tensor(class_counts, dtype=torch.float)
@@ -111,6 +115,9 @@ class BloodSmearTrainer:
         self.optimizer = optim.AdamW(self.model.parameters(), lr=1e-4, weight_decay=0.01)
         
         self.scheduler = optim.lr_scheduler.StepLR(self.optimizer, step_size=10, gamma=0.5)
+    
+    def compute_loss(self, images, outputs, labels):
+        return self.criterion(outputs, labels)
         
     def train_epoch(self, epoch):
         self.model.train()
@@ -127,7 +134,7 @@ class BloodSmearTrainer:
                 self.optimizer.zero_grad()
                 
                 outputs = self.model(images)
-                loss = self.criterion(outputs, labels)
+                loss = self.compute_loss(images, outputs, labels)
                 loss.backward()
                 
                 torch.nn.utils.clip_grad_norm_(self.model.parameters(), max_norm=1.0)
@@ -157,13 +164,9 @@ class BloodSmearTrainer:
         
         return epoch_loss, epoch_acc
     
-    def validate(self, epoch):
+    def validate(self, epoch, keep_outputs=False):
         self.model.eval()
-        val_loss = 0.0
-        correct = 0
-        total = 0
-        all_preds = []
-        all_labels = []
+        metrics = MetricsAccumulator(self.train_dataset.classes, device=self.device, keep_outputs=keep_outputs)
         
         with torch.no_grad():
             for images, labels in tqdm(self.val_loader, desc='Validating'):
@@ -172,33 +175,24 @@ class BloodSmearTrainer:
                     
                     outputs = self.model(images)
                     loss = self.criterion(outputs, labels)
-                    
-                    val_loss += loss.item()
-                    _, predicted = torch.max(outputs, 1)
-                    total += labels.size(0)
-                    correct += (predicted == labels).sum().item()
-                    
-                    all_preds.extend(predicted.cpu().numpy())
-                    all_labels.extend(labels.cpu().numpy())
+                    metrics.update(outputs, labels, loss.item())
                     
                 except Exception as e:
                     print(f"Validation error: {e}")
                     continue
         
-        val_loss /= len(self.val_loader)
-        val_acc = 100.0 * correct / total
+        results = metrics.compute()
+        if keep_outputs:
+            # (probabilities, labels) per validation sample, e.g. for tune_cascade.py
+            self.val_outputs = metrics.outputs()
         
         if epoch % 5 == 0:
-            print("Class-wise Validation Accuracy:")
-            cm = confusion_matrix(all_labels, all_preds)
-            for i, class_name in enumerate(self.train_dataset.classes):
-                if i < len(cm):
-                    class_correct = cm[i, i]
-                    class_total = cm[i].sum()
-                    class_acc = 100.0 * class_correct / class_total if class_total > 0 else 0
-                    print(f'  {class_name:25}: {class_acc:5.1f}% ({class_correct:3d}/{class_total:3d})')
-        
-        return val_loss, val_acc, all_preds, all_labels
+            print("Class-wise Validation Metrics:")
+            for row in results['per_class']:
+                print(f"  {row['class']:25}: recall {100 * row['recall']:5.1f}%  "
+                      f"precision {100 * row['precision']:5.1f}%  F1 {row['f1']:.3f} ({row['support']:3d})")
+        
+        return results['loss'], results['accuracy'], results
     
     def train(self, epochs=30):
         if torch.cuda.is_available():
@@ -219,12 +213,23 @@ class BloodSmearTrainer:
             start_time = time.time()
             
             train_loss, train_acc = self.train_epoch(epoch)
-            val_loss, val_acc, all_preds, all_labels = self.validate(epoch)
+            val_loss, val_acc, val_metrics = self.validate(epoch)
             
+            lr = self.optimizer.param_groups[0]['lr']
             self.scheduler.step()
             
             epoch_time = time.time() - start_time
             
+            self.metrics_logger.log({
+                'mode': 'full',
+                'epoch': epoch,
+                'lr': lr,
+                'epoch_time': epoch_time,
+                'train_loss': train_loss,
+                'train_acc': train_acc,
+                'val': val_metrics
+            })
+            
             train_losses.append(train_loss)
             val_losses.append(val_loss)
             train_accs.append(train_acc)
@@ -233,6 +238,7 @@ class BloodSmearTrainer:
             print(f'Epoch {epoch:2d}/{epochs}:')
             print(f'  Train Loss: {train_loss:.4f}, Train Acc: {train_acc:6.2f}%')
             print(f'  Val Loss:   {val_loss:.4f}, Val Acc:   {val_acc:6.2f}%')
+            print(f'  Macro F1:   {val_metrics["macro_f1"]:.4f}, ECE: {val_metrics["ece"]:.4f}')
             print(f'  Time:       {epoch_time:6.2f}s')
             print(f'  Best Acc:   {best_acc:6.2f}%')
             
@@ -244,8 +250,9 @@ class BloodSmearTrainer:
                     'optimizer_state_dict': self.optimizer.state_dict(),
                     'val_acc': val_acc,
                     'class_names': self.train_dataset.classes,
-                    'class_distribution': class_counts
-                }, 'models/best_model.pth')
+                    'class_distribution': class_counts,
+                    **self.checkpoint_metadata()
+                }, self.output_path('best_model.pth'))
                 print(f'  New best model saved! Accuracy: {val_acc:.2f}%')
             
             if epoch % 10 == 0:
@@ -254,7 +261,8 @@ class BloodSmearTrainer:
                     'model_state_dict': self.model.state_dict(),
                     'optimizer_state_dict': self.optimizer.state_dict(),
                     'val_acc': val_acc,
-                }, f'models/checkpoint_epoch_{epoch}.pth')
+                    **self.checkpoint_metadata()
+                }, self.output_path(f'checkpoint_epoch_{epoch}.pth'))
                 
             if torch.cuda.is_available():
                 torch.cuda.empty_cache()
@@ -265,8 +273,9 @@ class BloodSmearTrainer:
             'class_names': self.train_dataset.classes,
             'val_acc': val_acc,
             'train_acc': train_acc,
-            'class_distribution': class_counts
-        }, 'models/final_model.pth')
+            'class_distribution': class_counts,
+            **self.checkpoint_metadata()
+        }, self.output_path('final_model.pth'))
         
         print(f"Training completed! Best accuracy: {best_acc:.2f}%")
         
@@ -274,6 +283,134 @@ class BloodSmearTrainer:
         
         return best_acc
     
+    def train_head_only(self, epochs=100, checkpoint_path='models/best_model.pth',
+                        cache_dir='models/feature_cache', batch_size=256, lr=1e-3):
+        """
+        Retrain only the classifier head on cached backbone features.
+        The frozen backbone runs once per new image; every epoch after that
+        reads pooled 1280-d features from the memory-mapped cache. The best
+        head is saved as head_best_model.pth, so the source checkpoint is
+        never overwritten.
+        """
+        class_counts = self.setup_data()
+        if class_counts is None:
+            return 0.0
+        
+        self.setup_model(class_counts)
+        
+        if os.path.exists(checkpoint_path):
+            checkpoint = torch.load(checkpoint_path, map_location=self.device, weights_only=False)
+            current = self.model.state_dict()
+            # Keep the trained backbone; reuse head weights only where shapes still match
+            compatible, skipped = {}, []
+            for k, v in checkpoint['model_state_dict'].items():
+                if k in current and current[k].shape == v.shape:
+                    compatible[k] = v
+                else:
+                    skipped.append(k)
+            self.model.load_state_dict(compatible, strict=False)
+            print(f"Backbone loaded from {checkpoint_path}")
+            if skipped:
+                print(f"Skipped {len(skipped)} keys missing or with a different shape: {', '.join(skipped)}")
+        else:
+            print(f"No checkpoint at {checkpoint_path}, using ImageNet backbone")
+        
+        for param in self.model.features.parameters():
+            param.requires_grad = False
+        
+        cache = FeatureCache(cache_dir, backbone_hash(self.model.features))
+        train_paths = [path for path, _ in self.train_dataset.samples]
+        val_paths = [path for path, _ in self.val_dataset.samples]
+        _, train_rows = cache.extract(self.model, train_paths, self.val_transform, self.device,
+                                      hashes=self.train_manifest.hashes)
+        _, val_rows = cache.extract(self.model, val_paths, self.val_transform, self.device,
+                                    hashes=self.val_manifest.hashes)
+        features = cache.features()
+        
+        train_labels = torch.tensor(self.train_manifest.labels)
+        val_labels = torch.tensor(self.val_manifest.labels)
+        
+        sampler_weights = self.train_manifest.sample_weights()
+        
+        head = self.model.classifier
+        optimizer = optim.AdamW(head.parameters(), lr=lr, weight_decay=0.01)
+        scheduler = optim.lr_scheduler.CosineAnnealingLR(optimizer, T_max=epochs)
+        
+        best_acc = 0.0
+        print(f"Training classifier head for {epochs} epochs on {len(cache)} cached features")
+        
+        for epoch in range(1, epochs + 1):
+            start_time = time.time()
+            head.train()
+            order = torch.multinomial(sampler_weights, len(train_rows), replacement=True)
+            running_loss, correct, total = 0.0, 0, 0
+            
+            for start in range(0, len(order), batch_size):
+                idx = order[start:start + batch_size]
+                # BatchNorm1d cannot train on a single sample
+                if len(idx) < 2:
+                    continue
+                feats = torch.from_numpy(
+                    features[train_rows[idx.numpy()]].astype(np.float32)
+                ).to(self.device)
+                labels = train_labels[idx].to(self.device)
+                
+                optimizer.zero_grad()
+                outputs = head(feats)
+                loss = self.criterion(outputs, labels)
+                loss.backward()
+                optimizer.step()
+                
+                running_loss += loss.item() * len(idx)
+                correct += (outputs.argmax(1) == labels).sum().item()
+                total += len(idx)
+            
+            scheduler.step()
+            
+            head.eval()
+            metrics = MetricsAccumulator(self.train_dataset.classes, device=self.device)
+            with torch.no_grad():
+                for start in range(0, len(val_rows), batch_size):
+                    feats = torch.from_numpy(
+                        features[val_rows[start:start + batch_size]].astype(np.float32)
+                    ).to(self.device)
+                    labels = val_labels[start:start + batch_size].to(self.device)
+                    outputs = head(feats)
+                    metrics.update(outputs, labels, self.criterion(outputs, labels).item())
+            val_metrics = metrics.compute()
+            
+            train_acc = 100.0 * correct / max(total, 1)
+            val_acc = val_metrics['accuracy']
+            self.metrics_logger.log({
+                'mode': 'head_only',
+                'epoch': epoch,
+                'train_loss': running_loss / max(total, 1),
+                'train_acc': train_acc,
+                'val': val_metrics
+            })
+            print(f'Epoch {epoch:3d}/{epochs}: Loss {running_loss / max(total, 1):.4f}, '
+                  f'Train Acc {train_acc:6.2f}%, Val Acc {val_acc:6.2f}%, '
+                  f'Time {time.time() - start_time:5.2f}s')
+            
+            if val_acc > best_acc:
+                best_acc = val_acc
+                torch.save({
+                    'epoch': epoch,
+                    'model_state_dict': self.model.state_dict(),
+                    'val_acc': val_acc,
+                    'class_names': self.train_dataset.classes,
+                    'class_distribution': class_counts,
+                    **self.checkpoint_metadata(),
+                    'training_mode': 'head_only',
+                    'backbone_hash': cache.weights_hash
+                }, self.output_path('head_best_model.pth'))
+                print(f'  New best model saved! Accuracy: {val_acc:.2f}%')
+        
+        print(f"Head-only training completed! Best accuracy: {best_acc:.2f}%")
+        # Written next to, never over, the checkpoint it started from
+        print(f"Saved {self.output_path('head_best_model.pth')}; register it to serve it")
+        return best_acc
+    
     def plot_results(self, train_losses, val_losses, train_accs, val_accs):
         plt.figure(figsize=(15, 5))
         
@@ -296,12 +433,26 @@ class BloodSmearTrainer:
         plt.grid(True, alpha=0.3)
         
         plt.tight_layout()
-        plt.savefig('training_results.png', dpi=300, bbox_inches='tight')
-        plt.show()
+        plt.savefig(f'{self.output_prefix}training_results.png', dpi=300, bbox_inches='tight')
+        plt.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Train the blood smear classifier')
+    parser.add_argument('--epochs', type=int, default=None)
+    parser.add_argument('--head-only', action='store_true',
+                        help='Freeze the backbone and train the classifier head on cached features')
+    parser.add_argument('--checkpoint', default='models/best_model.pth',
+                        help='Checkpoint providing the backbone for --head-only')
+    parser.add_argument('--cache-dir', default='models/feature_cache')
+    args = parser.parse_args()
+    
     trainer = BloodSmearTrainer()
-    best_accuracy = trainer.train(epochs=30)
+    if args.head_only:
+        best_accuracy = trainer.train_head_only(
+            epochs=args.epochs or 100, checkpoint_path=args.checkpoint, cache_dir=args.cache_dir
+        )
+    else:
+        best_accuracy = trainer.train(epochs=args.epochs or 30)
     
     if best_accuracy > 90:
         print(f"Excellent! Model achieved {best_accuracy:.2f}% accuracy")
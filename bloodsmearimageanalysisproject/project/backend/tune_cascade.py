@@ -0,0 +1,154 @@
+"""
+Tune the confidence thresholds of the two-stage inference cascade.
+
+Runs the validation set through the first stage and the full model with
+BloodSmearTrainer.validate, then picks the lowest global threshold whose
+cascade accuracy stays within --max-drop points of the full model, i.e. the
+one that lets the first stage answer the most images. Per-class overrides are
+then lowered greedily, one predicted class at a time, as long as the overall
+accuracy target still holds. The result is the config cascade.py serves with
+(set CASCADE_CONFIG).
+
+Usage:
+    python tune_cascade.py --first models/student_best_model.pth
+    python tune_cascade.py --first-resolution 160 --max-drop 0.25
+"""
+import argparse
+import json
+import os
+
+import torch
+import torch.nn as nn
+
+from cascade import downsample
+from model_builder import load_model
+from train_gpu_optimized import BloodSmearTrainer
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+CANDIDATES = [round(0.5 + 0.005 * i, 3) for i in range(100)] + [1.01]
+
+
+def config_model_path(path):
+    """--first as the server resolves it: relative to the backend directory (as
+    ensure_model_file does) when the file is inside it, else absolute"""
+    path = os.path.abspath(path)
+    if os.path.commonpath([path, BASE_DIR]) == BASE_DIR:
+        return os.path.relpath(path, BASE_DIR)
+    return path
+
+
+class ReducedResolution(nn.Module):
+    """The full model applied to a downsampled batch"""
+
+    def __init__(self, model, resolution):
+        super().__init__()
+        self.model = model
+        self.resolution = resolution
+
+    def forward(self, inputs):
+        return self.model(downsample(inputs, self.resolution))
+
+
+def validation_outputs(trainer, model):
+    trainer.model = model
+    loss, accuracy, _ = trainer.validate(epoch=1, keep_outputs=True)
+    probabilities, labels = trainer.val_outputs
+    return probabilities, labels, accuracy
+
+
+def route(first_probs, full_probs, labels, thresholds):
+    """(cascade accuracy %, share of images answered by the first stage)"""
+    confidence, predicted = first_probs.max(1)
+    keep = confidence >= thresholds[predicted]
+    final = torch.where(keep, predicted, full_probs.argmax(1))
+    return 100.0 * (final == labels).float().mean().item(), keep.float().mean().item()
+
+
+def tune(first_probs, full_probs, labels, class_names, target, min_samples):
+    num_classes = len(class_names)
+
+    threshold = CANDIDATES[-1]
+    for candidate in CANDIDATES:
+        accuracy, _ = route(first_probs, full_probs, labels, torch.full((num_classes,), candidate))
+        if accuracy >= target:
+            threshold = candidate
+            break
+
+    thresholds = torch.full((num_classes,), threshold)
+    predicted = first_probs.argmax(1)
+    per_class = {}
+    for c, name in enumerate(class_names):
+        # Too few predictions of this class to trust a separate threshold
+        if int((predicted == c).sum()) < min_samples:
+            continue
+        for candidate in CANDIDATES:
+            if candidate >= threshold:
+                break
+            trial = thresholds.clone()
+            trial[c] = candidate
+            if route(first_probs, full_probs, labels, trial)[0] >= target:
+                thresholds = trial
+                per_class[name] = candidate
+                break
+    return threshold, per_class, thresholds
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Tune cascade thresholds on the validation set')
+    parser.add_argument('--full', default='models/best_model.pth', help='Full model checkpoint or artifact')
+    stage = parser.add_mutually_exclusive_group(required=True)
+    stage.add_argument('--first', help='First-stage model (e.g. the distilled student)')
+    stage.add_argument('--first-resolution', type=int, help='Use the full model at this input size')
+    parser.add_argument('--max-drop', type=float, default=0.5,
+                        help='Allowed accuracy loss versus the full model, in percentage points')
+    parser.add_argument('--min-samples', type=int, default=20,
+                        help='Predictions a class needs before it gets its own threshold')
+    parser.add_argument('-o', '--output', default='models/cascade.json')
+    args = parser.parse_args()
+
+    trainer = BloodSmearTrainer()
+    if trainer.setup_data() is None:
+        raise SystemExit('Validation data not found; set DATASET_PATH')
+    trainer.criterion = nn.CrossEntropyLoss()
+    class_names = trainer.train_dataset.classes
+
+    full_model, metadata = load_model(args.full, trainer.device)
+    if metadata['class_names'] != class_names:
+        raise SystemExit(f"Model classes {metadata['class_names']} do not match dataset classes {class_names}")
+
+    if args.first:
+        first_model, first_metadata = load_model(args.first, trainer.device)
+        if first_metadata['class_names'] != class_names:
+            raise SystemExit(f"First-stage classes {first_metadata['class_names']} do not match {class_names}")
+    else:
+        first_model = ReducedResolution(full_model, args.first_resolution)
+
+    first_probs, labels, first_acc = validation_outputs(trainer, first_model)
+    full_probs, _, full_acc = validation_outputs(trainer, full_model)
+
+    target = full_acc - args.max_drop
+    threshold, per_class, thresholds = tune(first_probs, full_probs, labels, class_names, target, args.min_samples)
+    cascade_acc, first_share = route(first_probs, full_probs, labels, thresholds)
+
+    print(f"First stage: {first_acc:.2f}%  Full model: {full_acc:.2f}%  Target: {target:.2f}%")
+    print(f"Threshold {threshold:.3f}, {len(per_class)} per-class overrides")
+    print(f"Cascade: {cascade_acc:.2f}%, first stage answers {first_share:.1%} of images")
+
+    config = {
+        'first_stage': config_model_path(args.first) if args.first else None,
+        'first_resolution': args.first_resolution,
+        'threshold': threshold,
+        'per_class': per_class,
+        'validation': {
+            'samples': len(labels),
+            'first_stage_accuracy': first_acc,
+            'full_accuracy': full_acc,
+            'cascade_accuracy': cascade_acc,
+            'first_stage_share': first_share,
+            'max_drop': args.max_drop
+        }
+    }
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w') as f:
+        json.dump(config, f, indent=2)
+    print(f"Cascade config saved to {args.output}")
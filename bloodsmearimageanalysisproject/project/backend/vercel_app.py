@@ -1,21 +1,18 @@
 """
 Vercel-compatible serverless version of the Flask app
 """
-import torch
-import torch.nn as nn
 from flask import Flask, request, jsonify
 from flask_cors import CORS
 from pymongo import MongoClient
 from datetime import datetime, timedelta
-import base64
-from PIL import Image
-import io
 import os
+import threading
 import uuid
-import torchvision.transforms as transforms
-import torchvision.models as models
+
+from json_provider import OrjsonProvider
 
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)
 
 # MongoDB Configuration - Use environment variable
@@ -32,95 +29,27 @@ try:
 except Exception as e:
     print(f"MongoDB connection error: {e}")
 
-class BloodSmearAnalyzer:
-    _instance = None
-    
-    def __new__(cls):
-        if cls._instance is None:
-            cls._instance = super(BloodSmearAnalyzer, cls).__new__(cls)
-            cls._instance._initialized = False
-        return cls._instance
-    
-    def __init__(self):
-        if self._initialized:
-            return
-            
-        self.device = torch.device('cpu')  # Vercel uses CPU
-        
-        # Model will be loaded from cloud storage or included in deployment
-        model_path = os.environ.get('MODEL_PATH', 'models/best_model.pth')
-        
-        if os.path.exists(model_path):
-            checkpoint = torch.load(model_path, map_location=self.device)
-            self.class_names = checkpoint['class_names']
-            
-            self.model = models.efficientnet_b0()
-            in_features = self.model.classifier[1].in_features
-            self.model.classifier = nn.Sequential(
-                nn.Dropout(0.3),
-                nn.Linear(in_features, 512),
-                nn.ReLU(),
-                nn.BatchNorm1d(512),
-                nn.Dropout(0.2),
-                nn.Linear(512, len(self.class_names))
-            )
-            
-            self.model.load_state_dict(checkpoint['model_state_dict'])
-            self.model.to(self.device)
-            self.model.eval()
-            
-            self.transform = transforms.Compose([
-                transforms.Resize((224, 224)),
-                transforms.ToTensor(),
-                transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])
-            ])
-            
-            print(f"Model loaded: {checkpoint['val_acc']:.2f}% accuracy")
-            self._initialized = True
-        else:
-            print(f"Warning: Model file not found at {model_path}")
-            self._initialized = False
-    
-    def predict(self, image_data):
-        if not self._initialized:
-            return {'error': 'Model not loaded', 'status': 'error'}
-            
-        try:
-            if ',' in image_data:
-                image_data = image_data.split(',')[1]
-            
-            image = Image.open(io.BytesIO(base64.b64decode(image_data))).convert('RGB')
-            
-            inputs = self.transform(image).unsqueeze(0)
-            inputs = inputs.to(self.device)
-            
-            with torch.no_grad():
-                outputs = self.model(inputs)
-                probabilities = torch.nn.functional.softmax(outputs, dim=1)
-                confidence, predicted_idx = torch.max(probabilities, 1)
-            
-            predicted_class = self.class_names[predicted_idx.item()]
-            confidence_score = confidence.item()
-            
-            all_probs = probabilities[0].cpu().numpy()
-            predictions = [
-                {'disease': self.class_names[i], 'confidence': float(all_probs[i])}
-                for i in range(len(self.class_names))
-            ]
-            predictions.sort(key=lambda x: x['confidence'], reverse=True)
-            
-            return {
-                'predicted_class': predicted_class,
-                'confidence': confidence_score,
-                'all_predictions': predictions,
-                'status': 'success'
-            }
-            
-        except Exception as e:
-            return {'error': str(e), 'status': 'error'}
+# The model (and torch) is loaded by the first analyze request, so a cold start
+# that only serves login, register, results or health never imports it.
+_analyzer = None
+_analyzer_lock = threading.Lock()
+
 
-# Initialize analyzer (singleton pattern for serverless)
-analyzer = BloodSmearAnalyzer()
+def get_analyzer():
+    """Shared BloodSmearAnalyzer, or None when the model file is not deployed"""
+    global _analyzer
+    if _analyzer is None:
+        with _analyzer_lock:
+            if _analyzer is None:
+                model_path = os.environ.get('MODEL_PATH', 'models/best_model.pth')
+                # Relative to this file, as the analyzer resolves it, not to the cwd
+                model_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), model_path)
+                if not os.path.exists(model_path):
+                    print(f"Warning: Model file not found at {model_path}")
+                    return None
+                from analyzer import BloodSmearAnalyzer
+                _analyzer = BloodSmearAnalyzer(model_path)
+    return _analyzer
 
 @app.route('/api/register', methods=['POST'])
 def register():
@@ -195,6 +124,9 @@ def analyze_image():
         if not image_data:
             return jsonify({'error': 'No image data provided'}), 400
         
+        analyzer = get_analyzer()
+        if analyzer is None:
+            return jsonify({'error': 'Model not loaded'}), 500
         result = analyzer.predict(image_data)
         
         if result['status'] == 'error':
@@ -228,9 +160,7 @@ def get_results():
             {'_id': 0}
         ).sort('created_at', -1).limit(100))
         
-        for analysis in analyses:
-            analysis['created_at'] = analysis['created_at'].isoformat()
-        
+        # created_at is written as ISO 8601 by the JSON provider
         return jsonify({
             'analyses': analyses
         })
@@ -271,8 +201,8 @@ def health_check():
     try:
         return jsonify({
             'status': 'healthy',
-            'model_loaded': analyzer._initialized,
-            'device': str(analyzer.device) if analyzer._initialized else 'N/A'
+            'model_loaded': _analyzer is not None,
+            'device': str(_analyzer.device) if _analyzer is not None else 'N/A'
         })
     except Exception as e:
         return jsonify({
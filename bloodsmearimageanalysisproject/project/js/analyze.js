@@ -155,7 +155,12 @@ async function analyzeImage() {
                 throw new Error('Invalid response from server: missing predicted_class');
             }
             showResults(data.result);
+        } else if (response.status === 429) {
+            // Admission control: server busy or too many analyses in flight for this user
+            const retryAfter = response.headers.get('Retry-After');
+            throw new Error((data.error || 'Server busy') + (retryAfter ? ` (retry in ${retryAfter}s)` : ''));
         } else {
+            // 422 from the quality gate carries a readable reason in `error`
             throw new Error(data.error || 'Analysis failed');
         }
     } catch (error) {
@@ -182,6 +187,7 @@ function showResults(result) {
                 <div class="confidence-fill" style="width: ${result.confidence * 100}%"></div>
             </div>
         </div>
+        ${result.quality_warning ? `<div class="quality-warning">⚠️ ${result.quality_warning}</div>` : ''}
     `;
 
     // Show all predictions
@@ -25,7 +25,7 @@ const authAPI = {
 };
 
 const analysisAPI = {
-    async analyzeImage(imageData, userId, notes = '') {
+    async analyzeImage(imageData, userId, notes = '', analysisType = 'upload') {
         const response = await fetch(`${API_BASE_URL}/analyze`, {
             method: 'POST',
             headers: {
@@ -34,7 +34,8 @@ const analysisAPI = {
             body: JSON.stringify({
                 image: imageData,
                 user_id: userId,
-                notes: notes
+                notes: notes,
+                analysis_type: analysisType
             })
         });
         return await response.json();
@@ -9,6 +9,12 @@ let sessionStartTime = null;
 let sessionDurationInterval = null;
 let captureCount = 0;
 let autoCaptureInterval = null;
+let analysisInFlight = false;
+let liveSocket = null;
+let pendingReply = null;
+let frameChain = Promise.resolve();
+let skippedCount = 0;
+let rejectedCount = 0;
 
 async function init() {
     currentUser = await checkAuth();
@@ -38,7 +44,13 @@ function setupEventListeners() {
 
     document.getElementById('startCameraBtn').addEventListener('click', startCamera);
     document.getElementById('stopCameraBtn').addEventListener('click', stopCamera);
-    document.getElementById('captureBtn').addEventListener('click', captureAndAnalyze);
+    document.getElementById('captureBtn').addEventListener('click', () => captureAndAnalyze(false));
+
+    document.getElementById('liveNotes').addEventListener('change', (e) => {
+        if (liveSocket) {
+            liveSocket.send(JSON.stringify({ type: 'notes', notes: e.target.value }));
+        }
+    });
 
     document.getElementById('autoCaptureToggle').addEventListener('change', (e) => {
         if (e.target.checked && sessionActive) {
@@ -94,6 +106,9 @@ async function startCamera() {
         sessionActive = true;
         sessionStartTime = Date.now();
         captureCount = 0;
+        skippedCount = 0;
+        rejectedCount = 0;
+        openLiveSocket();
 
         updateSessionStatus();
         startSessionTimer();
@@ -122,6 +137,7 @@ function stopCamera() {
     sessionActive = false;
     stopSessionTimer();
     stopAutoCapture();
+    closeLiveSocket();
 
     updateSessionStatus();
 }
@@ -146,13 +162,122 @@ function stopSessionTimer() {
     }
 }
 
+// Frame failed the server's quality gate (blurry, badly exposed, no stained cells): nothing stored
+function handleQualityRejected(reply, auto) {
+    rejectedCount++;
+    updateSessionStatus();
+    if (!auto) alert(reply.error);
+}
+
 function updateSessionStatus() {
     const statusEl = document.getElementById('sessionStatus');
-    statusEl.textContent = sessionActive ? 'Active' : 'Inactive';
+    const notes = [];
+    if (skippedCount) notes.push(`${skippedCount} unchanged skipped`);
+    if (rejectedCount) notes.push(`${rejectedCount} low quality`);
+    statusEl.textContent = sessionActive
+        ? (notes.length ? `Active (${notes.join(', ')})` : 'Active')
+        : 'Inactive';
     statusEl.style.color = sessionActive ? 'var(--success-600)' : 'var(--neutral-600)';
 }
 
-async function captureAndAnalyze() {
+// One WebSocket per session: binary JPEG frames in, one JSON reply per frame out.
+// Without it (older backends, no WebSocket support) captures fall back to POST /api/analyze.
+function openLiveSocket() {
+    const user = JSON.parse(localStorage.getItem('user'));
+    if (!user || !window.WebSocket) return;
+
+    const protocol = window.location.protocol === 'https:' ? 'wss' : 'ws';
+    const notes = document.getElementById('liveNotes').value;
+    const socket = new WebSocket(
+        `${protocol}://${window.location.host}/ws/live?user_id=${encodeURIComponent(user.user_id)}&notes=${encodeURIComponent(notes)}`
+    );
+
+    socket.onmessage = (e) => {
+        const message = JSON.parse(e.data);
+        if (message.type === 'session') {
+            liveSocket = socket;
+            return;
+        }
+        if (pendingReply) {
+            const resolve = pendingReply;
+            pendingReply = null;
+            resolve(message);
+        }
+    };
+
+    socket.onclose = () => {
+        if (liveSocket === socket) liveSocket = null;
+        if (pendingReply) {
+            pendingReply({ type: 'error', error: 'Live connection closed' });
+            pendingReply = null;
+        }
+    };
+}
+
+function closeLiveSocket() {
+    if (liveSocket) {
+        liveSocket.send(JSON.stringify({ type: 'end' }));
+        liveSocket.close();
+        liveSocket = null;
+    }
+}
+
+async function sendFrame(blob, manual) {
+    const jpeg = new Uint8Array(await blob.arrayBuffer());
+    const message = new Uint8Array(jpeg.length + 1);
+    message[0] = manual ? 1 : 0;
+    message.set(jpeg, 1);
+
+    // The server answers frames in order; a manual capture waits for any auto frame in flight
+    const reply = frameChain.then(() => new Promise((resolve) => {
+        if (!liveSocket) {
+            resolve({ type: 'error', error: 'Live connection closed' });
+            return;
+        }
+        pendingReply = resolve;
+        liveSocket.send(message);
+    }));
+    frameChain = reply;
+    return reply;
+}
+
+async function analyzeOverSocket(blob, auto, canvas) {
+    const reply = await sendFrame(blob, !auto);
+
+    if (reply.type === 'duplicate') {
+        // Stage hasn't moved since the last analysed frame; nothing new to show
+        skippedCount++;
+        updateSessionStatus();
+        return;
+    }
+    if (reply.type === 'dropped') return;
+    if (reply.type === 'quality_rejected') {
+        handleQualityRejected(reply, auto);
+        return;
+    }
+    if (reply.type === 'error') {
+        console.error('Live analysis error:', reply.error);
+        return;
+    }
+
+    const result = {
+        predicted_disease: reply.result.predicted_class,
+        confidence_score: reply.result.confidence * 100
+    };
+
+    captureCount++;
+    document.getElementById('captureCount').textContent = captureCount;
+
+    const imageData = canvas.toDataURL('image/jpeg', 0.8);
+    displayLatestResult(result, imageData);
+    addCaptureToGrid(result, imageData);
+}
+
+async function captureAndAnalyze(auto = false) {
+    // Auto captures are low priority: skip a tick rather than stack frames behind a slow analysis
+    if (auto && analysisInFlight) return;
+    analysisInFlight = true;
+
     const video = document.getElementById('cameraVideo');
     const canvas = document.getElementById('captureCanvas');
     const modal = document.getElementById('analyzeModal');
@@ -176,6 +301,13 @@ async function captureAndAnalyze() {
                 throw new Error('User not authenticated');
             }
 
+            if (liveSocket) {
+                await analyzeOverSocket(blob, auto, canvas);
+                analysisInFlight = false;
+                modal.classList.add('hidden');
+                return;
+            }
+
             const reader = new FileReader();
             reader.readAsDataURL(blob);
             reader.onload = async () => {
@@ -183,7 +315,23 @@ async function captureAndAnalyze() {
 
                 try {
                     const notes = document.getElementById('liveNotes').value;
-                    const result = await analysisAPI.analyzeImage(base64Image, user.user_id, notes);
+                    const result = await analysisAPI.analyzeImage(
+                        base64Image, user.user_id, notes, auto ? 'live_auto' : 'live_manual'
+                    );
+
+                    if (result.status === 'quality_rejected') {
+                        handleQualityRejected(result, auto);
+                        analysisInFlight = false;
+                        modal.classList.add('hidden');
+                        return;
+                    }
+
+                    if (auto && result.reason) {
+                        // Dropped by the server's admission control; the next tick sends a fresh frame
+                        analysisInFlight = false;
+                        modal.classList.add('hidden');
+                        return;
+                    }
 
                     if (result.error) {
                         throw new Error(result.error);
@@ -210,15 +358,17 @@ async function captureAndAnalyze() {
                     addCaptureToGrid(demoResult, canvas.toDataURL());
                 }
 
+                analysisInFlight = false;
                 modal.classList.add('hidden');
             };
 
         } catch (error) {
             console.error('Error:', error);
+            analysisInFlight = false;
             modal.classList.add('hidden');
             alert('Failed to capture and analyze image');
         }
-    }, 'image/jpeg', 0.95);
+    }, 'image/jpeg', liveSocket ? 0.85 : 0.95);
 }
 
 function displayLatestResult(result, imageData) {
@@ -259,7 +409,7 @@ function addCaptureToGrid(result, imageData) {
 function startAutoCapture() {
     autoCaptureInterval = setInterval(() => {
         if (sessionActive) {
-            captureAndAnalyze();
+            captureAndAnalyze(true);
         }
     }, 5000);
 }
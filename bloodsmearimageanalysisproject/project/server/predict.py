@@ -1,14 +1,19 @@
 import sys
+import os
 import json
 import torch
 import base64
 from io import BytesIO
 from PIL import Image
 import torchvision.transforms as transforms
-from torchvision import models
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'backend')
+sys.path.insert(0, BACKEND_DIR)
+from model_builder import load_model as load_model_file
 
 # Model configuration
-MODEL_PATH = '../backend/models/best_model.pth'
+# A serving artifact from export_model.py (.safetensors) loads faster than the training checkpoint
+MODEL_PATH = os.environ.get('MODEL_PATH') or os.path.join(BACKEND_DIR, 'models', 'best_model.pth')
 DEVICE = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
 
 # Class names will be loaded from checkpoint
@@ -22,23 +27,12 @@ transform = transforms.Compose([
 ])
 
 def load_model():
-    """Load the EfficientNet-B0 PyTorch model"""
+    """Load the checkpoint, building whichever architecture it was trained with"""
     global CLASS_NAMES
     try:
-        # Load checkpoint with weights_only=False to handle older PyTorch versions
-        checkpoint = torch.load(MODEL_PATH, map_location=DEVICE, weights_only=False)
+        model, checkpoint = load_model_file(MODEL_PATH, DEVICE)
         CLASS_NAMES = checkpoint['class_names']
         
-        # Create EfficientNet-B0 model
-        model = models.efficientnet_b0()
-        num_ftrs = model.classifier[1].in_features
-        model.classifier[1] = torch.nn.Linear(num_ftrs, len(CLASS_NAMES))
-        
-        # Load trained weights
-        model.load_state_dict(checkpoint['model_state_dict'])
-        model = model.to(DEVICE)
-        model.eval()
-        
         return model
     except Exception as e:
         print(json.dumps({'error': f'Failed to load model: {str(e)}'}))